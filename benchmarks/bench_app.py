@@ -0,0 +1,477 @@
+"""
+Benchmarks for fishing_core on synthetic spot tables, with local stand-ins for
+Supabase, OpenWeather and ThaiWater (each request sleeps a configurable latency).
+
+    python benchmarks/bench_app.py --sizes 1000,10000,100000 --output bench.json
+
+Every benchmark reports min/median/max seconds over --repeat runs plus its own
+size metrics; the output is one JSON document so runs of different versions
+can be diffed.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ชื่อสถานที่/ปลา/ข้อความจริงแบบที่ผู้ใช้กรอก (ใช้สุ่มสร้างตาราง spots)
+DAMS = ["ภูมิพล", "สิริกิติ์", "ศรีนครินทร์", "วชิราลงกรณ", "แก่งกระจาน", "ป่าสักชลสิทธิ์", "อุบลรัตน์",
+        "ลำตะคอง", "รัชชประภา", "แม่งัด", "บางลาง", "ขุนด่านปราการชล", "ลำปาว", "น้ำอูน", "แควน้อย"]
+WATERS = ["บึงบอระเพ็ด", "หนองหาร", "แม่น้ำเจ้าพระยา", "แม่น้ำท่าจีน", "แม่น้ำแม่กลอง", "แม่น้ำบางปะกง",
+          "แม่น้ำมูล", "แม่น้ำชี", "แม่น้ำปิง", "แม่น้ำน่าน", "คลองรังสิต", "บ่อตกปลาบางพระ"]
+SPOT_PREFIXES = ["เขื่อน", "อ่างเก็บน้ำ"]
+FISH = ["ปลาช่อน", "ปลากะพง", "ปลานิล", "ปลาชะโด", "ปลาบึก", "ปลาสวาย", "ปลาตะเพียน", "ปลากราย", "ปลาหมอ",
+        "ปลาดุก", "ปลาสลิด", "ปลากด", "ปลาเทโพ", "ปลาแรด", "ปลาบู่", "ปลายี่สก", "ปลากระสูบ", "ปลานิลแดง",
+        "snakehead", "tilapia"]
+DESCRIPTION_PHRASES = [
+    "ตีเหยื่อปลอมช่วงเช้ามืด ได้ตัวใหญ่หลายตัว", "น้ำขึ้นสูงกว่าปกติ ควรระวังตลิ่งทรุด",
+    "ที่จอดรถกว้าง มีร้านค้าชาวบ้านอยู่ใกล้ๆ", "ใช้เหยื่อกุ้งฝอยกับไส้เดือนได้ผลดี",
+    "ช่วงบ่ายลมแรง ตีไกลลำบาก", "ต้องเช่าเรือชาวบ้านออกไปกลางอ่าง ราคาไม่แพง",
+    "มีตอไม้ใต้น้ำเยอะ สายขาดบ่อย แนะนำสาย PE 30 ปอนด์ขึ้นไป", "ปลาเริ่มกินตอนน้ำนิ่ง หลังฝนตก",
+    "ห้ามตกช่วงฤดูวางไข่ (พ.ค.-ส.ค.)", "ทางเข้าเป็นลูกรัง หน้าฝนรถเก๋งเข้าไม่ได้",
+]
+IMAGE_BASE_URL = "https://bench.supabase.co/storage/v1/object/public/fishing_images/r/"
+THAILAND_BBOX = (5.6, 97.3, 20.4, 105.6)  # south, west, north, east
+
+BENCHMARKS = ("load_spots", "map", "dedup", "search", "stats", "images")
+
+
+def generate_spots(n, seed=0):
+    """
+    Synthetic spots table: spots cluster around named waters, fish_type is a
+    comma-joined species list, descriptions are long and about 60% have images.
+    """
+    rng = random.Random(seed)
+    south, west, north, east = THAILAND_BBOX
+    places = [f"{rng.choice(SPOT_PREFIXES)}{dam}" for dam in DAMS] + WATERS
+    centers = {place: (rng.uniform(south, north), rng.uniform(west, east)) for place in places}
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(1, n + 1):
+        place = rng.choice(places)
+        lat, lon = centers[place]
+        images = [f"{IMAGE_BASE_URL}{rng.getrandbits(128):032x}_800.jpg"
+                  for _ in range(rng.randint(1, 8))] if rng.random() < 0.6 else []
+        rows.append({
+            "id": i,
+            "name": f"{place} จุดที่ {i}",
+            "lat": round(lat + rng.gauss(0, 0.3), 6),
+            "lon": round(lon + rng.gauss(0, 0.3), 6),
+            "fish_type": ", ".join(rng.sample(FISH, rng.randint(1, 5))),
+            "description": " ".join(rng.choices(DESCRIPTION_PHRASES, k=rng.randint(2, 8))),
+            "image_url": ",".join(images),
+            "created_at": (start + timedelta(minutes=i)).isoformat(),
+        })
+    return pd.DataFrame(rows)
+
+
+# --- stand-ins ของบริการภายนอก ---
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """
+    The subset of the PostgREST query builder fishing_core uses, evaluated on a DataFrame.
+    """
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.op, self.payload, self.columns = "select", None, "*"
+        self.mask_filters, self.order_col, self.limit_n = [], None, None
+
+    def select(self, columns="*", **kwargs):
+        self.columns = columns
+        return self
+
+    def insert(self, row):
+        self.op, self.payload = "insert", row
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def _filter(self, col, test):
+        self.mask_filters.append(lambda df: test(df[col]))
+        return self
+
+    def eq(self, col, value):
+        return self._filter(col, lambda s: s == value)
+
+    def gt(self, col, value):
+        return self._filter(col, lambda s: s > value)
+
+    def gte(self, col, value):
+        return self._filter(col, lambda s: s >= value)
+
+    def lt(self, col, value):
+        return self._filter(col, lambda s: s < value)
+
+    def lte(self, col, value):
+        return self._filter(col, lambda s: s <= value)
+
+    def order(self, col, desc=False):
+        self.order_col = (col, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        df = self.db.tables[self.table]
+        if self.op == "insert":
+            row = {"id": int(df["id"].max()) + 1 if len(df) else 1, "created_at": datetime.now().isoformat(), **self.payload}
+            self.db.tables[self.table] = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+            return FakeResponse([row])
+        mask = np.ones(len(df), dtype=bool)
+        for test in self.mask_filters:
+            mask &= test(df).to_numpy()
+        if self.op == "update":
+            for col, value in self.payload.items():
+                df.loc[mask, col] = value
+            return FakeResponse(df[mask].to_dict("records"))
+        result = df[mask]
+        if self.columns != "*":
+            result = result[[c.strip() for c in self.columns.split(",")]]
+        if self.order_col:
+            result = result.sort_values(self.order_col[0], ascending=not self.order_col[1])
+        if self.limit_n is not None:
+            result = result.head(self.limit_n)
+        return FakeResponse(result.to_dict("records"))
+
+
+class FakeBucket:
+    def __init__(self, latency):
+        self.latency, self.objects = latency, {}
+
+    def exists(self, path):
+        time.sleep(self.latency)
+        return path in self.objects
+
+    def upload(self, path, data, file_options=None):
+        time.sleep(self.latency)
+        self.objects[path] = len(data)
+
+    def get_public_url(self, path):
+        return f"https://bench.supabase.co/storage/v1/object/public/fishing_images/{path}"
+
+
+class FakeRPC:
+    """
+    submit_catch_report evaluated on the DataFrame in one round trip, like the
+    Postgres function: same name, else nearest spot within p_radius_m, else a new spot.
+    """
+    def __init__(self, db, fn, params):
+        self.db, self.fn, self.params = db, fn, params
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        p, df = self.params, self.db.tables["spots"]
+        hits = np.flatnonzero((df["name"] == p["p_name"]).to_numpy())
+        distance = None
+        if not len(hits) and len(df):
+            lat1, lon1 = np.radians(p["p_lat"]), np.radians(p["p_lon"])
+            lat2, lon2 = np.radians(df["lat"].to_numpy(float)), np.radians(df["lon"].to_numpy(float))
+            a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+            meters = 6371000 * 2 * np.arcsin(np.sqrt(a))
+            nearest = int(np.argmin(meters))
+            if meters[nearest] <= p["p_radius_m"]:
+                hits, distance = [nearest], float(meters[nearest])
+        if len(hits):
+            i = df.index[hits[0]]
+            fish = {f.strip() for f in str(df.at[i, "fish_type"] or "").split(",") if f.strip()} | set(p["p_fish"])
+            images = [u.strip() for u in str(df.at[i, "image_url"] or "").split(",") if u.strip()]
+            df.at[i, "fish_type"] = ", ".join(sorted(fish))
+            df.at[i, "image_url"] = ",".join(dict.fromkeys(images + p["p_image_urls"]))
+            spot, merged = df.loc[i].to_dict(), True
+        else:
+            spot = {"id": int(df["id"].max()) + 1 if len(df) else 1, "created_at": datetime.now().isoformat(),
+                    "name": p["p_name"], "lat": p["p_lat"], "lon": p["p_lon"],
+                    "fish_type": ", ".join(p["p_fish"]), "description": p["p_description"] or "",
+                    "image_url": ",".join(p["p_image_urls"])}
+            self.db.tables["spots"] = pd.concat([df, pd.DataFrame([spot])], ignore_index=True)
+            merged = False
+        report = {"spot_id": spot["id"], "fish_type": p["p_fish"], "description": p["p_description"],
+                  "reported_at": datetime.now().isoformat()}
+        self.db.tables["catch_reports"] = pd.concat(
+            [self.db.tables.get("catch_reports"), pd.DataFrame([report])], ignore_index=True)
+        return FakeResponse({"spot": spot, "merged": merged, "distance_m": distance})
+
+
+class FakeSupabase:
+    def __init__(self, spots, latency):
+        self.tables, self.latency = {"spots": spots.copy()}, latency
+        bucket = FakeBucket(latency)
+        self.storage = type("FakeStorage", (), {"from_": staticmethod(lambda name: bucket)})()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, fn, params):
+        return FakeRPC(self, fn, params)
+
+
+def fake_upstream_client(latency, dam_names):
+    """
+    httpx client answering OpenWeather and ThaiWater URLs locally after `latency` seconds.
+    """
+    forecast = {"list": [{"dt": 1767225600 + i * 10800, "main": {"temp": 27 + i % 5},
+                          "weather": [{"description": "ฝนเล็กน้อย"}]} for i in range(40)]}
+    dams = {"data": {"dam": [{"dam_name": {"th": f"เขื่อน{name}"}, "dam_storage_percent": 55.5,
+                              "dam_inflow": 3.2, "dam_released": 4.1, "dam_date": "2026-01-01"}
+                             for name in dam_names]}}
+
+    def handler(request):
+        time.sleep(latency)
+        path = request.url.path
+        if path.endswith("/weather"):
+            return httpx.Response(200, json={"main": {"temp": 31.2}, "weather": [{"description": "เมฆเป็นบางส่วน"}]})
+        if path.endswith("/forecast"):
+            return httpx.Response(200, json=forecast)
+        return httpx.Response(200, json=dams)
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def import_core(args):
+    """
+    Import fishing_core with throwaway secrets (no persistent cache, no scheduler).
+    """
+    sys.path.insert(0, REPO_DIR)
+    from headless import import_fishing_core
+    return import_fishing_core({
+        "SUPABASE_URL": "https://bench.supabase.co", "SUPABASE_KEY": "bench", "SUPABASE_SERVICE_KEY": "",
+        "WEATHER_API_KEY": "bench", "CACHE_BACKEND": "none", "PREFETCH_SCHEDULER": False,
+    })
+
+
+def install_stand_ins(core, df, args):
+    fake_db = FakeSupabase(df, args.db_latency_ms / 1000)
+    fake_clients = {"db": fake_db, "storage": fake_db, "role": "service", "service": True,
+                    "error": None, "service_error": None, "healthy": True, "checked_at": time.time()}
+    core.get_supabase_clients = lambda: fake_clients
+    clients = {
+        "openweather": fake_upstream_client(args.weather_latency_ms / 1000, []),
+        "thaiwater": fake_upstream_client(args.water_latency_ms / 1000, DAMS),
+    }
+    core.get_http_client = lambda upstream, role=None: clients[upstream]
+    return fake_db
+
+
+def reset_caches(core):
+    for namespace in core.CACHE_NAMESPACES:
+        core.invalidate_cache(namespace)
+    core.get_search_index.clear()
+
+
+def measure(func, repeat, setup=None):
+    times, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "max": max(times)}, result
+
+
+# --- benchmarks: แต่ละตัวคืน list ของผลลัพธ์ (dict) ---
+def bench_load_spots(core, df, args):
+    seconds, (snapshot, _) = measure(lambda: core.sync_spots(force_full=True), args.repeat)
+    return [{"benchmark": "load_spots", "seconds": seconds, "rows_loaded": len(snapshot)}]
+
+
+def bench_map(core, df, args):
+    import folium
+    df, version = core.sync_spots()
+    species_index = core.build_species_index(version, df)
+    results = []
+    for lazy in (True, False):
+        mode = "lazy" if lazy else "eager"
+        warm_up = None if lazy else (lambda: core.invalidate_cache("weather"))
+        seconds, layer = measure(lambda: core.build_spot_layer(df, lazy, species_index), args.repeat, setup=warm_up)
+        result = {"benchmark": f"map_{mode}_build", "seconds": seconds}
+        if not lazy:
+            result["seconds_warm"], layer = measure(lambda: core.build_spot_layer(df, lazy, species_index), args.repeat)
+            weather, water = core.prefetch_conditions(df)
+            popups = [len(core.build_popup_html(row, *weather.get((row['lat'], row['lon']), core.WEATHER_PENDING),
+                                                water.get(row['name'], ""), species_index).encode())
+                      for _, row in df.iterrows()]
+            result.update(popup_bytes_total=sum(popups), popup_bytes_mean=sum(popups) / max(len(popups), 1),
+                          popup_bytes_max=max(popups, default=0))
+        results.append(result)
+
+        m = folium.Map(location=[13.75, 100.5], zoom_start=6)
+        layer.add_to(m)
+        render_seconds, html = measure(lambda: m.get_root().render(), 1)
+        results.append({"benchmark": f"map_{mode}_render", "seconds": render_seconds, "html_bytes": len(html.encode())})
+    return results
+
+
+def bench_dedup(core, df, args):
+    rng = random.Random(args.seed)
+    sample = df.sample(min(args.probes, len(df)), random_state=args.seed)
+    # ครึ่งหนึ่งอยู่ห่างจุดเดิม ~50 ม. (ต้องรวม) อีกครึ่งเป็นจุดสุ่มที่ไม่ซ้ำ
+    probes = [(f"จุดใหม่ {i}", lat + 0.0004, lon) for i, (lat, lon) in enumerate(zip(sample['lat'], sample['lon']))]
+    south, west, north, east = THAILAND_BBOX
+    probes += [(f"จุดสุ่ม {i}", rng.uniform(south, north), rng.uniform(west, east)) for i in range(len(probes))]
+
+    matched = 0
+    times = []
+    for name, lat, lon in probes:
+        start = time.perf_counter()
+        matched += core.find_existing_spot(name, lat, lon) is not None
+        times.append(time.perf_counter() - start)
+
+    saves = []
+    for name, lat, lon in probes[:args.probes // 5 or 1]:
+        start = time.perf_counter()
+        core.save_fishing_spot(name, "ปลาช่อน, ปลานิล", "ทดสอบ benchmark", [], lat, lon)
+        saves.append(time.perf_counter() - start)
+    return [
+        {"benchmark": "dedup_find_existing", "probes": len(probes), "matched": matched,
+         "seconds": {"mean": statistics.mean(times), "p95": float(np.percentile(times, 95)), "max": max(times)}},
+        {"benchmark": "dedup_save_fishing_spot", "saves": len(saves),
+         "seconds": {"mean": statistics.mean(saves), "max": max(saves)}},
+    ]
+
+
+def bench_search(core, df, args):
+    df, version = core.sync_spots()
+    index_seconds, species_index = measure(
+        lambda: core.build_species_index(version, df), args.repeat, setup=core.build_species_index.clear)
+    search_seconds, _ = measure(
+        lambda: core.refresh_search_index(df, version), args.repeat, setup=core.get_search_index.clear)
+
+    queries = [("", "ทั้งหมด", "ชื่อ (A-Z)"), ("ช่อน", "ทั้งหมด", "ความเกี่ยวข้อง"),
+               ("ภูมิพล", "ปลาช่อน", "ความเกี่ยวข้อง"), ("เหยื่อปลอม", "ทั้งหมด", "ชื่อ (Z-A)"),
+               ("", "ปลานิล", "วันที่เพิ่มล่าสุด"), ("แม่น้ำ จุดที่ 1", "ทั้งหมด", "ความเกี่ยวข้อง")]
+    results = [
+        {"benchmark": "search_species_index_build", "seconds": index_seconds},
+        {"benchmark": "search_text_index_build", "seconds": search_seconds},
+    ]
+    for term, fish, sort in queries:
+        seconds, filtered = measure(lambda: core.filter_spots(df, species_index, version, term, fish, sort), args.repeat)
+        results.append({"benchmark": "search_filter_sort", "query": term, "fish": fish, "sort": sort,
+                        "seconds": seconds, "matches": len(filtered)})
+    return results
+
+
+def bench_stats(core, df, args):
+    df, version = core.sync_spots()
+    species_index = core.build_species_index(version, df)
+    cold, _ = measure(lambda: core.compute_spot_stats(version, df, species_index), args.repeat,
+                      setup=core.compute_spot_stats.clear)
+    warm, _ = measure(lambda: core.compute_spot_stats(version, df, species_index), args.repeat)
+    return [{"benchmark": "stats", "seconds": cold, "seconds_warm": warm}]
+
+
+def synthetic_photo(seed, size=(4000, 3000)):
+    """
+    A 12 MP JPEG with gradients and noise, roughly the size of a phone photo.
+    """
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    w, h = size
+    gradient = np.linspace(0, 255, w, dtype=np.float32)[None, :, None] * np.ones((h, 1, 3), dtype=np.float32)
+    pixels = np.clip(gradient * 0.6 + rng.normal(80, 40, (h, w, 3)), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    buf.name = f"photo_{seed}.jpg"
+    return buf
+
+
+def bench_images(core, df, args):
+    photos = [synthetic_photo(args.seed + i) for i in range(args.images)]
+
+    def rewind():
+        for photo in photos:
+            photo.seek(0)
+    prepare, renditions = measure(lambda: core.prepare_image(photos[0]), args.repeat, setup=rewind)
+    pipeline, results = measure(lambda: core.upload_images(photos), 1, setup=rewind)
+    return [
+        {"benchmark": "images_prepare", "seconds": prepare, "input_bytes": len(photos[0].getvalue()),
+         "rendition_bytes": {str(size): len(data) for size, data in renditions.items()}},
+        {"benchmark": "images_upload_pipeline", "files": len(photos), "seconds": pipeline,
+         "failed": sum(error is not None for _, error in results)},
+    ]
+
+
+BENCHMARK_FUNCS = {
+    "load_spots": bench_load_spots, "map": bench_map, "dedup": bench_dedup,
+    "search": bench_search, "stats": bench_stats, "images": bench_images,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help=f"subset of {','.join(BENCHMARKS)}")
+    parser.add_argument("--map-max-rows", type=int, default=10000, help="skip the map benchmark above this size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--probes", type=int, default=50, help="dedup lookups per size")
+    parser.add_argument("--images", type=int, default=4, help="photos in the upload pipeline benchmark")
+    parser.add_argument("--db-latency-ms", type=float, default=20)
+    parser.add_argument("--weather-latency-ms", type=float, default=80)
+    parser.add_argument("--water-latency-ms", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    core = import_core(args)
+    selected = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    for size in [int(s) for s in args.sizes.split(",")]:
+        df = generate_spots(size, args.seed)
+        for name in selected:
+            if name == "map" and size > args.map_max_rows:
+                continue
+            install_stand_ins(core, df, args)
+            reset_caches(core)
+            core.sync_spots(force_full=True)
+            for result in BENCHMARK_FUNCS[name](core, df, args):
+                report["results"].append({"rows": size, **result})
+                seconds = result["seconds"].get("median", result["seconds"].get("mean"))
+                print(f"{size:>7} rows  {result['benchmark']:<28} {seconds * 1000:10.1f} ms", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,270 +2,29 @@ import streamlit as st
 import folium
 from streamlit_folium import st_folium
 import pandas as pd
-import requests
 from datetime import datetime
 from streamlit_js_eval import streamlit_js_eval
-from supabase import create_client, Client
-from PIL import Image
-import io
-import re
-import traceback
-import os
 import math
-import time
-import httpx
-
-def run_with_retry(operation, description="Database operation", max_retries=3, delay=1):
-    """
-    Utility function to retry database operations on transient failures.
-    """
-    for i in range(max_retries):
-        try:
-            return operation().execute()
-        except (httpx.RemoteProtocolError, httpx.ConnectError, httpx.ReadTimeout) as e:
-            if i == max_retries - 1:
-                st.error(f"❌ {description} ล้มเหลวหลังจากพยายาม {max_retries} ครั้ง: {str(e)}")
-                raise e
-            time.sleep(delay * (i + 1)) # Exponential-ish backoff
-        except Exception as e:
-            # For other errors, we might still want to retry if it's a connection issue disguised
-            if "disconnect" in str(e).lower() or "timeout" in str(e).lower():
-                if i == max_retries - 1: raise e
-                time.sleep(delay * (i + 1))
-            else:
-                raise e
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees) in meters.
-    """
-    # Convert decimal degrees to radians 
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-
-    # Haversine formula 
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a)) 
-    r = 6371000 # Radius of earth in meters
-    return c * r
-
-SUPABASE_URL = st.secrets["SUPABASE_URL"]
-SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
-SUPABASE_SERVICE_KEY = st.secrets["SUPABASE_SERVICE_KEY"]
-WEATHER_API_KEY = st.secrets["WEATHER_API_KEY"]
-
-try:
-    # เริ่มต้น Supabase Clients
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    supabase_storage = supabase
-    supabase_db = supabase  # เริ่มต้นด้วย anon key เสมอ
-    storage_configured = False
-    db_configured = False
-
-    if SUPABASE_SERVICE_KEY:
-        try:
-            supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-            supabase_storage = supabase_admin 
-            supabase_db = supabase_admin
-            storage_configured = True
-            db_configured = True
-        except Exception as e:
-            st.error(f"⚠️ ไม่สามารถเชื่อมต่อด้วย Service Key ได้ (จะใช้ Anon Key แทน): {str(e)}")
-except Exception as e:
-    st.error(f"เชื่อมต่อ Supabase ไม่สำเร็จ: {str(e)}")
-    supabase = None
-    supabase_storage = None
-    supabase_db = None
-    storage_configured = False
-    db_configured = False
-
-# --- 2. CACHED FUNCTIONS (หัวใจความเร็ว: ดึงข้อมูลแล้วจำไว้) ---
-@st.cache_data(ttl=3600)  # จำข้อมูลระดับน้ำ 1 ชั่วโมง
-def get_water_info(dam_name):
-    try:
-        if not dam_name:
-            return "ไม่มีข้อมูลอ่างเก็บน้ำ"
-        url = "https://api-v3.thaiwater.net/api/v1/thaiwater30/get_dam_daily"
-        res = requests.get(url, timeout=5).json()
-        if 'data' in res and 'dam' in res['data']:
-            for dam in res['data']['dam']:
-                if 'dam_name' in dam and 'th' in dam['dam_name'] and dam_name in dam['dam_name']['th']:
-                    storage = dam.get('dam_storage_percent', 'N/A')
-                    return f"น้ำ {storage}% ({dam['dam_name']['th']})"
-        return "ไม่มีข้อมูลอ่างเก็บน้ำ"
-    except: return "เชื่อมต่อข้อมูลน้ำไม่ได้"
-
-@st.cache_data(ttl=1800)  # จำพยากรณ์อากาศ 30 นาที
-def get_full_weather(lat, lon):
-    try:
-        # 1. อากาศตอนนี้
-        now_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=th"
-        c = requests.get(now_url, timeout=5).json()
-        if 'main' in c and 'weather' in c and len(c['weather']) > 0:
-            now_txt = f"{c['main']['temp']}°C, {c['weather'][0]['description']}"
-        else:
-            now_txt = "ไม่มีข้อมูล"
-        
-        # 2. พยากรณ์ล่วงหน้า (ดึงราย 3 ชม. มาคัดเอาวันละจุด)
-        fore_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=th"
-        f = requests.get(fore_url, timeout=5).json()
-        fore_list = []
-        # คัดเอาข้อมูลทุกๆ 24 ชม. (index 8, 16, 24)
-        if 'list' in f and len(f['list']) > 0:
-            for i in [8, 16, 24]:
-                if i < len(f['list']):
-                    day = f['list'][i]
-                    if 'dt' in day and 'main' in day and 'weather' in day and len(day['weather']) > 0:
-                        dt = datetime.fromtimestamp(day['dt']).strftime('%d/%m')
-                        fore_list.append(f"• {dt}: {day['main']['temp']:.0f}°C, {day['weather'][0]['description']}")
-        
-        fore_html = "<br>".join(fore_list) if fore_list else "ไม่มีข้อมูลล่วงหน้า"
-        return now_txt, fore_html
-    except: return "ไม่มีข้อมูล", "ไม่มีข้อมูลล่วงหน้า"
-
-@st.cache_data(ttl=600)
-def load_spots():
-    try:
-        # ใช้ supabase_db (ซึ่งอาจจะถูก override เป็น admin client แล้ว)
-        res = run_with_retry(lambda: supabase_db.table("spots").select("*"), "ดึงข้อมูลจุดตกปลา")
-        return pd.DataFrame(res.data)
-    except Exception as e:
-        st.error(f"ไม่สามารถโหลดข้อมูลได้: {str(e)}")
-        return pd.DataFrame(columns=['name', 'lat', 'lon', 'fish_type', 'image_url', 'description'])
-
-# --- ฟังก์ชันจัดการข้อมูล (หัวใจหลัก) ---
-def save_fishing_spot(name, fish_type, description, images_urls, lat, lon):
-    if supabase_db is None:
-        st.error("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
-        return False
-
-    try:
-        # 1. ค้นหาจุดที่มีอยู่ทั้งหมด
-        res = run_with_retry(lambda: supabase_db.table("spots").select("*"), "ค้นหาจุดเดิม")
-        df_existing = pd.DataFrame(res.data)
-    
-        match = None
-        if not df_existing.empty:
-            # เช็คชื่อตรงกัน หรือ พิกัดใกล้เคียงกัน (ระยะทางน้อยกว่า 100 เมตร)
-            # เราจะวนลูปเช็คระยะทาง หรือใช้ logic ที่มีประสิทธิภาพกว่าถ้าข้อมูลเยอะ
-            # สำหรับตอนนี้ วนลูปเช็คระยะทางใน DataFrame
-            
-            # กรองตามชื่อก่อนเพื่อความเร็ว
-            name_match = df_existing[df_existing['name'] == name]
-            if not name_match.empty:
-                match = name_match
-            else:
-                # ถ้าชื่อไม่ตรง เช็คพิกัดใกล้เคียง (100 เมตร)
-                def check_distance(row):
-                    return haversine_distance(lat, lon, row['lat'], row['lon'])
-                
-                df_existing['distance'] = df_existing.apply(check_distance, axis=1)
-                proximity_match = df_existing[df_existing['distance'] <= 100].copy() # รัศมี 100 เมตร
-                if not proximity_match.empty:
-                    match = proximity_match.sort_values('distance')
-
-        if match is not None and not match.empty:
-            # --- กรณีมีจุดเดิมหรือจุดใกล้เคียงอยู่แล้ว: ให้ "รวม" ข้อมูล ---
-            target_row = match.iloc[0]
-            
-            old_fish = str(target_row.get('fish_type', ''))
-            old_images = str(target_row.get('image_url', ''))
-            old_desc = str(target_row.get('description', ''))
-
-            # 1. รวมชื่อปลา (เอาที่ซ้ำออก)
-            new_fish_list = [f.strip() for f in (old_fish + "," + fish_type).split(",") if f.strip()]
-            updated_fish = ", ".join(sorted(list(set(new_fish_list))))
-            
-            # 2. รวมรูปภาพ (เอาที่ซ้ำออก)
-            new_img_str = ",".join(images_urls)
-            old_img_list = [u.strip() for u in old_images.split(",") if u.strip()]
-            new_img_list = [u.strip() for u in new_img_str.split(",") if u.strip()]
-            updated_images = ",".join(list(dict.fromkeys(old_img_list + new_img_list)))
-
-            # 3. รวมรายละเอียด (ถ้ามีข้อมูลใหม่ ให้ต่อท้าย)
-            updated_desc = old_desc
-            if description and description.strip() and description.strip() not in old_desc:
-                timestamp = datetime.now().strftime('%d/%m/%Y %H:%M')
-                separator = "\n" + "-"*20 + "\n" if old_desc else ""
-                updated_desc = f"{old_desc}{separator}[{timestamp}] {description.strip()}"
-
-            # อัปเดตข้อมูล
-            update_data = {
-                "fish_type": updated_fish,
-                "image_url": updated_images,
-                "description": updated_desc
-            }
-            
-            # ใช้ช่วงพิกัด (Epsilon) แทนการใช้ค่าเท่ากันเป๊ะๆ เพื่อเลี่ยงปัญหาทศนิยมคลาดเคลื่อน
-            epsilon = 0.00001
-            res_update = run_with_retry(
-                lambda: supabase_db.table("spots").update(update_data)\
-                    .eq("name", target_row['name'])\
-                    .gte("lat", target_row['lat'] - epsilon)\
-                    .lte("lat", target_row['lat'] + epsilon)\
-                    .gte("lon", target_row['lon'] - epsilon)\
-                    .lte("lon", target_row['lon'] + epsilon),
-                "อัปเดตข้อมูลจุดเดิม"
-            )
-                
-            if res_update.data:
-                dist_info = f" (ห่าง {target_row['distance']:.1f} ม.)" if 'distance' in target_row else ""
-                st.success(f"อัปเดตข้อมูลในจุดเดิม: {target_row['name']}{dist_info} เรียบร้อย! (มีข้อมูลในระบบแล้ว)")
-                # แสดงผลข้อมูลที่อัปเดตเพื่อตรวจสอบ
-                with st.expander("ดูข้อมูลที่บันทึกสำเร็จ"):
-                    st.write(res_update.data[0])
-                return True
-            else:
-                st.warning("⚠️ พบจุดเดิมในแอปแต่ไม่สามารถระบุแถวในฐานข้อมูลเพื่ออัปเดตได้ (พิกัดในเครื่องกับใน DB อาจไม่ตรงกันในระดับทศนิยม)")
-                return False
-
-        else:
-            # --- กรณีเป็นจุดใหม่: ให้ "เพิ่ม" แถวใหม่ ---
-            res_insert = run_with_retry(
-                lambda: supabase_db.table("spots").insert({
-                    "name": name, "lat": lat, "lon": lon, 
-                    "fish_type": fish_type, "description": description, "image_url": ",".join(images_urls)
-                }),
-                "บันทึกจุดใหม่"
-            )
-            
-            if res_insert.data:
-                st.success("บันทึกจุดตกปลาใหม่เรียบร้อย!")
-                with st.expander("ดูข้อมูลที่บันทึกใหม่"):
-                    st.write(res_insert.data[0])
-                return True
-            else:
-                # ในบางกรณี insert อาจสำเร็จแต่ไม่คืนค่าข้อมูล (เช่น RLS หรือ configuration)
-                # เราจะให้ True ไว้ก่อนถ้าไม่มี Exception
-                st.info("ส่งข้อมูลไปที่เซิร์ฟเวอร์แล้ว (รอการตรวจสอบข้อมูลในอาทิตย์ถัดไปหากยังไม่ปรากฏ)")
-                return True
-    except Exception as e:
-        st.error(f"Database Error: {str(e)}")
-        st.code(traceback.format_exc())
-        return False
-
-# --- ฟังก์ชันนับสถิติปลา ---
-def get_spot_fish_stats(fish_string):
-    if not fish_string:
-        return "ยังไม่มีข้อมูลปลา"
-    
-    # แยกรายชื่อปลาและนับจำนวน
-    fish_list = [f.strip() for f in str(fish_string).split(",") if f.strip()]
-    if not fish_list:
-        return "ยังไม่มีข้อมูลปลา"
-    
-    # นับความถี่
-    from collections import Counter
-    counts = Counter(fish_list)
-    
-    # สร้างข้อความแสดงสถิติแบบบรรทัด
-    stat_text = "<br>".join([f"• {fish}: {count} ครั้ง" for fish, count in counts.items()])
-    return stat_text
+import traceback
+# ส่วนที่ไม่ใช่หน้าจอ (ฐานข้อมูล, cache, API ภายนอก, ดัชนี) อยู่ใน fishing_core.py
+# เพื่อให้สคริปต์อื่น (benchmark, นำเข้าข้อมูล) import ไปใช้ได้โดยไม่ต้องรันหน้าเว็บ
+from fishing_core import (
+    CACHE_NAMESPACES, EXPORT_FORMATS, EXPORT_MAX_MB, PERF_PANEL, PREFETCH_SCHEDULER,
+    SPOT_COLUMNS, VIEWPORT_AGGREGATE_BELOW_ZOOM, VIEWPORT_MAX_SPOTS, WEATHER_PENDING,
+    get_supabase_clients,
+    load_spots, load_spots_in_bounds, snap_bounds, map_bounds, load_spot_counts,
+    save_fishing_spot, recent_catch_reports, upload_images, rendition_url, spot_images,
+    get_full_weather, get_water_info, invalidate_weather, prefetch_conditions, start_prefetch_scheduler,
+    build_species_index, spot_fish_stats, compute_spot_stats, filter_spots, nearest_spots,
+    build_spot_layer, build_aggregate_layer, find_clicked_spot, export_spots,
+    get_cache_stats, invalidate_cache, cache_function_stats,
+    get_perf_metrics, perf_start_run, perf_section, timed_function, perf_prometheus, perf_events_jsonl,
+)
 
 # --- 3. SESSION STATE ---
 st.set_page_config(page_title="Thai Fishing Pro", layout="wide")
+perf_run_state = perf_start_run()
+perf_section("gps")
 
 if 'v_lat' not in st.session_state: st.session_state.v_lat = 13.7563
 if 'v_lon' not in st.session_state: st.session_state.v_lon = 100.5018
@@ -277,6 +36,7 @@ gps_raw = streamlit_js_eval(
 )
 
 # --- 4. SIDEBAR ---
+perf_section("sidebar")
 st.sidebar.title("🎣 Fishing Pro")
 
 # แสดงตำแหน่งปัจจุบัน
@@ -301,8 +61,34 @@ with st.sidebar.expander("📍 ป้อนพิกัดเอง"):
         st.success(f"ตั้งค่าพิกัด: {manual_lat:.4f}, {manual_lon:.4f}")
         st.rerun()
 
-all_data = load_spots()
+perf_section("load_spots")
+# client ของ Supabase สร้างครั้งเดียวต่อ process (ตรวจ/ต่อใหม่เองเมื่อเชื่อมต่อไม่ได้)
+supabase_clients = get_supabase_clients()
+if supabase_clients["error"]:
+    st.error(f"เชื่อมต่อ Supabase ไม่สำเร็จ: {supabase_clients['error']}")
+elif supabase_clients["service_error"]:
+    st.error(f"⚠️ ไม่สามารถเชื่อมต่อด้วย Service Key ได้ (จะใช้ Anon Key แทน): {supabase_clients['service_error']}")
+
+if PREFETCH_SCHEDULER and supabase_clients["db"] is not None:
+    start_prefetch_scheduler()
+
+# โหมดโหลดรายละเอียดเมื่อคลิก: หมุดมีแค่ชื่อ/พิกัด ข้อมูลอากาศ น้ำ และรูปดึงเฉพาะจุดที่ถูกคลิก
+LAZY_POPUPS_DEFAULT = bool(st.secrets.get("LAZY_POPUPS", False))
+# โหมดกรอบแผนที่: ดึงเฉพาะจุดที่อยู่ในกรอบที่มองเห็น (เหมาะกับข้อมูลหลายพันจุด)
+VIEWPORT_MODE_DEFAULT = bool(st.secrets.get("VIEWPORT_MODE", False))
+
+# ในโหมดกรอบแผนที่ไม่โหลดทั้งตารางทุก rerun: ส่วนที่ต้องใช้ทั้งตาราง (ใกล้ฉัน, รายการ, ค้นหา, สถิติ)
+# โหลดเมื่อผู้ใช้เปิด "โหลดจุดทั้งหมด" เท่านั้น (อ่านค่า toggle จาก session state เพราะ widget อยู่ด้านล่าง)
+viewport_mode = st.session_state.get("viewport_mode", VIEWPORT_MODE_DEFAULT)
+table_loaded = not viewport_mode or st.session_state.get("load_all_spots", False)
+if table_loaded:
+    # ข้อมูลกับเวอร์ชันอ่านมาพร้อมกัน: ดัชนี/สถิติที่ cache ตามเวอร์ชันจะตรงกับข้อมูลชุดนี้เสมอ
+    all_data, data_version = load_spots()
+    species_index = build_species_index(data_version, all_data)
+else:
+    all_data, data_version, species_index = pd.DataFrame(columns=SPOT_COLUMNS), None, None
 
+perf_section("add_spot_form")
 with st.sidebar.form("add_spot_form", clear_on_submit=True):
     st.subheader("➕ เพิ่มข้อมูลการตกปลา")
     
@@ -327,11 +113,11 @@ with st.sidebar.form("add_spot_form", clear_on_submit=True):
                 
                 urls = []
                 if files:
-                    # ตรวจสอบว่า supabase_storage พร้อมใช้งานหรือไม่
-                    if 'supabase_storage' not in globals() or supabase_storage is None:
+                    # ตรวจสอบว่า Supabase Storage พร้อมใช้งานหรือไม่
+                    if supabase_clients["storage"] is None:
                         st.error("ไม่สามารถเชื่อมต่อ Supabase Storage ได้")
                         st.warning("จะบันทึกข้อมูลโดยไม่มีรูปภาพ")
-                    elif not storage_configured:
+                    elif not supabase_clients["service"]:
                         st.warning("⚠️ ยังไม่ได้ตั้งค่า SUPABASE_SERVICE_KEY - การอัปโหลดรูปภาพอาจล้มเหลว")
                     
                     # ตรวจสอบจำนวนไฟล์
@@ -339,57 +125,29 @@ with st.sidebar.form("add_spot_form", clear_on_submit=True):
                     progress_bar = st.progress(0)
                     status_text = st.empty()
 
-                    
-                    for idx, f in enumerate(files):
-                        try:
-                            status_text.text(f"กำลังอัปโหลดรูป {idx + 1}/{total_files}: {f.name}")
-                                
-                            # ตรวจสอบขนาดไฟล์ (จำกัดที่ 10MB)
-                            if f.size > 10 * 1024 * 1024:
-                                st.warning(f"ไฟล์ {f.name} ใหญ่เกินไป (มากกว่า 10MB) จะถูกย่อขนาดอัตโนมัติ")
-                                
-                            # อ่านและประมวลผลรูปภาพ
-                            img = Image.open(f).convert("RGB")
-                            img.thumbnail((800, 800), Image.Resampling.LANCZOS)
-                                
-                            # สร้าง buffer และบันทึกรูป
-                            buf = io.BytesIO()
-                            img.save(buf, format='JPEG', quality=85)
-                            buf.seek(0)  # Reset buffer position
-                                
-                            # สร้างชื่อไฟล์ที่ปลอดภัย
-                            safe_name = re.sub(r'[^a-zA-Z0-9._-]', '_', f.name)
-                            timestamp = datetime.now().strftime('%Y%m%d%H%M%S_%f')
-                            fname = f"{timestamp}_{safe_name}"
-                                
-                            # อัปโหลดไปยัง Supabase Storage (ใช้ supabase_storage ที่มีสิทธิ์ bypass RLS)
-                            upload_result = supabase_storage.storage.from_("fishing_images").upload(
-                                fname, 
-                                buf.getvalue(),
-                                file_options={"content-type": "image/jpeg", "upsert": "true"}
-                            )
-                                
-                            # ดึง public URL
-                            public_url = supabase_storage.storage.from_("fishing_images").get_public_url(fname)
-                            # แปลง http เป็น https
-                            if public_url.startswith("http://"):
-                                public_url = public_url.replace("http://", "https://")
-                                
+                    # ตรวจสอบขนาดไฟล์ (จำกัดที่ 10MB)
+                    for f in files:
+                        if f.size > 10 * 1024 * 1024:
+                            st.warning(f"ไฟล์ {f.name} ใหญ่เกินไป (มากกว่า 10MB) จะถูกย่อขนาดอัตโนมัติ")
+
+                    # ย่อ/เข้ารหัส/อัปโหลดหลายไฟล์พร้อมกัน แล้วอัปเดต progress ทีละไฟล์ที่เสร็จ
+                    def show_progress(done, total, fname):
+                        status_text.text(f"อัปโหลดรูปเสร็จ {done}/{total}: {fname}")
+                        progress_bar.progress(done / total)
+
+                    for f, (public_url, error) in zip(files, upload_images(files, on_progress=show_progress)):
+                        if public_url:
                             urls.append(public_url)
-                                
-                            # อัปเดต progress
-                            progress_bar.progress((idx + 1) / total_files)
-                                
-                        except Exception as e:
-                            error_msg = str(e)
-                            # ตรวจสอบว่าเป็น RLS error หรือไม่
-                            if "row-level security policy" in error_msg.lower() or "unauthorized" in error_msg.lower():
-                                st.error(f"❌ ไม่สามารถอัปโหลดรูป {f.name} เนื่องจาก Row Level Security (RLS)")
-                                
-                            else:
-                                st.error(f"ไม่สามารถอัปโหลดรูป {f.name}: {error_msg}")
-                            with st.expander(f"รายละเอียดข้อผิดพลาด - {f.name}"):
-                                st.code(traceback.format_exc())
+                            continue
+                        error_msg, error_trace = error
+                        # ตรวจสอบว่าเป็น RLS error หรือไม่
+                        if "row-level security policy" in error_msg.lower() or "unauthorized" in error_msg.lower():
+                            st.error(f"❌ ไม่สามารถอัปโหลดรูป {f.name} เนื่องจาก Row Level Security (RLS)")
+                            
+                        else:
+                            st.error(f"ไม่สามารถอัปโหลดรูป {f.name}: {error_msg}")
+                        with st.expander(f"รายละเอียดข้อผิดพลาด - {f.name}"):
+                            st.code(error_trace)
 
                     # ลบ progress bar และ status text
                     progress_bar.empty()
@@ -411,15 +169,64 @@ with st.sidebar.form("add_spot_form", clear_on_submit=True):
                     with st.expander("รายละเอียดข้อผิดพลาด"):
                         st.code(traceback.format_exc())
         
+        # save_fishing_spot แจ้งแถวที่เขียนให้ snapshot เอง ไม่ต้องล้าง cache ทั้งหมด
         if save_fishing_spot(name, fish, description, urls, use_lat, use_lon):
-            st.cache_data.clear()
             st.rerun()
 
 # --- 5. STABLE MAP DISPLAY ---
+perf_section("map")
 st.subheader("🗺️ แผนที่พิกัดตกปลา")
 
+def render_spot_detail(row, species_index=None):
+    """
+    Detail panel for one clicked spot: weather, water and images are fetched only here.
+    """
+    with st.container(border=True):
+        st.markdown(f"#### 🎣 {row.get('name', 'ไม่มีชื่อ')}")
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            st.write(f"**🐟 ปลา:** {row.get('fish_type', 'ไม่ระบุ')}")
+            st.markdown(f"**📊 สถิติการเจอปลาที่นี่:**<br><small>{spot_fish_stats(row['fish_type'], species_index)}</small>", unsafe_allow_html=True)
+            st.write(f"**รายละเอียด:** {row.get('description', 'ไม่มีรายละเอียด')}")
+            # รายงานใหม่ไม่ต่อท้ายรายละเอียดของจุดแล้ว แสดงรายงานล่าสุดแยกไว้ตรงนี้
+            if pd.notna(row.get('id')):
+                try:
+                    reports = recent_catch_reports(int(row['id']))
+                except Exception:
+                    reports = []
+                if reports:
+                    st.markdown("**📝 รายงานล่าสุด:**")
+                    for report in reports:
+                        when = str(report.get('reported_at') or '')[:16].replace('T', ' ')
+                        fish = ", ".join(report.get('fish_type') or []) or "ไม่ระบุ"
+                        note = f" — {report['description']}" if report.get('description') else ""
+                        st.caption(f"{when} · {fish}{note}")
+        with col2:
+            weather_now, weather_fore = get_full_weather(row['lat'], row['lon'])
+            st.write(f"**🌡️ ตอนนี้:** {weather_now}")
+            st.write(f"**💧 น้ำ:** {get_water_info(row.get('name', ''))}")
+            st.markdown(f"<small><b>📅 พยากรณ์ 3 วัน:</b><br>{weather_fore}</small>", unsafe_allow_html=True)
+            st.link_button("🚀 นำทาง", f"https://www.google.com/maps/dir/?api=1&destination={row['lat']},{row['lon']}", use_container_width=True)
+            st.button("🔄 อัปเดตอากาศ", key="refresh_spot_weather", on_click=invalidate_weather, args=(row['lat'], row['lon']), use_container_width=True)
+        images = spot_images(row)
+        if images:
+            cols = st.columns(min(len(images), 3))
+            for j, img_url in enumerate(images[:3]):
+                with cols[j % 3]:
+                    st.image(rendition_url(img_url, 400), use_container_width=True)
+
 @st.fragment
-def render_fishing_map(df):
+@timed_function("fragment", "map")
+def render_fishing_map(df, species_index):
+    col_lazy, col_viewport = st.columns(2)
+    with col_lazy:
+        lazy = st.toggle("⚡ โหลดรายละเอียดเมื่อคลิกหมุด", value=LAZY_POPUPS_DEFAULT, key="lazy_popups")
+    with col_viewport:
+        viewport = st.toggle("🔲 โหลดเฉพาะจุดในกรอบแผนที่", value=VIEWPORT_MODE_DEFAULT, key="viewport_mode")
+    if viewport != viewport_mode:
+        # df ที่ส่งเข้ามาและส่วนอื่นของหน้าขึ้นกับโหมดนี้ (โหลดทั้งตารางหรือไม่) จึง rerun ทั้งหน้า
+        st.rerun()
+
     m = folium.Map(location=[st.session_state.v_lat, st.session_state.v_lon], zoom_start=12)
 
     # หมุดคุณ - ใช้ GPS ถ้ามี ไม่เช่นนั้นใช้ตำแหน่งจาก session state
@@ -431,110 +238,146 @@ def render_fishing_map(df):
         tooltip="ตำแหน่งของคุณ"
     ).add_to(m)
 
-    for _, row in df.iterrows():
-
-        spot_stats = get_spot_fish_stats(row['fish_type'])
-
-        # ดึงข้อมูลที่ Cache ไว้ (เร็วและไม่ทำให้แผนที่กระพริบ)
-        weather_now, weather_fore = get_full_weather(row['lat'], row['lon'])
-        water_lv = get_water_info(row['name'])
-        
-        # จัดการรูปภาพ (เลื่อนนิ้ว)
-        images = []
-        if "image_url" in row and row["image_url"]:
-            try:
-                images = [u.strip() for u in str(row["image_url"]).split(",") if u.strip()]
-            except:
-                images = []
-        img_html = ""
-        if images:
-            img_html = '<div style="display: flex; overflow-x: auto; gap: 5px; width: 220px; background:#f0f0f0; border-radius:8px; padding:5px;">'
-            for u in images:
-                img_html += f'<img src="{u}" style="height: 120px; border-radius: 5px; flex-shrink: 0;">'
-            img_html += '</div>'
-
-        name = row.get('name', 'ไม่มีชื่อ')
-        fish_type = row.get('fish_type', 'ไม่ระบุ')
-        description = row.get('description', 'ไม่มีรายละเอียด')
-        
-        popup_html = f"""
-        <div style='width: 220px; font-family: sans-serif;'>
-            {img_html}
-            <h4 style='margin: 8px 0 2px 0; color: #1a73e8;'>{name}</h4>
-            <b>🐟 ปลา:</b> {fish_type}<br>
-            <div style='background: #e8f0fe; padding: 8px; border-radius: 5px; margin-top: 5px;'>
-                <b>📊 สถิติการเจอปลาที่นี่:</b><br>
-                <small>{spot_stats}</small>
-            </div>
-            <b>รายละเอียด:</b> {description}<br>
-            <b>🌡️ ตอนนี้:</b> {weather_now}<br>
-            <b>💧 น้ำ:</b> {water_lv}
-            <hr style='margin: 5px 0;'>
-            <small><b>📅 พยากรณ์ 3 วัน:</b><br>{weather_fore}</small>
-            <a href="https://www.google.com/maps/dir/?api=1&destination={row['lat']},{row['lon']}" target="_blank">
-                <button style='width:100%; background:#4285F4; color:white; border:none; padding:10px; border-radius:5px; margin-top:10px; cursor:pointer; font-weight:bold;'>🚀 นำทาง</button>
-            </a>
-        </div>
-        """
-        folium.Marker(
-            [row['lat'], row['lon']],
-            popup=folium.Popup(popup_html, max_width=250),
-            icon=folium.Icon(color='green', icon='fish', prefix='fa')
-        ).add_to(m)
-
-    #returned_objects=[] เพื่อความนิ่งสูงสุด
-    st_folium(m, width="100%", height=550, key="stable_fishing_map", returned_objects=[])
-
-render_fishing_map(all_data)
-st.button("🔄 โหลดข้อมูลใหม่ (Clear Cache)", on_click=st.cache_data.clear)
+    returned_objects = ["last_object_clicked"] if lazy else []
+    if viewport:
+        # ค่าล่าสุดที่แผนที่ส่งกลับ (อยู่ใน session state ตาม key) ใช้กำหนดกรอบก่อนวาดหมุด
+        # ครั้งแรกยังไม่มีค่า ใช้กรอบรอบตำแหน่งปัจจุบัน
+        last_state = st.session_state.get("stable_fishing_map") or {}
+        bounds = map_bounds(last_state.get("bounds")) or (
+            st.session_state.v_lat - 0.25, st.session_state.v_lon - 0.25,
+            st.session_state.v_lat + 0.25, st.session_state.v_lon + 0.25,
+        )
+        zoom = last_state.get("zoom") or 12
+        if zoom < VIEWPORT_AGGREGATE_BELOW_ZOOM:
+            # นับทุกจุดในกรอบ (ไม่ติดเพดาน VIEWPORT_MAX_SPOTS) ไม่มีหมุดรายจุดให้คลิก
+            layer = build_aggregate_layer(load_spot_counts(*snap_bounds(*bounds), int(zoom)))
+            df = pd.DataFrame(columns=SPOT_COLUMNS)
+        else:
+            df = load_spots_in_bounds(*snap_bounds(*bounds))
+            # จุดในกรอบอาจไม่อยู่ในดัชนี (โหลดทั้งตารางไว้หรือไม่ก็ได้) ส่วนที่ไม่มีจะนับสถิติเอง
+            layer = build_spot_layer(df, lazy, species_index)
+            if len(df) >= VIEWPORT_MAX_SPOTS:
+                st.caption(f"แสดง {VIEWPORT_MAX_SPOTS} จุดแรกในกรอบนี้ ซูมเข้าเพื่อดูเพิ่ม")
+        returned_objects += ["bounds", "zoom"]
+        # หมุดอยู่ใน feature group แยก: เลื่อนแผนที่แล้วเปลี่ยนแค่หมุด ไม่ต้องวาดแผนที่ใหม่
+        map_state = st_folium(m, width="100%", height=550, key="stable_fishing_map",
+                              feature_group_to_add=layer, returned_objects=returned_objects)
+    else:
+        build_spot_layer(df, lazy, species_index).add_to(m)
+        # ไม่คืน bounds/zoom (เลื่อนแผนที่แล้วไม่ rerun) เพื่อความนิ่งสูงสุด
+        map_state = st_folium(m, width="100%", height=550, key="stable_fishing_map", returned_objects=returned_objects)
+
+    if lazy:
+        clicked = find_clicked_spot(df, (map_state or {}).get("last_object_clicked"))
+        if clicked is not None:
+            render_spot_detail(clicked, species_index)
+        else:
+            st.caption("👆 คลิกหมุดเพื่อดูอากาศ ระดับน้ำ และรูปภาพของจุดนั้น")
+
+render_fishing_map(all_data, species_index)
+# โหลดจุดตกปลาใหม่อย่างเดียว: ข้อมูลอากาศ/น้ำที่ cache ไว้ยังใช้ต่อได้ (ล้างแยกหมวดได้ใน "จัดการ Cache")
+st.button("🔄 โหลดจุดตกปลาใหม่", on_click=invalidate_cache, args=("spots",))
+if viewport_mode:
+    st.toggle("📋 โหลดจุดทั้งหมด (จุดใกล้ฉัน, รายการ, ค้นหา, สถิติ)", key="load_all_spots")
+
+with st.expander("🧹 จัดการ Cache"):
+    stats = get_cache_stats()
+    cache_cols = st.columns(len(CACHE_NAMESPACES))
+    for col, namespace in zip(cache_cols, CACHE_NAMESPACES):
+        with col:
+            hits, misses = stats[namespace]["hits"], stats[namespace]["misses"]
+            total = hits + misses
+            st.metric(namespace, f"{hits}/{total} hit" if total else "-", f"{hits / total:.0%}" if total else None, delta_color="off")
+            st.button(f"ล้าง {namespace}", key=f"clear_cache_{namespace}", on_click=invalidate_cache, args=(namespace,))
+    if PREFETCH_SCHEDULER and supabase_clients["db"] is not None:
+        scheduler = start_prefetch_scheduler()
+        if scheduler["last_run"]:
+            st.caption(f"🔁 อุ่นข้อมูลเบื้องหลังล่าสุด: {datetime.fromtimestamp(scheduler['last_run']).strftime('%H:%M:%S')} "
+                       f"({len(scheduler['refreshed_at'])} รายการ)")
+        if scheduler["last_error"]:
+            st.warning(f"การอุ่นข้อมูลเบื้องหลังผิดพลาด: {scheduler['last_error']}")
 
 # --- 5.5 DATA PREVIEW (DEBUG) ---
 with st.expander("🔍 ตรวจสอบข้อมูลดิบจากฐานข้อมูล (Debug)"):
-    if not all_data.empty:
+    if not table_loaded:
+        st.info("โหมดกรอบแผนที่: ยังไม่ได้โหลดทั้งตาราง")
+    elif not all_data.empty:
         st.write("ข้อมูลที่แอปดึงมาได้ในขณะนี้:")
         st.dataframe(all_data, use_container_width=True)
     else:
         st.info("ฐานข้อมูลว่างเปล่า (หรือแอปไม่มีสิทธิ์เข้าถึงข้อมูลด้วย RLS)")
 
+# แผงเวลาประมวลผล: จองที่ไว้ตรงนี้ แล้วเติมข้อมูลท้ายสคริปต์ (หลังทุกส่วนวัดเวลาเสร็จ)
+perf_panel = st.container() if PERF_PANEL else None
+
+# --- 5.6 NEARBY SPOTS ---
+perf_section("nearby")
+NEARBY_LIMIT = 50
+
+@st.fragment
+@timed_function("fragment", "nearby")
+def render_nearby_spots(df):
+    st.subheader("📍 จุดตกปลาใกล้ฉัน")
+    origin_lat = gps_raw['lat'] if gps_raw and 'lat' in gps_raw else st.session_state.v_lat
+    origin_lon = gps_raw['lon'] if gps_raw and 'lon' in gps_raw else st.session_state.v_lon
+    radius_km = st.slider("รัศมี (กม.)", min_value=1, max_value=300, value=25, key="nearby_radius")
+
+    near = nearest_spots(df, origin_lat, origin_lon, radius_m=radius_km * 1000, limit=NEARBY_LIMIT)
+    if near.empty:
+        st.info(f"ไม่พบจุดตกปลาในรัศมี {radius_km} กม.")
+        return
+    st.write(f"**{len(near)} จุดที่ใกล้ที่สุด** (จาก {origin_lat:.4f}, {origin_lon:.4f})")
+    st.dataframe(
+        near.assign(distance_km=(near['distance'] / 1000).round(2))[['name', 'fish_type', 'distance_km']],
+        column_config={"name": "ชื่อจุด", "fish_type": "ปลาที่พบ", "distance_km": "ระยะทาง (กม.)"},
+        hide_index=True, use_container_width=True
+    )
+
+if not all_data.empty:
+    render_nearby_spots(all_data)
+
 # --- 6. SPOT MANAGEMENT ---
+perf_section("spot_list")
 st.divider()
 st.subheader("📋 จัดการจุดตกปลา")
 
 # Filter and search
-col1, col2, col3 = st.columns(3)
-with col1:
-    search_term = st.text_input("🔍 ค้นหาจุดตกปลา", placeholder="ชื่อจุด, ปลา, หรือรายละเอียด")
-with col2:
-    fish_filter = st.selectbox("🐟 กรองตามปลา", ["ทั้งหมด"] + sorted(all_data['fish_type'].dropna().unique().tolist()) if not all_data.empty else ["ทั้งหมด"])
-with col3:
-    sort_option = st.selectbox("📊 เรียงตาม", ["ชื่อ (A-Z)", "ชื่อ (Z-A)", "วันที่เพิ่มล่าสุด"])
+search_term, fish_filter, filtered_data = "", "ทั้งหมด", all_data
+if table_loaded:
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        search_term = st.text_input("🔍 ค้นหาจุดตกปลา", placeholder="ชื่อจุด, ปลา, หรือรายละเอียด")
+    with col2:
+        fish_filter = st.selectbox("🐟 กรองตามปลา", ["ทั้งหมด"] + sorted(species_index["by_species"]))
+    with col3:
+        sort_options = ["ชื่อ (A-Z)", "ชื่อ (Z-A)", "วันที่เพิ่มล่าสุด"]
+        sort_option = st.selectbox("📊 เรียงตาม", (["ความเกี่ยวข้อง"] if search_term else []) + sort_options)
 
-# Filter data
-filtered_data = all_data.copy()
-if not all_data.empty:
-    if search_term:
-        mask = (
-            filtered_data['name'].str.contains(search_term, case=False, na=False) |
-            filtered_data['fish_type'].str.contains(search_term, case=False, na=False) |
-            filtered_data['description'].str.contains(search_term, case=False, na=False)
-        )
-        filtered_data = filtered_data[mask]
-    
-    if fish_filter != "ทั้งหมด":
-        filtered_data = filtered_data[filtered_data['fish_type'] == fish_filter]
-    
-    # Sort data
-    if sort_option == "ชื่อ (A-Z)":
-        filtered_data = filtered_data.sort_values('name')
-    elif sort_option == "ชื่อ (Z-A)":
-        filtered_data = filtered_data.sort_values('name', ascending=False)
-
-# Display filtered spots
-if not filtered_data.empty:
+    # Filter data
+    filtered_data = filter_spots(all_data, species_index, data_version, search_term, fish_filter, sort_option)
+
+# Display filtered spots (ทีละหน้า: ดึงอากาศ/น้ำเฉพาะจุดในหน้านี้ รูปภาพเฉพาะจุดที่กดดู)
+SPOT_PAGE_SIZES = [10, 20, 50]
+
+@st.fragment
+@timed_function("fragment", "spot_list")
+def render_spot_list(filtered_data):
     st.write(f"**พบ {len(filtered_data)} จุดตกปลา**")
-    
+
+    col_size, col_page = st.columns(2)
+    with col_size:
+        page_size = st.selectbox("จำนวนต่อหน้า", SPOT_PAGE_SIZES, key="spot_page_size")
+    total_pages = max(1, math.ceil(len(filtered_data) / page_size))
+    with col_page:
+        page = st.number_input(f"หน้า (จาก {total_pages})", min_value=1, max_value=total_pages, value=1, step=1, key="spot_page")
+    page = min(page, total_pages)
+    page_data = filtered_data.iloc[(page - 1) * page_size:page * page_size]
+
+    # อากาศ/น้ำของทั้งหน้าดึงพร้อมกันครั้งเดียว (ใช้ cache ร่วมกับแผนที่)
+    weather_by_coord, water_by_name = prefetch_conditions(page_data)
+
     # Display spots in expandable sections
-    for i, (idx, row) in enumerate(filtered_data.iterrows()):
+    for i, (idx, row) in enumerate(page_data.iterrows()):
         spot_id = row.get('id', idx) if 'id' in row else f"{row.get('lat', '')}_{row.get('lon', '')}_{row.get('name', '')}"
         with st.expander(f"🎣 {row.get('name', 'ไม่มีชื่อ')} - {row.get('fish_type', 'ไม่ระบุ')}"):
             col1, col2 = st.columns([2, 1])
@@ -544,20 +387,13 @@ if not filtered_data.empty:
                 st.write(f"**ปลาที่พบ:** {row.get('fish_type', 'ไม่ระบุ')}")
                 st.write(f"**รายละเอียด:** {row.get('description', 'ไม่มีรายละเอียด')}")
                 
-                # Display images if available
-                images = []
-                if "image_url" in row and row["image_url"]:
-                    try:
-                        images = [u.strip() for u in str(row["image_url"]).split(",") if u.strip()]
-                    except:
-                        images = []
-                
-                if images:
-                    st.write("**รูปภาพ:**")
+                # Display images if available (โหลดเมื่อผู้ใช้กดดูเท่านั้น)
+                images = spot_images(row)
+                if images and st.toggle(f"📷 แสดงรูปภาพ ({len(images)})", key=f"images_{spot_id}"):
                     cols = st.columns(min(len(images), 3))
                     for j, img_url in enumerate(images[:3]):
                         with cols[j % 3]:
-                            st.image(img_url, use_container_width=True)
+                            st.image(rendition_url(img_url, 400), use_container_width=True)
             
             with col2:
                 # Action buttons
@@ -567,101 +403,95 @@ if not filtered_data.empty:
                     st.rerun()
                 
                 # Weather info
-                try:
-                    weather_now, weather_fore = get_full_weather(row['lat'], row['lon'])
-                    st.write(f"**🌡️ อากาศ:** {weather_now}")
-                except:
-                    st.write("**🌡️ อากาศ:** ไม่มีข้อมูล")
+                weather_now, _ = weather_by_coord.get((row['lat'], row['lon']), WEATHER_PENDING)
+                st.write(f"**🌡️ อากาศ:** {weather_now}")
                 
                 # Water level info
-                water_info = get_water_info(row.get('name', ''))
+                water_info = water_by_name.get(row.get('name', ''), "ไม่มีข้อมูลอ่างเก็บน้ำ")
                 st.write(f"**💧 น้ำ:** {water_info}")
+
+if not table_loaded:
+    st.info("โหมดกรอบแผนที่: เปิด \"📋 โหลดจุดทั้งหมด\" ใต้แผนที่เพื่อดูรายการ ค้นหา และสถิติ")
+elif not filtered_data.empty:
+    render_spot_list(filtered_data)
 else:
     st.info("ไม่พบจุดตกปลาที่ตรงกับเงื่อนไขการค้นหา")
 
 # --- 7. STATISTICS ---
+perf_section("stats")
 st.divider()
 st.subheader("📊 สถิติ")
 
 if not all_data.empty:
+    spot_stats_all = compute_spot_stats(data_version, all_data, species_index)
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("🎣 จุดตกปลาทั้งหมด", len(all_data))
+        st.metric("🎣 จุดตกปลาทั้งหมด", spot_stats_all["total_spots"])
     
     with col2:
-        unique_fish = all_data['fish_type'].dropna().nunique()
-        st.metric("🐟 ชนิดปลา", unique_fish)
+        st.metric("🐟 ชนิดปลา", spot_stats_all["species"])
     
     with col3:
-        total_images = sum(
-            len(str(row.get('image_url', '')).split(',')) 
-            if row.get('image_url') else 0 
-            for _, row in all_data.iterrows()
-        )
-        st.metric("📷 รูปภาพทั้งหมด", total_images)
+        st.metric("📷 รูปภาพทั้งหมด", spot_stats_all["total_images"])
     
     with col4:
-        spots_with_images = sum(
-            1 for _, row in all_data.iterrows() 
-            if row.get('image_url') and str(row.get('image_url', '')).strip()
-        )
-        st.metric("📸 จุดที่มีรูปภาพ", spots_with_images)
+        st.metric("📸 จุดที่มีรูปภาพ", spot_stats_all["spots_with_images"])
     
     # Fish type distribution
-    if 'fish_type' in all_data.columns:
+    if not species_index["counts"].empty:
         st.write("**🐟 การกระจายชนิดปลา:**")
-        fish_counts = all_data['fish_type'].value_counts()
-        st.bar_chart(fish_counts)
+        st.bar_chart(species_index["counts"])
+    
+    # Regional breakdown
+    if not spot_stats_all["regions"].empty:
+        st.write("**🗾 จำนวนจุดตามภาค (โดยประมาณจากพิกัด):**")
+        st.bar_chart(spot_stats_all["regions"])
+        if not spot_stats_all["species_by_region"].empty:
+            st.write("**🐟 ปลายอดนิยม 10 ชนิด แยกตามภาค:**")
+            st.dataframe(spot_stats_all["species_by_region"], use_container_width=True)
     
     # Map coverage
-    if 'lat' in all_data.columns and 'lon' in all_data.columns:
+    if spot_stats_all["bbox"] is not None:
         st.write("**📍 พื้นที่ครอบคลุม:**")
-        try:
-            min_lat, max_lat = all_data['lat'].min(), all_data['lat'].max()
-            min_lon, max_lon = all_data['lon'].min(), all_data['lon'].max()
-            center_lat = (min_lat + max_lat) / 2
-            center_lon = (min_lon + max_lon) / 2
-            
-            st.write(f"**ศูนย์กลาง:** {center_lat:.4f}, {center_lon:.4f}")
-            st.write(f"**ช่วงละติจูด:** {min_lat:.4f} ถึง {max_lat:.4f}")
-            st.write(f"**ช่วงลองจิจูด:** {min_lon:.4f} ถึง {max_lon:.4f}")
-        except:
-            st.write("ไม่สามารถคำนวณพื้นที่ครอบคลุมได้")
+        min_lat, max_lat, min_lon, max_lon = spot_stats_all["bbox"]
+        center_lat = (min_lat + max_lat) / 2
+        center_lon = (min_lon + max_lon) / 2
+        
+        st.write(f"**ศูนย์กลาง:** {center_lat:.4f}, {center_lon:.4f}")
+        st.write(f"**ช่วงละติจูด:** {min_lat:.4f} ถึง {max_lat:.4f}")
+        st.write(f"**ช่วงลองจิจูด:** {min_lon:.4f} ถึง {max_lon:.4f}")
+    else:
+        st.write("ไม่สามารถคำนวณพื้นที่ครอบคลุมได้")
 
 # --- 8. EXPORT FUNCTIONALITY ---
+perf_section("export")
 st.divider()
 st.subheader("💾 ส่งออกข้อมูล")
 
 col1, col2 = st.columns(2)
 
 with col1:
-    if st.button("📥 ดาวน์โหลด CSV"):
-        if not all_data.empty:
-            csv = all_data.to_csv(index=False).encode('utf-8-sig')
-            st.download_button(
-                label="⬇️ ดาวน์โหลดไฟล์ CSV",
-                data=csv,
-                file_name=f"fishing_spots_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
-        else:
-            st.warning("ไม่มีข้อมูลให้ส่งออก")
-
+    export_format = st.selectbox("รูปแบบไฟล์", list(EXPORT_FORMATS), key="export_format")
 with col2:
-    if st.button("📥 ดาวน์โหลด JSON"):
-        if not all_data.empty:
-            json_data = all_data.to_json(orient='records', force_ascii=False, indent=2)
-            st.download_button(
-                label="⬇️ ดาวน์โหลดไฟล์ JSON",
-                data=json_data.encode('utf-8'),
-                file_name=f"fishing_spots_{datetime.now().strftime('%Y%m%d')}.json",
-                mime="application/json"
-            )
-        else:
-            st.warning("ไม่มีข้อมูลให้ส่งออก")
+    # ตัวกรองใช้ได้เมื่อโหลดรายการแล้ว (ในโหมดกรอบแผนที่ต้องเปิด "โหลดจุดทั้งหมด" ก่อน)
+    export_filtered = st.checkbox("ส่งออกเฉพาะจุดที่ตรงกับตัวกรองด้านบน", key="export_filtered", disabled=not table_loaded)
+
+# ส่ง id ของจุดที่แสดงในรายการ (ค้นหา/กรองปลาแบบเดียวกับด้านบน) ไม่กรองซ้ำด้วยเงื่อนไขอื่นที่เซิร์ฟเวอร์
+export_ids = filtered_data['id'].tolist() if export_filtered and table_loaded and 'id' in filtered_data.columns else None
+export_ext, export_mime = EXPORT_FORMATS[export_format]
+st.caption(f"ส่งออกผ่านหน้าเว็บได้ไม่เกิน {EXPORT_MAX_MB} MB ต่อไฟล์")
+
+# สร้างไฟล์ตอนกดปุ่มเท่านั้น (ไม่เข้ารหัสข้อมูลใหม่ทุกครั้งที่หน้าเว็บ rerun)
+st.download_button(
+    label=f"⬇️ ดาวน์โหลดไฟล์ {export_format}",
+    data=lambda: export_spots(export_format, export_ids),
+    file_name=f"fishing_spots_{datetime.now().strftime('%Y%m%d')}.{export_ext}",
+    mime=export_mime
+)
 
 # --- 9. FOOTER ---
+perf_section(None)
 st.divider()
 st.markdown("""
 <div style='text-align: center; color: #666; padding: 20px;'>
@@ -669,3 +499,51 @@ st.markdown("""
     <p>สร้างด้วย Streamlit, Folium, และ Supabase</p>
 </div>
 """, unsafe_allow_html=True)
+
+# --- 10. PERFORMANCE PANEL (DEBUG) ---
+def perf_summary(events):
+    """
+    Per (kind, name) count, total and slowest time of a list of timing events.
+    """
+    if not events:
+        return pd.DataFrame(columns=["kind", "name", "count", "total_ms", "max_ms", "errors"])
+    df = pd.DataFrame(events)
+    return (df.assign(errors=~df["ok"]).groupby(["kind", "name"], sort=False)
+              .agg(count=("ms", "size"), total_ms=("ms", "sum"), max_ms=("ms", "max"), errors=("errors", "sum"))
+              .reset_index().sort_values("total_ms", ascending=False))
+
+if perf_panel is not None:
+    with perf_panel.expander("⏱️ เวลาประมวลผลและอัตรา Cache (Debug)"):
+        run_events = list(perf_run_state["events"])
+        sections = [e for e in run_events if e["kind"] == "section"]
+        st.write(f"**รอบนี้ (rerun):** {sum(e['ms'] for e in sections):.0f} ms รวมทุกส่วน")
+        st.dataframe(perf_summary(run_events), use_container_width=True, hide_index=True)
+
+        st.write("**สะสมทั้ง process:**")
+        metrics = get_perf_metrics()
+        with metrics["lock"]:
+            totals = pd.DataFrame(
+                [{"kind": kind, "name": name, "count": agg["count"], "avg_ms": agg["total"] * 1000 / agg["count"],
+                  "max_ms": agg["max"] * 1000, "errors": agg["errors"]}
+                 for (kind, name), agg in metrics["timings"].items()]
+            )
+            recent_events = list(metrics["events"])
+        if not totals.empty:
+            st.dataframe(totals.sort_values("avg_ms", ascending=False).round(1), use_container_width=True, hide_index=True)
+
+        st.write("**Cache hit/miss ต่อฟังก์ชัน:**")
+        cache_rows = pd.DataFrame(
+            [{"function": function, **counts, "hit_rate": 100 * counts["hits"] / max(counts["hits"] + counts["misses"], 1)}
+             for function, counts in cache_function_stats().items()]
+        )
+        if not cache_rows.empty:
+            st.dataframe(cache_rows, column_config={"hit_rate": st.column_config.ProgressColumn("hit rate", format="%.0f%%", min_value=0, max_value=100)},
+                         use_container_width=True, hide_index=True)
+
+        col_prom, col_log = st.columns(2)
+        with col_prom:
+            st.download_button("⬇️ Prometheus metrics", data=perf_prometheus,
+                               file_name="fishing_app_metrics.prom", mime="text/plain")
+        with col_log:
+            st.download_button("⬇️ Structured log (JSONL)", data=lambda: perf_events_jsonl(recent_events),
+                               file_name="fishing_app_perf.jsonl", mime="application/x-ndjson")
@@ -0,0 +1,2116 @@
+import streamlit as st
+import folium
+from folium.plugins import MarkerCluster
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from supabase import create_client, ClientOptions
+from storage3.exceptions import StorageApiError
+import io
+import re
+import csv
+import json
+import tempfile
+import pickle
+import sqlite3
+import traceback
+import os
+import math
+import difflib
+import functools
+import hashlib
+import struct
+import uuid
+import logging
+import contextlib
+from collections import Counter, defaultdict, deque
+import time
+import random
+import threading
+import httpx
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from urllib.parse import urlparse
+
+def run_with_retry(operation, description="Database operation", max_retries=None, delay=None):
+    """
+    Utility function to retry database operations on transient failures.
+    Goes through the shared "supabase" upstream (backoff with jitter + circuit breaker).
+    """
+    try:
+        with timed("query", description):
+            return call_upstream(
+                "supabase", lambda: operation().execute(),
+                attempts=max_retries or RETRY_ATTEMPTS, base_delay=delay or RETRY_BASE_DELAY
+            )
+    except CircuitOpenError as e:
+        st.error(f"❌ {description} ล้มเหลว: {str(e)}")
+        raise
+    except Exception as e:
+        if is_transient_error(e):
+            st.error(f"❌ {description} ล้มเหลวหลังจากพยายาม {max_retries or RETRY_ATTEMPTS} ครั้ง: {str(e)}")
+            # การเชื่อมต่อเดิมอาจเสีย: ครั้งถัดไปตรวจและต่อใหม่
+            mark_supabase_unhealthy()
+        raise
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points 
+    on the earth (specified in decimal degrees) in meters.
+    """
+    # Convert decimal degrees to radians 
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+
+    # Haversine formula 
+    dlon = lon2 - lon1 
+    dlat = lat2 - lat1 
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a)) 
+    r = 6371000 # Radius of earth in meters
+    return c * r
+
+def haversine_distances(lat, lon, lats, lons):
+    """
+    Vectorized haversine: distances in meters from one point to arrays of points.
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lons, dtype=float))
+
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * np.arcsin(np.sqrt(a)) * 6371000
+
+def nearest_spots(df, lat, lon, radius_m=None, limit=None):
+    """
+    Spots sorted by distance from (lat, lon) with a 'distance' column in meters,
+    optionally filtered to radius_m and truncated to the nearest `limit`.
+    """
+    if df.empty:
+        return df.assign(distance=pd.Series(dtype=float))
+    distances = haversine_distances(lat, lon, df['lat'], df['lon'])
+    idx = np.flatnonzero(distances <= radius_m) if radius_m is not None else np.arange(len(distances))
+    if limit is not None and len(idx) > limit:
+        # เลือก k ตัวที่ใกล้สุดก่อน (O(n)) แล้วค่อยเรียงเฉพาะ k ตัวนั้น
+        idx = idx[np.argpartition(distances[idx], limit)[:limit]]
+    idx = idx[np.argsort(distances[idx], kind='stable')]
+    return df.iloc[idx].assign(distance=distances[idx])
+
+# --- วัดเวลา: แต่ละส่วนของหน้า + การเรียก API ภายนอก + cache hit/miss ต่อฟังก์ชัน ---
+PERF_PANEL = bool(st.secrets.get("PERF_PANEL", False))  # แสดงแผงเวลาประมวลผลใต้ส่วน Debug
+PERF_LOG = bool(st.secrets.get("PERF_LOG", False))  # เขียนทุกเหตุการณ์เป็น JSON หนึ่งบรรทัดลง logger "fishing_app.perf"
+PERF_RECENT_EVENTS = 1000
+perf_logger = logging.getLogger("fishing_app.perf")
+
+@st.cache_resource
+def get_perf_metrics():
+    """
+    Process-wide aggregates keyed by (kind, name) -> count/errors/total/max seconds,
+    plus a ring buffer of the most recent events.
+    """
+    return {"lock": threading.Lock(), "timings": {}, "events": deque(maxlen=PERF_RECENT_EVENTS)}
+
+# rerun ที่กำลังวัดอยู่ของ thread นี้ (โมดูลนี้ใช้ร่วมกันทุก session จึงเก็บแยกต่อ thread)
+_perf_local = threading.local()
+
+def perf_start_run():
+    """
+    Start collecting this rerun's events on the calling thread; returns the run dict.
+    """
+    _perf_local.run = {"events": deque(maxlen=PERF_RECENT_EVENTS), "section": None}
+    return _perf_local.run
+
+def bind_perf_run(func):
+    """
+    Wrap func so events it records from a worker thread count towards the caller's rerun.
+    """
+    run = getattr(_perf_local, "run", None)
+    @functools.wraps(func)
+    def bound(*args, **kwargs):
+        _perf_local.run = run
+        return func(*args, **kwargs)
+    return bound
+
+def record_timing(kind, name, seconds, ok=True):
+    event = {"ts": round(time.time(), 3), "kind": kind, "name": name, "ms": round(seconds * 1000, 2), "ok": ok}
+    metrics = get_perf_metrics()
+    with metrics["lock"]:
+        agg = metrics["timings"].setdefault((kind, name), {"count": 0, "errors": 0, "total": 0.0, "max": 0.0})
+        agg["count"] += 1
+        agg["errors"] += not ok
+        agg["total"] += seconds
+        agg["max"] = max(agg["max"], seconds)
+        metrics["events"].append(event)
+    run = getattr(_perf_local, "run", None)
+    if run is not None:
+        run["events"].append(event)
+    if PERF_LOG:
+        perf_logger.info(json.dumps(event, ensure_ascii=False))
+
+@contextlib.contextmanager
+def timed(kind, name):
+    """
+    Time the enclosed block; an exception marks the event as failed (st.rerun/st.stop do not).
+    """
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record_timing(kind, name, time.perf_counter() - start, ok)
+
+def timed_function(kind, name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(kind, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def perf_section(name):
+    """
+    Close the running page section (if any) and start timing `name`; None only closes it.
+    """
+    run = getattr(_perf_local, "run", None) or perf_start_run()
+    now = time.perf_counter()
+    if run["section"] is not None:
+        current, started = run["section"]
+        record_timing("section", current, now - started)
+    run["section"] = (name, now) if name else None
+
+def perf_prometheus():
+    """
+    Process-wide timings and per-function cache hits/misses in Prometheus text format.
+    """
+    metrics = get_perf_metrics()
+    with metrics["lock"]:
+        timings = {key: dict(agg) for key, agg in metrics["timings"].items()}
+    lines = [
+        "# HELP fishing_app_duration_seconds Time spent per page section and external call.",
+        "# TYPE fishing_app_duration_seconds summary",
+    ]
+    for (kind, name), agg in sorted(timings.items()):
+        labels = f'kind="{kind}",name="{name}"'
+        lines.append(f"fishing_app_duration_seconds_count{{{labels}}} {agg['count']}")
+        lines.append(f"fishing_app_duration_seconds_sum{{{labels}}} {agg['total']:.6f}")
+    lines += ["# HELP fishing_app_duration_seconds_max Slowest observation.", "# TYPE fishing_app_duration_seconds_max gauge"]
+    for (kind, name), agg in sorted(timings.items()):
+        lines.append(f'fishing_app_duration_seconds_max{{kind="{kind}",name="{name}"}} {agg["max"]:.6f}')
+    lines += ["# HELP fishing_app_errors_total Failed sections and external calls.", "# TYPE fishing_app_errors_total counter"]
+    for (kind, name), agg in sorted(timings.items()):
+        lines.append(f'fishing_app_errors_total{{kind="{kind}",name="{name}"}} {agg["errors"]}')
+    lines += ["# HELP fishing_app_cache_requests_total Cache lookups per cached function.", "# TYPE fishing_app_cache_requests_total counter"]
+    for function, counts in sorted(cache_function_stats().items()):
+        for result, label in (("hits", "hit"), ("misses", "miss")):
+            lines.append(f'fishing_app_cache_requests_total{{function="{function}",result="{label}"}} {counts[result]}')
+    return "\n".join(lines) + "\n"
+
+def perf_events_jsonl(events):
+    return "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+
+# --- เครือข่าย: connection pool ต่อ upstream + retry แบบ backoff/jitter + circuit breaker ---
+# max_connections จำกัดจำนวน request ที่ยิงพร้อมกันต่อ upstream ด้วย (กันโดน rate limit ตอนโหลดทั้งแผนที่)
+UPSTREAMS = {
+    "openweather": {"hosts": ("api.openweathermap.org",), "max_connections": 8, "timeout": 5},
+    "thaiwater": {"hosts": ("api-v3.thaiwater.net",), "max_connections": 2, "timeout": 5},
+    "supabase": {"hosts": (), "max_connections": 10, "timeout": 30},
+    # Supabase Storage ใช้ connection pool ของ supabase แต่มี circuit breaker แยก (storage ล่มไม่ต้องตัดฐานข้อมูลไปด้วย)
+    "storage": {"hosts": (), "max_connections": 10, "timeout": 30},
+}
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5  # วินาที: หน่วงสูงสุดรอบที่ n = min(RETRY_MAX_DELAY, base * 2^n) แบบสุ่ม (full jitter)
+RETRY_MAX_DELAY = 5
+BREAKER_FAILURES = 5  # ล้มเหลวติดกันเท่านี้ครั้ง ตัดวงจร
+BREAKER_COOLDOWN = 30  # วินาที: ระหว่างนี้เรียก upstream นั้นแล้ว error ทันที
+
+class CircuitOpenError(Exception):
+    pass
+
+@st.cache_resource  # ใช้ร่วมกันทุก session/ทุก rerun (ตัวแปรระดับโมดูลถูกสร้างใหม่ทุก rerun)
+def get_http_client(upstream, role=None):
+    """
+    Pooled keep-alive httpx.Client for one upstream (role separates clients that
+    must not share state, e.g. the anon and service-key Supabase clients).
+    """
+    config = UPSTREAMS[upstream]
+    return httpx.Client(
+        timeout=httpx.Timeout(config["timeout"], pool=30),
+        limits=httpx.Limits(max_connections=config["max_connections"], max_keepalive_connections=config["max_connections"]),
+        follow_redirects=True,
+    )
+
+@st.cache_resource
+def get_breakers():
+    return {name: {"failures": 0, "opened_at": None, "lock": threading.Lock()} for name in UPSTREAMS}
+
+def is_transient_error(e):
+    """
+    Connection problems, timeouts, 5xx and 429 are worth retrying; everything else is not.
+    """
+    if isinstance(e, httpx.TransportError):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    if isinstance(e, StorageApiError):
+        # storage3 ห่อ HTTP error ไว้ status อาจเป็น str
+        status = int(e.status) if str(e.status).isdigit() else 0
+        return status >= 500 or status == 429
+    return False
+
+# PostgREST/Postgres ไม่มีฟังก์ชัน/ตารางนี้ (ยังไม่ได้รัน migration ใน supabase/migrations)
+MISSING_OBJECT_CODES = ("PGRST202", "PGRST205", "42883", "42P01")
+
+def is_missing_object(e):
+    return getattr(e, "code", None) in MISSING_OBJECT_CODES
+
+def _breaker_check(upstream):
+    breaker = get_breakers()[upstream]
+    with breaker["lock"]:
+        opened_at = breaker["opened_at"]
+        if opened_at is not None and time.time() - opened_at < BREAKER_COOLDOWN:
+            raise CircuitOpenError(f"{upstream} ไม่ตอบสนอง (พักการเชื่อมต่อ {BREAKER_COOLDOWN} วินาที)")
+
+def _breaker_record(upstream, ok):
+    breaker = get_breakers()[upstream]
+    with breaker["lock"]:
+        if ok:
+            breaker["failures"], breaker["opened_at"] = 0, None
+        else:
+            breaker["failures"] += 1
+            # หลังพ้นช่วงพัก ถ้าครั้งทดลองยังล้มเหลว ก็ตัดวงจรต่อทันที
+            if breaker["failures"] >= BREAKER_FAILURES:
+                breaker["opened_at"] = time.time()
+
+def call_upstream(upstream, operation, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """
+    Run operation() against an upstream with exponential backoff + full jitter on
+    transient errors. Fails fast with CircuitOpenError while the upstream's breaker is open.
+    """
+    with timed("upstream", upstream):
+        return _call_with_retry(upstream, operation, attempts, base_delay)
+
+def _call_with_retry(upstream, operation, attempts, base_delay):
+    for attempt in range(attempts):
+        _breaker_check(upstream)
+        try:
+            result = operation()
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            _breaker_record(upstream, ok=False)
+            if attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, base_delay * 2 ** attempt)))
+        else:
+            _breaker_record(upstream, ok=True)
+            return result
+
+def upstream_for(url):
+    host = urlparse(url).hostname
+    return next((name for name, config in UPSTREAMS.items() if host in config["hosts"]), None)
+
+def http_get_json(url, attempts=2):
+    """
+    GET a JSON document through the pooled client and breaker of the URL's upstream.
+    """
+    upstream = upstream_for(url)
+    client = get_http_client(upstream)
+
+    def get():
+        response = client.get(url)
+        # 4xx (เช่น key ผิด) คืน JSON ของ error ตามปกติ ให้ผู้เรียกตัดสินใจเอง
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+        return response.json()
+    return call_upstream(upstream, get, attempts=attempts)
+
+SUPABASE_URL = st.secrets["SUPABASE_URL"]
+SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
+SUPABASE_SERVICE_KEY = st.secrets["SUPABASE_SERVICE_KEY"]
+WEATHER_API_KEY = st.secrets["WEATHER_API_KEY"]
+# ขนาดช่องตาราง (กม.) ที่ใช้ข้อมูลอากาศร่วมกัน: จุดในช่องเดียวกันเรียก OpenWeather ครั้งเดียว
+WEATHER_CELL_KM = float(st.secrets.get("WEATHER_CELL_KM", 5))
+
+SUPABASE_HEALTH_INTERVAL = 300  # วินาที: ตรวจว่ายังต่อ Supabase ได้ไม่บ่อยกว่านี้ (เฉพาะตอนมีคนเรียกใช้)
+SUPABASE_HEALTH_TIMEOUT = 3
+SUPABASE_RETIRED_POOL_GRACE = 300  # วินาที: ปิด connection pool เก่าหลังจากนี้ (เธรดเบื้องหลังที่ยังใช้อยู่ทำงานจบก่อน)
+
+def _supabase_clients_ok(clients):
+    """
+    Cache validator for get_supabase_clients: reuse the clients unless a call
+    gave up on a transient error or the periodic probe can't reach Supabase,
+    in which case the connection pools are dropped and the clients rebuilt.
+    """
+    if clients["db"] is None:
+        # ตั้งค่าไม่สำเร็จ: ลองใหม่หลังพ้นช่วงตรวจ (เช่นเน็ตเพิ่งกลับมา)
+        return time.time() - clients["checked_at"] < SUPABASE_HEALTH_INTERVAL
+    if clients["healthy"] and time.time() - clients["checked_at"] < SUPABASE_HEALTH_INTERVAL:
+        return True
+    clients["checked_at"] = time.time()
+    try:
+        # ตอบกลับด้วย status อะไรก็ได้แปลว่ายังต่อได้ (ไม่ได้ตรวจสิทธิ์)
+        get_http_client("supabase", clients["role"]).get(
+            f"{SUPABASE_URL}/rest/v1/", headers={"apikey": SUPABASE_KEY}, timeout=SUPABASE_HEALTH_TIMEOUT
+        )
+        clients["healthy"] = True
+        return True
+    except Exception:
+        # ไม่ปิด pool เดิมทันที: เธรด prefetch/อัปโหลดที่ถือ client เก่าอยู่จะ error "client has been closed"
+        # ถอดออกจาก cache ให้ client ชุดใหม่สร้าง pool ใหม่ แล้วค่อยปิดของเก่าเมื่อพ้นช่วงผ่อนผัน
+        for role in ("anon", "service"):
+            retired = get_http_client("supabase", role)
+            get_http_client.clear("supabase", role)
+            timer = threading.Timer(SUPABASE_RETIRED_POOL_GRACE, retired.close)
+            timer.daemon = True
+            timer.start()
+        return False
+
+@st.cache_resource(validate=_supabase_clients_ok)  # สร้างครั้งเดียวต่อ process ใช้ร่วมกันทุก session/ทุก rerun
+def get_supabase_clients():
+    """
+    Supabase clients shared by every rerun and session. "db" and "storage"
+    use the service key when it works, otherwise the anon key; setup errors
+    are returned (not raised) so the page can still render and show them.
+    """
+    clients = {"db": None, "storage": None, "role": "anon", "service": False,
+               "error": None, "service_error": None, "healthy": True, "checked_at": time.time()}
+    try:
+        # เริ่มต้น Supabase Clients (เริ่มต้นด้วย anon key เสมอ)
+        anon = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=get_http_client("supabase", "anon")))
+        clients["db"] = clients["storage"] = anon
+    except Exception as e:
+        clients["error"] = str(e)
+        return clients
+
+    if SUPABASE_SERVICE_KEY:
+        try:
+            admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY, options=ClientOptions(httpx_client=get_http_client("supabase", "service")))
+            clients.update(db=admin, storage=admin, role="service", service=True)
+        except Exception as e:
+            clients["service_error"] = str(e)
+    return clients
+
+def db_client():
+    """The Supabase client for table access (service key if configured), or None."""
+    return get_supabase_clients()["db"]
+
+def storage_client():
+    """The Supabase client for storage uploads (service key bypasses RLS), or None."""
+    return get_supabase_clients()["storage"]
+
+def mark_supabase_unhealthy():
+    """Make the next get_supabase_clients() probe Supabase and reconnect if needed."""
+    get_supabase_clients()["healthy"] = False
+
+# --- 2. CACHED FUNCTIONS (หัวใจความเร็ว: ดึงข้อมูลแล้วจำไว้) ---
+# cache ถาวรที่ใช้ร่วมกันหลาย process/หลังรีสตาร์ท (SQLite หรือ Redis)
+CACHE_BACKEND = str(st.secrets.get("CACHE_BACKEND", "sqlite")).lower()  # sqlite | redis | none
+CACHE_PATH = st.secrets.get("CACHE_PATH", os.path.join(".cache", "fishing_cache.sqlite"))
+CACHE_MAX_ENTRIES = int(st.secrets.get("CACHE_MAX_ENTRIES", 5000))
+REDIS_URL = st.secrets.get("REDIS_URL", "redis://localhost:6379/0")
+
+class SQLiteCache:
+    """
+    Pickled values in one SQLite file shared by every process on the host,
+    evicted least-recently-used beyond max_entries.
+    """
+    def __init__(self, path, max_entries):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB, stored_at REAL, accessed_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def get(self, key):
+        data, stored_at = self.get_raw(key)
+        return (None, None) if data is None else (pickle.loads(data), stored_at)
+
+    def get_raw(self, key):
+        # bytes ตามที่เก็บ (ไม่ unpickle) สำหรับข้อมูลที่ไม่ควรเชื่อ pickle จากที่เก็บร่วม
+        with self.lock:
+            row = self.conn.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return bytes(row[0]), row[1]
+
+    def peek(self, key, expire_in=None):
+        # อ่านเวลาที่เก็บอย่างเดียว ไม่แตะ accessed_at จะได้ไม่ทำให้ลำดับ LRU เพี้ยน
+        with self.lock:
+            row = self.conn.execute("SELECT stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value, expire_in=None):
+        self.set_raw(key, pickle.dumps(value), expire_in)
+
+    def set_raw(self, key, data, expire_in=None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, data, now, now))
+            self.conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+class RedisCache:
+    """
+    Same interface backed by Redis (or any Redis-compatible server); LRU eviction
+    is left to the server's maxmemory-policy, expiry to key TTLs.
+    """
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        data = self.client.get(key)
+        if data is None:
+            return None, None
+        return pickle.loads(data)
+
+    def peek(self, key, expire_in=None):
+        # PTTL ไม่แตะเวลาใช้งานล่าสุดของ key (GET จะแตะ) คำนวณเวลาที่เก็บย้อนจาก TTL ที่เหลือ
+        if not expire_in:
+            return None
+        remaining_ms = self.client.pttl(key)
+        if remaining_ms is None or remaining_ms < 0:
+            return None
+        return time.time() - (expire_in - remaining_ms / 1000)
+
+    def set(self, key, value, expire_in=None):
+        self.client.set(key, pickle.dumps((value, time.time())), ex=int(expire_in) if expire_in else None)
+
+    def get_raw(self, key):
+        # เวลาที่เก็บ 8 ไบต์ตามด้วยข้อมูล (ไม่ผ่าน pickle)
+        data = self.client.get(key)
+        if data is None or len(data) < 8:
+            return None, None
+        return data[8:], struct.unpack("!d", data[:8])[0]
+
+    def set_raw(self, key, data, expire_in=None):
+        self.client.set(key, struct.pack("!d", time.time()) + data, ex=int(expire_in) if expire_in else None)
+
+    def delete_prefix(self, prefix):
+        for key in self.client.scan_iter(match=f"{prefix}*"):
+            self.client.delete(key)
+
+@st.cache_resource
+def get_persistent_cache():
+    """
+    The configured shared cache backend, or None when disabled/unavailable.
+    """
+    try:
+        if CACHE_BACKEND == "redis":
+            return RedisCache(REDIS_URL)
+        if CACHE_BACKEND == "sqlite":
+            return SQLiteCache(CACHE_PATH, CACHE_MAX_ENTRIES)
+    except Exception as e:
+        st.warning(f"⚠️ ใช้ cache ถาวร ({CACHE_BACKEND}) ไม่ได้ จะใช้ cache ในหน่วยความจำอย่างเดียว: {str(e)}")
+    return None
+
+@st.cache_resource
+def get_refresh_state():
+    return {"lock": threading.Lock(), "in_flight": set()}
+
+def _refresh_in_background(key, func, args, kwargs, expire_in, on_refreshed):
+    state = get_refresh_state()
+    with state["lock"]:
+        if key in state["in_flight"]:
+            return
+        state["in_flight"].add(key)
+
+    def run():
+        try:
+            value = func(*args, **kwargs)
+            get_persistent_cache().set(key, value, expire_in)
+            on_refreshed()
+        except Exception:
+            pass
+        finally:
+            with state["lock"]:
+                state["in_flight"].discard(key)
+    threading.Thread(target=run, daemon=True).start()
+
+def persistent_call(key, func, args, kwargs, ttl, stale_ttl, on_refreshed):
+    """
+    Read-through shared cache with stale-while-revalidate: fresh entries
+    (younger than ttl) are returned as is; entries up to ttl + stale_ttl old
+    are returned immediately while a background thread recomputes them and
+    then calls on_refreshed(); anything older is recomputed inline.
+    """
+    backend = get_persistent_cache()
+    if backend is None:
+        return func(*args, **kwargs)
+    try:
+        value, stored_at = backend.get(key)
+    except Exception:
+        value, stored_at = None, None
+    if stored_at is not None:
+        age = time.time() - stored_at
+        if age < ttl:
+            return value
+        if age < ttl + stale_ttl:
+            _refresh_in_background(key, func, args, kwargs, ttl + stale_ttl, on_refreshed)
+            return value
+    value = func(*args, **kwargs)
+    try:
+        backend.set(key, value, ttl + stale_ttl)
+    except Exception:
+        pass
+    return value
+
+# cache แยกหมวด: ล้างเฉพาะหมวด/เฉพาะ key ที่เปลี่ยนได้ และนับ hit/miss ของแต่ละหมวด
+CACHE_NAMESPACES = ("spots", "weather", "water")
+_cache_clearers = {ns: [] for ns in CACHE_NAMESPACES}
+_cache_call = threading.local()
+
+@st.cache_resource
+def get_cache_stats():
+    return {"lock": threading.Lock(), "functions": {}, **{ns: {"hits": 0, "misses": 0} for ns in CACHE_NAMESPACES}}
+
+def count_cache(namespace, hit, function=None):
+    stats = get_cache_stats()
+    result = "hits" if hit else "misses"
+    with stats["lock"]:
+        stats[namespace][result] += 1
+        if function is not None:
+            stats["functions"].setdefault(function, {"hits": 0, "misses": 0})[result] += 1
+
+def cache_function_stats():
+    stats = get_cache_stats()
+    with stats["lock"]:
+        return {function: dict(counts) for function, counts in stats["functions"].items()}
+
+def cache_key(namespace, func, args, kwargs):
+    return f"{namespace}:{func.__qualname__}:{args!r}:{sorted(kwargs.items())!r}"
+
+def namespaced_cache(namespace, cache=st.cache_data, persist_ttl=None, stale_ttl=None, **cache_kwargs):
+    """
+    Like st.cache_data/st.cache_resource, but registers the function under a
+    cache namespace and counts hits/misses. The wrapper keeps .clear(*args)
+    for per-key invalidation. With persist_ttl, in-memory misses read through
+    the shared persistent cache (stale-while-revalidate for stale_ttl more
+    seconds, default persist_ttl).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            # ส่วนนี้ทำงานเฉพาะตอน miss เท่านั้น
+            _cache_call.missed = True
+            if persist_ttl is None:
+                return func(*args, **kwargs)
+            key = cache_key(namespace, func, args, kwargs)
+            return persistent_call(
+                key, func, args, kwargs, persist_ttl, stale_ttl if stale_ttl is not None else persist_ttl,
+                # ได้ค่าใหม่แล้ว ล้างค่าเก่าใน cache หน่วยความจำ เพื่อให้รอบถัดไปอ่านค่าใหม่
+                on_refreshed=lambda: cached_func.clear(*args, **kwargs)
+            )
+        cached_func = cache(**cache_kwargs)(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _cache_call.missed = False
+            try:
+                return cached_func(*args, **kwargs)
+            finally:
+                count_cache(namespace, hit=not _cache_call.missed, function=func.__name__)
+        def refresh(*args, **kwargs):
+            """Recompute now (into the persistent cache if enabled), then reload the in-memory entry."""
+            backend = get_persistent_cache() if persist_ttl is not None else None
+            if backend is not None:
+                backend.set(cache_key(namespace, func, args, kwargs), func(*args, **kwargs),
+                            persist_ttl + (stale_ttl if stale_ttl is not None else persist_ttl))
+            cached_func.clear(*args, **kwargs)
+            return wrapper(*args, **kwargs)
+
+        def age(*args, **kwargs):
+            """Seconds since the persistent entry was stored, or None if unknown. Does not count as a use for LRU."""
+            backend = get_persistent_cache() if persist_ttl is not None else None
+            if backend is None:
+                return None
+            stored_at = backend.peek(cache_key(namespace, func, args, kwargs),
+                                     persist_ttl + (stale_ttl if stale_ttl is not None else persist_ttl))
+            return None if stored_at is None else time.time() - stored_at
+
+        wrapper.clear = cached_func.clear
+        wrapper.refresh = refresh
+        wrapper.age = age
+        _cache_clearers[namespace].append(cached_func.clear)
+        return wrapper
+    return decorator
+
+def register_cache_clearer(namespace, clear):
+    _cache_clearers[namespace].append(clear)
+
+def invalidate_cache(namespace):
+    """
+    Drop every cached entry in one namespace (memory and persistent), leaving the others warm.
+    """
+    for clear in _cache_clearers[namespace]:
+        clear()
+    backend = get_persistent_cache()
+    if backend is not None:
+        backend.delete_prefix(f"{namespace}:")
+
+WEATHER_TTL = 1800  # จำพยากรณ์อากาศ 30 นาที
+WATER_TTL = 3600  # จำข้อมูลระดับน้ำ 1 ชั่วโมง
+
+THAIWATER_DAM_URL = "https://api-v3.thaiwater.net/api/v1/thaiwater30/get_dam_daily"
+DAM_NAME_PREFIXES = ("เขื่อน", "อ่างเก็บน้ำ", "อ่างฯ", "อ่าง", "dam")
+DAM_FUZZY_CUTOFF = 0.8
+DAM_SUBSTRING_MIN_LEN = 4  # ชื่อสั้นกว่านี้ (เช่น "ลำ", "แม่") อยู่ในชื่อเขื่อนหลายแห่ง จับคู่แบบ substring ไม่ได้
+
+def normalize_dam_name(name):
+    """
+    Normalize a Thai dam/reservoir name for index lookups
+    (lowercase, no whitespace, no generic prefixes like เขื่อน/อ่างเก็บน้ำ).
+    """
+    key = re.sub(r'\s+', '', str(name or '')).lower()
+    for prefix in DAM_NAME_PREFIXES:
+        if key.startswith(prefix) and len(key) > len(prefix):
+            key = key[len(prefix):]
+            break
+    return key
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+@namespaced_cache("water", cache=st.cache_resource, ttl=WATER_TTL, persist_ttl=WATER_TTL)  # ดึงข้อมูลเขื่อนทั้งประเทศครั้งเดียวต่อชั่วโมง แล้วใช้ร่วมกันทุกจุด
+def get_dam_snapshot():
+    """
+    Download the ThaiWater daily dam feed once per TTL and index it by normalized name.
+    Raises on network/format errors so a failed download is not cached.
+    """
+    res = http_get_json(THAIWATER_DAM_URL)
+    dams = res.get('data', {}).get('dam', []) if isinstance(res, dict) else []
+    index = {}
+    for dam in dams:
+        name_th = (dam.get('dam_name') or {}).get('th')
+        if not name_th:
+            continue
+        index.setdefault(normalize_dam_name(name_th), {
+            "name": name_th,
+            "storage_percent": _to_float(dam.get('dam_storage_percent')),
+            "inflow": _to_float(dam.get('dam_inflow')),
+            "outflow": _to_float(dam.get('dam_released')),
+            "date": dam.get('dam_date'),
+        })
+    # lookups: ผลการจับคู่ชื่อจุด -> เขื่อน (จำไว้ในรอบ snapshot เดียวกัน)
+    return {"index": index, "lookups": {}}
+
+def find_dam(dam_name, snapshot):
+    """
+    Match a spot name to a dam record: exact normalized name, then substring
+(only for names of at least DAM_SUBSTRING_MIN_LEN characters), then fuzzy.
+    """
+    key = normalize_dam_name(dam_name)
+    if not key:
+        return None
+    lookups = snapshot["lookups"]
+    if key in lookups:
+        return lookups[key]
+
+    index = snapshot["index"]
+    dam = index.get(key)
+    if dam is None:
+        # ชื่อจุดเป็นส่วนหนึ่งของชื่อเขื่อน หรือชื่อเขื่อนอยู่ในชื่อจุด (เช่น "ภูมิพล ท้ายเขื่อน")
+        candidates = [
+            k for k in index
+            if (key in k and len(key) >= DAM_SUBSTRING_MIN_LEN) or (k in key and len(k) >= DAM_SUBSTRING_MIN_LEN)
+        ]
+        if candidates:
+            dam = index[max(candidates, key=len)]
+    if dam is None:
+        close = difflib.get_close_matches(key, index.keys(), n=1, cutoff=DAM_FUZZY_CUTOFF)
+        if close:
+            dam = index[close[0]]
+    lookups[key] = dam
+    return dam
+
+def get_dam_status(dam_name):
+    """
+    Return the dam record for a spot name (storage %, inflow, outflow) or None.
+    """
+    if not dam_name:
+        return None
+    return find_dam(dam_name, get_dam_snapshot())
+
+def format_dam_status(dam):
+    parts = [f"น้ำ {dam['storage_percent']:.0f}%" if dam['storage_percent'] is not None else "น้ำ N/A"]
+    parts[0] += f" ({dam['name']})"
+    if dam['inflow'] is not None:
+        parts.append(f"ไหลเข้า {dam['inflow']:.2f} ล้าน ลบ.ม.")
+    if dam['outflow'] is not None:
+        parts.append(f"ระบาย {dam['outflow']:.2f} ล้าน ลบ.ม.")
+    return " · ".join(parts)
+
+def get_water_info(dam_name):
+    try:
+        dam = get_dam_status(dam_name)
+        if dam is None:
+            return "ไม่มีข้อมูลอ่างเก็บน้ำ"
+        return format_dam_status(dam)
+    except: return "เชื่อมต่อข้อมูลน้ำไม่ได้"
+
+def weather_cell(lat, lon, cell_km=WEATHER_CELL_KM):
+    """
+    Snap a coordinate to the center of its ~cell_km weather grid cell.
+    """
+    step = cell_km / 111.0  # 1 องศา ~ 111 กม.
+    return round(round(lat / step) * step, 4), round(round(lon / step) * step, 4)
+
+WEATHER_FAILED = ("ไม่มีข้อมูล", "ไม่มีข้อมูลล่วงหน้า")
+
+def get_full_weather(lat, lon):
+    try:
+        return get_cell_weather(*weather_cell(lat, lon))
+    except: return WEATHER_FAILED
+
+def invalidate_weather(lat, lon):
+    """
+    Drop only the cached weather of the grid cell containing (lat, lon).
+    """
+    cell = weather_cell(lat, lon)
+    get_cell_weather.clear(*cell)
+    backend = get_persistent_cache()
+    if backend is not None:
+        backend.delete_prefix(f"weather:get_cell_weather:{cell!r}:")
+
+@namespaced_cache("weather", ttl=WEATHER_TTL, persist_ttl=WEATHER_TTL)  # จำพยากรณ์อากาศ 30 นาที (ต่อช่องตาราง ไม่ใช่ต่อจุด)
+def get_cell_weather(lat, lon):
+    # ไม่ดัก error ที่นี่: ถ้าดึงไม่ได้จะไม่ถูก cache (ผู้เรียกแสดงข้อความแทนเอง)
+    # 1. อากาศตอนนี้
+    now_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=th"
+    c = http_get_json(now_url)
+    if 'main' in c and 'weather' in c and len(c['weather']) > 0:
+        now_txt = f"{c['main']['temp']}°C, {c['weather'][0]['description']}"
+    else:
+        now_txt = "ไม่มีข้อมูล"
+    
+    # 2. พยากรณ์ล่วงหน้า (ดึงราย 3 ชม. มาคัดเอาวันละจุด)
+    fore_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=th"
+    f = http_get_json(fore_url)
+    fore_list = []
+    # คัดเอาข้อมูลทุกๆ 24 ชม. (index 8, 16, 24)
+    if 'list' in f and len(f['list']) > 0:
+        for i in [8, 16, 24]:
+            if i < len(f['list']):
+                day = f['list'][i]
+                if 'dt' in day and 'main' in day and 'weather' in day and len(day['weather']) > 0:
+                    dt = datetime.fromtimestamp(day['dt']).strftime('%d/%m')
+                    fore_list.append(f"• {dt}: {day['main']['temp']:.0f}°C, {day['weather'][0]['description']}")
+    
+    fore_html = "<br>".join(fore_list) if fore_list else "ไม่มีข้อมูลล่วงหน้า"
+    return now_txt, fore_html
+
+# --- ข้อมูลจุดตกปลา: เก็บสำเนาไว้ในเครื่อง แล้วดึงเฉพาะแถวที่เปลี่ยน ---
+SPOT_COLUMNS = ['name', 'lat', 'lon', 'fish_type', 'image_url', 'description']
+SPOTS_SYNC_INTERVAL = 30  # วินาที: ถามเซิร์ฟเวอร์หาแถวใหม่ไม่บ่อยกว่านี้
+SPOTS_RECONCILE_INTERVAL = 1800  # วินาที: โหลดทั้งตารางเป็นระยะ เพื่อเก็บแถวที่ถูกลบ
+SPOTS_FALLBACK_TTL = 600
+SPOTS_WATERMARK_COLUMNS = ("updated_at", "created_at")
+SPOTS_CHANGE_LOG = 100  # จำ id ที่เปลี่ยนของเวอร์ชันล่าสุดกี่รุ่น (ให้ดัชนีค้นหาอัปเดตเฉพาะแถวที่เปลี่ยน)
+
+@st.cache_resource
+def get_spot_store():
+    """
+    Process-wide snapshot of the spots table keyed by id, plus the sync watermark.
+    """
+    return {
+        "df": None,
+        "version": 0,  # เพิ่มทุกครั้งที่ข้อมูลเปลี่ยน ใช้เป็น key ของดัชนี/สถิติที่คำนวณจากข้อมูลชุดนี้
+        "watermark_col": None,
+        "watermark": None,
+        "synced_at": 0.0,
+        "reconciled_at": 0.0,
+        "changes": deque(maxlen=SPOTS_CHANGE_LOG),  # (version, ids ที่เปลี่ยน หรือ None = อาจเปลี่ยนทุกแถว)
+        "persist_token": None,  # snapshot ใน cache ถาวรที่ persist_delta ต่อยอดอยู่
+        "persist_delta": {},  # id -> แถวที่เปลี่ยนหลัง snapshot นั้น
+        "lock": threading.Lock(),
+    }
+
+def _bump_version(store, changed_ids=None):
+    """
+    Start a new data version; changed_ids are the ids whose rows changed
+    (None when any row may have, e.g. after a full reload).
+    """
+    store["version"] += 1
+    store["changes"].append((store["version"], None if changed_ids is None else frozenset(changed_ids)))
+
+def spots_changed_since(since, version):
+    """
+    Ids changed between two data versions, or None when unknown
+    (a full reload in between, or older than the change log).
+    """
+    if since is None:
+        return None
+    store = get_spot_store()
+    with store["lock"]:
+        entries = [ids for v, ids in store["changes"] if since < v <= version]
+    if len(entries) != version - since or any(ids is None for ids in entries):
+        return None
+    return frozenset().union(*entries)
+
+def _merge_spot_rows(df, rows):
+    """
+    Upsert rows into the snapshot by id (rows without an id are appended).
+    """
+    new = pd.DataFrame(rows)
+    if df is None or df.empty:
+        return new
+    if new.empty:
+        return df
+    if 'id' not in df.columns or 'id' not in new.columns:
+        return pd.concat([df, new], ignore_index=True)
+    return pd.concat([df[~df['id'].isin(new['id'])], new], ignore_index=True)
+
+def _row_ids(rows):
+    """
+    Ids of the rows, or None if any row has none (then the change is untracked).
+    """
+    ids = [r.get("id") for r in rows]
+    return None if any(i is None for i in ids) else ids
+
+def _advance_watermark(store, rows):
+    col = store["watermark_col"]
+    values = [r[col] for r in rows if col and r.get(col)]
+    if values:
+        store["watermark"] = max(values + ([store["watermark"]] if store["watermark"] else []))
+
+# เก็บเป็น JSON (ไม่ใช่ pickle ของ DataFrame): ทั้งตารางเขียนเฉพาะตอนโหลดทั้งตาราง
+# ระหว่างนั้นเขียนแค่แถวที่เปลี่ยนหลัง snapshot ค่าใช้จ่ายจึงตามจำนวนแถวที่เปลี่ยน ไม่ใช่ขนาดตาราง
+SPOTS_SNAPSHOT_KEY = "spots:snapshot"
+SPOTS_DELTA_KEY = "spots:delta"
+
+def _persist_raw(key, payload):
+    backend = get_persistent_cache()
+    if backend is None:
+        return
+    try:
+        backend.set_raw(key, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), SPOTS_RECONCILE_INTERVAL)
+    except Exception:
+        pass
+
+def _persist_spot_snapshot(store, rows):
+    """
+    Save a full load (the rows as the API returned them) so other workers and restarts start warm.
+    """
+    store["persist_token"], store["persist_delta"] = uuid.uuid4().hex, {}
+    _persist_raw(SPOTS_SNAPSHOT_KEY, {
+        "token": store["persist_token"], "rows": rows, "watermark_col": store["watermark_col"],
+        "watermark": store["watermark"], "reconciled_at": store["reconciled_at"],
+    })
+
+def _persist_spot_delta(store, rows):
+    """
+    Save the rows changed since the last snapshot (only those, not the table).
+    """
+    if store["persist_token"] is None:
+        return
+    for row in rows:
+        store["persist_delta"][row.get("id", len(store["persist_delta"]))] = row
+    _persist_raw(SPOTS_DELTA_KEY, {"token": store["persist_token"], "rows": list(store["persist_delta"].values())})
+
+def _load_raw(backend, key):
+    data, _ = backend.get_raw(key)
+    return json.loads(data.decode("utf-8")) if data else None
+
+def _restore_spot_store(store):
+    """
+    Start from the shared snapshot plus its delta if there is one; the next
+    sync then only fetches rows changed since the restored watermark.
+    """
+    backend = get_persistent_cache()
+    if backend is None:
+        return
+    try:
+        snapshot = _load_raw(backend, SPOTS_SNAPSHOT_KEY)
+        delta = _load_raw(backend, SPOTS_DELTA_KEY)
+    except Exception:
+        return
+    if not snapshot:
+        return
+    df = pd.DataFrame(snapshot["rows"])
+    store.update(
+        df=df if not df.empty else pd.DataFrame(columns=SPOT_COLUMNS),
+        watermark_col=snapshot["watermark_col"], watermark=snapshot["watermark"],
+        reconciled_at=snapshot["reconciled_at"], persist_token=snapshot["token"], persist_delta={},
+    )
+    # delta ของ snapshot อื่น (worker อื่นโหลดทั้งตารางใหม่ไปแล้ว) ไม่ใช้: sync ต่อจาก watermark ของ snapshot แทน
+    if delta and delta.get("token") == snapshot["token"] and delta["rows"]:
+        store["df"] = _merge_spot_rows(store["df"], delta["rows"])
+        _advance_watermark(store, delta["rows"])
+        for row in delta["rows"]:
+            store["persist_delta"][row.get("id", len(store["persist_delta"]))] = row
+    _bump_version(store)
+    store["synced_at"] = 0.0
+
+def sync_spots(force_full=False):
+    """
+    Bring the local snapshot up to date and return (df, version), read
+    together under the store lock so indexes keyed by version always match
+    the frame they were built from.
+    Full reload on first use, on force_full, or every SPOTS_RECONCILE_INTERVAL
+    (SPOTS_FALLBACK_TTL unless updated_at is the watermark, since created_at
+    never moves on an update); otherwise fetch only rows whose watermark
+    column is newer than the last sync.
+    """
+    store = get_spot_store()
+    with store["lock"]:
+        if store["df"] is None and not force_full:
+            _restore_spot_store(store)
+        now = time.time()
+        # ตารางที่ไม่มีคอลัมน์เวลา (หรือยังว่าง) ทำ delta ไม่ได้: โหลดทั้งตารางทุก 10 นาทีแบบเดิม
+        # ถ้ามีแค่ created_at, delta เห็นเฉพาะแถวใหม่ ไม่เห็นการ update (รวมปลา/รูป) จึงโหลดทั้งตารางทุก 10 นาทีเช่นกัน
+        has_delta_for_updates = store["watermark"] and store["watermark_col"] == "updated_at"
+        reconcile_every = SPOTS_RECONCILE_INTERVAL if has_delta_for_updates else SPOTS_FALLBACK_TTL
+        if force_full or store["df"] is None or now - store["reconciled_at"] >= reconcile_every:
+            count_cache("spots", hit=False)
+            # ใช้ db_client() (เป็น client ของ service key ถ้าตั้งค่าไว้)
+            res = run_with_retry(lambda: db_client().table("spots").select("*"), "ดึงข้อมูลจุดตกปลา")
+            df = pd.DataFrame(res.data)
+            store["df"] = df if not df.empty else pd.DataFrame(columns=SPOT_COLUMNS)
+            _bump_version(store)
+            store["watermark_col"] = next((c for c in SPOTS_WATERMARK_COLUMNS if c in df.columns), None)
+            store["watermark"] = None
+            _advance_watermark(store, res.data)
+            store["synced_at"] = store["reconciled_at"] = now
+            _persist_spot_snapshot(store, res.data)
+        elif store["watermark"] and now - store["synced_at"] >= SPOTS_SYNC_INTERVAL:
+            count_cache("spots", hit=False)
+            col, mark = store["watermark_col"], store["watermark"]
+            res = run_with_retry(
+                lambda: db_client().table("spots").select("*").gt(col, mark).order(col),
+                "ดึงข้อมูลจุดตกปลาที่เปลี่ยนแปลง"
+            )
+            if res.data:
+                store["df"] = _merge_spot_rows(store["df"], res.data)
+                _bump_version(store, _row_ids(res.data))
+                _advance_watermark(store, res.data)
+                _persist_spot_delta(store, res.data)
+            store["synced_at"] = now
+        else:
+            count_cache("spots", hit=True)
+        return store["df"], store["version"]
+
+def note_spot_written(row=None):
+    """
+    Tell the snapshot about a row this process just inserted/updated.
+    Without the row, the next load_spots() runs a delta sync immediately.
+    """
+    store = get_spot_store()
+    with store["lock"]:
+        if row and store["df"] is not None:
+            store["df"] = _merge_spot_rows(store["df"], [row])
+            _bump_version(store, _row_ids([row]))
+            # ไม่ขยับ watermark: แถวอื่นที่เขียนพร้อมกันจะได้ไม่หลุด
+        else:
+            store["synced_at"] = 0.0
+            if not store["watermark"]:
+                store["reconciled_at"] = 0.0
+    # จุดใหม่อาจอยู่ในกรอบแผนที่ใดก็ได้ ล้างเฉพาะ cache ของโหมดกรอบแผนที่ (อากาศ/น้ำยังอยู่)
+    load_spots_in_bounds.clear()
+    load_spot_counts.clear()
+
+def reset_spot_store():
+    store = get_spot_store()
+    with store["lock"]:
+        store["df"] = None
+
+register_cache_clearer("spots", reset_spot_store)
+
+def load_spots():
+    """
+    sync_spots() for the page: on failure, the last snapshot (df, version) with an error message.
+    """
+    try:
+        return sync_spots()
+    except Exception as e:
+        st.error(f"ไม่สามารถโหลดข้อมูลได้: {str(e)}")
+        store = get_spot_store()
+        with store["lock"]:
+            stale, version = store["df"], store["version"]
+        return (stale if stale is not None else pd.DataFrame(columns=SPOT_COLUMNS)), version
+
+# --- โหลดเฉพาะจุดในกรอบแผนที่ (กรองที่เซิร์ฟเวอร์) ---
+VIEWPORT_SNAP_DEG = 0.05  # ปัดกรอบออกด้านนอก เพื่อให้เลื่อนแผนที่นิดหน่อยยังโดน cache เดิม
+VIEWPORT_MAX_SPOTS = 2000
+VIEWPORT_AGGREGATE_BELOW_ZOOM = 9  # ซูมออกไกลกว่านี้ ส่งแค่จำนวนจุดต่อช่องตาราง
+
+def snap_bounds(south, west, north, east, step=VIEWPORT_SNAP_DEG):
+    """
+    Expand a bounding box outward to a fixed grid so nearby viewports share a cache key.
+    """
+    return (
+        round(math.floor(south / step) * step, 4), round(math.floor(west / step) * step, 4),
+        round(math.ceil(north / step) * step, 4), round(math.ceil(east / step) * step, 4),
+    )
+
+@namespaced_cache("spots", ttl=600)
+def load_spots_in_bounds(south, west, north, east, columns="*"):
+    try:
+        res = run_with_retry(
+            lambda: db_client().table("spots").select(columns)\
+                .gte("lat", south).lte("lat", north)\
+                .gte("lon", west).lte("lon", east)\
+                .limit(VIEWPORT_MAX_SPOTS),
+            "ดึงจุดตกปลาในกรอบแผนที่"
+        )
+        return pd.DataFrame(res.data)
+    except Exception as e:
+        st.error(f"ไม่สามารถโหลดข้อมูลในกรอบแผนที่ได้: {str(e)}")
+        return pd.DataFrame(columns=SPOT_COLUMNS)
+
+def map_bounds(bounds):
+    """
+    Convert st_folium's bounds dict into (south, west, north, east), or None if incomplete.
+    """
+    bounds = bounds or {}
+    sw, ne = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    if None in (sw.get('lat'), sw.get('lng'), ne.get('lat'), ne.get('lng')):
+        return None
+    return sw['lat'], sw['lng'], ne['lat'], ne['lng']
+
+def grid_cell_deg(zoom):
+    return 360 / (2 ** zoom) / 4  # ประมาณ 1/4 ของ tile ที่ซูมนั้น
+
+def aggregate_spots(df, zoom):
+    """
+    Group spots into grid cells sized to the zoom level; returns lat, lon (mean) and count per cell.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=['lat', 'lon', 'count'])
+    cell = grid_cell_deg(zoom)
+    keys = [(df['lat'] / cell).round().rename('cell_lat'), (df['lon'] / cell).round().rename('cell_lon')]
+    return df.groupby(keys).agg(lat=('lat', 'mean'), lon=('lon', 'mean'), count=('lat', 'size')).reset_index(drop=True)
+
+SPOT_GRID_RPC = "spot_grid_counts"  # supabase/migrations/20261018010000_spot_grid_counts.sql
+
+@namespaced_cache("spots", ttl=600)
+def load_spot_counts(south, west, north, east, zoom):
+    """
+    Spot counts per grid cell (as aggregate_spots) over every spot in the box,
+    not just the first VIEWPORT_MAX_SPOTS. Grouped in the database by
+    spot_grid_counts; without that function, pages through the box's
+    coordinates and groups them here.
+    """
+    try:
+        try:
+            res = run_with_retry(
+                lambda: db_client().rpc(SPOT_GRID_RPC, {
+                    "p_south": south, "p_west": west, "p_north": north, "p_east": east,
+                    "p_cell": grid_cell_deg(zoom),
+                }),
+                "นับจุดตกปลาในกรอบแผนที่"
+            )
+            return pd.DataFrame(res.data, columns=['lat', 'lon', 'count'])
+        except Exception as e:
+            if not is_missing_object(e):
+                raise
+        rows = [row for chunk in iter_spot_chunks(columns="id,lat,lon", bounds=(south, west, north, east)) for row in chunk]
+        return aggregate_spots(pd.DataFrame(rows, columns=['lat', 'lon']), zoom)
+    except Exception as e:
+        st.error(f"ไม่สามารถนับจุดตกปลาในกรอบแผนที่ได้: {str(e)}")
+        return pd.DataFrame(columns=['lat', 'lon', 'count'])
+
+# --- ดึงข้อมูลอากาศ/น้ำของทุกจุดพร้อมกัน (ก่อนสร้างหมุด) ---
+PREFETCH_MAX_WORKERS = 16
+PREFETCH_DEADLINE = 8  # วินาที: เกินนี้แสดงข้อความรอแทน ไม่ให้หน้าเว็บค้าง
+WEATHER_PENDING = ("⏳ กำลังโหลดข้อมูลอากาศ", "⏳ กำลังโหลดข้อมูลล่วงหน้า")
+WATER_PENDING = "⏳ กำลังโหลดข้อมูลน้ำ"
+
+@st.cache_resource
+def get_prefetch_pool():
+    """
+    One worker pool for every session's prefetch, plus the lookups still in
+    flight keyed by what they fetch, so reruns reuse them instead of queueing
+    duplicates behind a slow upstream.
+    """
+    return {"executor": ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="prefetch"),
+            "pending": {}, "lock": threading.Lock()}
+
+def _submit_prefetch(pool, key, func, *args):
+    with pool["lock"]:
+        future = pool["pending"].get(key)
+        if future is None or future.done():
+            future = pool["pending"][key] = pool["executor"].submit(bind_perf_run(func), *args)
+    return future
+
+def prefetch_conditions(df, deadline=PREFETCH_DEADLINE):
+    """
+    Resolve weather and water for every row concurrently.
+    Weather is fetched once per grid cell. Returns (weather, water) dicts
+    keyed by (lat, lon) and spot name;
+    anything not finished before the deadline gets placeholder text and
+    keeps running in the background so the next rerun hits the cache.
+    """
+    weather, water = {}, {}
+    if df.empty:
+        return weather, water
+
+    cell_of = {coord: weather_cell(*coord) for coord in set(zip(df['lat'], df['lon']))}
+    names = set(df['name'].dropna())
+    # งานที่ไม่เสร็จทันเวลาทำต่อเบื้องหลังจนเสร็จ rerun ถัดไปจะได้ค่าจาก cache
+    # pool เดียวทั้ง process และไม่ส่งงานซ้ำกับที่ยังค้างอยู่ จำนวนเธรดจึงไม่เพิ่มตามจำนวน rerun
+    # (จำนวนคำขอพร้อมกันต่อ host ยังถูกจำกัดด้วย connection pool ของ httpx และมี circuit breaker)
+    pool = get_prefetch_pool()
+    weather_futures = {_submit_prefetch(pool, ("weather", cell), get_cell_weather, *cell): cell for cell in set(cell_of.values())}
+    # ข้อมูลน้ำดึงครั้งเดียวทั้งประเทศ: อุ่น snapshot แล้วค่อยจับคู่ชื่อในเธรดหลัก
+    dam_future = _submit_prefetch(pool, ("water",), get_dam_snapshot)
+    wait(list(weather_futures) + [dam_future], timeout=deadline)
+
+    by_cell = {
+        cell: WEATHER_PENDING if not future.done() or future.cancelled()
+        else WEATHER_FAILED if future.exception() is not None
+        else future.result()
+        for future, cell in weather_futures.items()
+    }
+    weather = {coord: by_cell[cell] for coord, cell in cell_of.items()}
+    if not dam_future.done() or dam_future.cancelled():
+        water_text = lambda spot_name: WATER_PENDING
+    elif dam_future.exception() is not None:
+        water_text = lambda spot_name: "เชื่อมต่อข้อมูลน้ำไม่ได้"
+    else:
+        water_text = get_water_info
+    for spot_name in names:
+        water[spot_name] = water_text(spot_name)
+    return weather, water
+
+# --- อุ่นข้อมูลล่วงหน้าเบื้องหลัง (ผู้ใช้ไม่ต้องรอ API ภายนอกตอนเปิดหน้า) ---
+PREFETCH_SCHEDULER = bool(st.secrets.get("PREFETCH_SCHEDULER", False))  # เปิดเองเมื่อมี worker ที่รันค้างไว้
+PREFETCH_TICK = 60  # วินาที: รอบการตรวจว่ามีอะไรใกล้หมดอายุ
+PREFETCH_REFRESH_AHEAD = 0.8  # รีเฟรชเมื่ออายุข้อมูลถึง 80% ของ TTL
+PREFETCH_WEATHER_CELLS_PER_MIN = int(st.secrets.get("PREFETCH_WEATHER_CELLS_PER_MIN", 25))  # 1 ช่อง = 2 calls ของ OpenWeather
+def _needs_refresh(cached_func, args, refreshed_at, key, ttl):
+    # ใช้อายุจาก cache ถาวรถ้ามี (worker อื่นอาจรีเฟรชไปแล้ว) ไม่งั้นใช้เวลาที่รีเฟรชล่าสุดของ process นี้
+    age = cached_func.age(*args)
+    if age is None:
+        age = time.time() - refreshed_at.get(key, 0)
+    return age >= ttl * PREFETCH_REFRESH_AHEAD
+
+def run_prefetch_cycle(state):
+    """
+    One scheduler pass: delta-sync spots, then refresh the dam snapshot and
+    every weather cell older than PREFETCH_REFRESH_AHEAD of its TTL, pacing
+    weather calls to the API quota.
+    """
+    refreshed_at = state["refreshed_at"]
+    df, _ = sync_spots()
+
+    if _needs_refresh(get_dam_snapshot, (), refreshed_at, "water", WATER_TTL):
+        get_dam_snapshot.refresh()
+        refreshed_at["water"] = time.time()
+
+    if df is None or df.empty:
+        return
+    cells = {weather_cell(lat, lon) for lat, lon in zip(df['lat'], df['lon'])}
+    pause = 60 / max(PREFETCH_WEATHER_CELLS_PER_MIN, 1)
+    for cell in sorted(cells, key=lambda c: refreshed_at.get(c, 0)):
+        if state["stop"].is_set():
+            return
+        if not _needs_refresh(get_cell_weather, cell, refreshed_at, cell, WEATHER_TTL):
+            continue
+        try:
+            get_cell_weather.refresh(*cell)
+            refreshed_at[cell] = time.time()
+        except Exception as e:
+            # ช่องเดียวพังไม่ควรหยุดทั้งรอบ (breaker จะกันไม่ให้ยิงซ้ำถ้า API ล่ม)
+            state["last_error"] = f"weather {cell}: {e}"
+        state["stop"].wait(pause)
+
+@st.cache_resource
+def start_prefetch_scheduler():
+    """
+    Start the background refresher once per process; returns its state dict
+    (refreshed_at, last_error, stop event).
+    """
+    state = {"refreshed_at": {}, "last_run": None, "last_error": None, "stop": threading.Event()}
+
+    def loop():
+        while not state["stop"].is_set():
+            try:
+                run_prefetch_cycle(state)
+                state["last_error"] = None
+            except Exception as e:
+                state["last_error"] = str(e)
+            state["last_run"] = time.time()
+            state["stop"].wait(PREFETCH_TICK)
+
+    threading.Thread(target=loop, name="prefetch-scheduler", daemon=True).start()
+    return state
+
+# --- ฟังก์ชันจัดการข้อมูล (หัวใจหลัก) ---
+DUPLICATE_RADIUS_M = 100  # จุดที่ห่างกันไม่เกินนี้ถือเป็นจุดเดียวกัน
+
+def radius_bounds(lat, lon, radius_m):
+    """
+    Bounding box (south, west, north, east) that fully contains a circle of radius_m meters.
+    """
+    dlat = radius_m / 111320.0
+    dlon = radius_m / (111320.0 * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+def find_existing_spot(name, lat, lon, radius_m=DUPLICATE_RADIUS_M):
+    """
+    Find the spot a new report belongs to: exact name first, otherwise the nearest
+    spot within radius_m. Only the name match and the rows inside the radius'
+    bounding box are fetched, so the cost does not grow with the table.
+    Returns a row Series (with 'distance' for proximity matches) or None.
+    """
+    res = run_with_retry(
+        lambda: db_client().table("spots").select("*").eq("name", name).limit(1),
+        "ค้นหาจุดเดิมตามชื่อ"
+    )
+    if res.data:
+        return pd.Series(res.data[0])
+
+    south, west, north, east = radius_bounds(lat, lon, radius_m)
+    res = run_with_retry(
+        lambda: db_client().table("spots").select("*")\
+            .gte("lat", south).lte("lat", north)\
+            .gte("lon", west).lte("lon", east),
+        "ค้นหาจุดเดิมใกล้เคียง"
+    )
+    candidates = pd.DataFrame(res.data)
+    if candidates.empty:
+        return None
+    candidates = nearest_spots(candidates, lat, lon, radius_m=radius_m, limit=1)
+    return None if candidates.empty else candidates.iloc[0]
+
+def _text(value):
+    return value if isinstance(value, str) else ""
+
+def merge_spot_fields(target_row, fish_type, description, images_urls):
+    """
+    Fields to update when a report lands on an existing spot: fish names and
+    image URLs are unioned without duplicates, and a new description is
+    appended with a timestamp.
+    """
+    old_fish = _text(target_row.get('fish_type'))
+    old_images = _text(target_row.get('image_url'))
+    old_desc = _text(target_row.get('description'))
+
+    # 1. รวมชื่อปลา (เอาที่ซ้ำออก) เก็บตามที่ผู้ใช้พิมพ์ ชื่อมาตรฐานใช้ตอนสร้างดัชนี/สถิติเท่านั้น
+    new_fish_list = fish_entries(old_fish + "," + (fish_type or ""))
+    updated_fish = ", ".join(sorted(list(set(new_fish_list))))
+
+    # 2. รวมรูปภาพ (เอาที่ซ้ำออก)
+    new_img_str = ",".join(images_urls)
+    old_img_list = [u.strip() for u in old_images.split(",") if u.strip()]
+    new_img_list = [u.strip() for u in new_img_str.split(",") if u.strip()]
+    updated_images = ",".join(list(dict.fromkeys(old_img_list + new_img_list)))
+
+    # 3. รวมรายละเอียด (ถ้ามีข้อมูลใหม่ ให้ต่อท้าย)
+    updated_desc = old_desc
+    if description and description.strip() and description.strip() not in old_desc:
+        timestamp = datetime.now().strftime('%d/%m/%Y %H:%M')
+        separator = "\n" + "-"*20 + "\n" if old_desc else ""
+        updated_desc = f"{old_desc}{separator}[{timestamp}] {description.strip()}"
+
+    return {
+        "fish_type": updated_fish,
+        "image_url": updated_images,
+        "description": updated_desc
+    }
+
+def new_spot_row(name, lat, lon, fish_type, description, images_urls):
+    return {
+        "name": name, "lat": lat, "lon": lon,
+        "fish_type": ", ".join(sorted(set(fish_entries(fish_type)))), "description": description, "image_url": ",".join(images_urls)
+    }
+
+# รายงานการตกปลา: เก็บแยกตาราง (append-only) แล้วให้ฐานข้อมูลรวมเข้าจุดในคำขอเดียว
+# ต้องรัน supabase/migrations/20261018000000_catch_reports.sql ก่อน (ถ้ายังไม่มีจะใช้วิธีเดิม)
+CATCH_REPORT_RPC = "submit_catch_report"
+CATCH_REPORTS_BATCH_RPC = "submit_catch_reports"
+CATCH_REPORTS_RECENT = 5
+
+def submit_catch_report(name, fish_type, description, images_urls, lat, lon):
+    """
+    Save one report with the server-side merge: find-or-create the spot, merge
+    fish and images and append the report in one transaction (one round trip).
+    Returns {"spot", "merged", "distance_m"}, or None if the database doesn't
+    have the function yet.
+    """
+    # สร้าง params (และ report_id) ครั้งเดียว: retry หลัง timeout ส่ง id เดิม ฐานข้อมูลจะไม่บันทึกซ้ำ
+    params = {**catch_report_params(name, fish_type, description, images_urls, lat, lon), "p_radius_m": DUPLICATE_RADIUS_M}
+    try:
+        res = run_with_retry(lambda: db_client().rpc(CATCH_REPORT_RPC, params), "บันทึกรายงานการตกปลา")
+    except Exception as e:
+        if is_missing_object(e):
+            return None
+        raise
+    return res.data
+
+def catch_report_params(name, fish_type, description, images_urls, lat, lon):
+    """
+    RPC arguments for one report, with a fresh p_report_id that makes resending it a no-op.
+    """
+    return {
+        "p_report_id": str(uuid.uuid4()),
+        "p_name": name, "p_lat": lat, "p_lon": lon,
+        "p_fish": sorted(set(fish_entries(fish_type))),
+        "p_description": (description or "").strip() or None,
+        "p_image_urls": list(images_urls),
+    }
+
+def submit_catch_reports(reports):
+    """
+    Batch form of submit_catch_report for bulk imports: reports are
+    catch_report_params dicts, merged in order in one transaction (a retry
+    resends the same report ids, so nothing is merged twice). Returns one
+    result per report, or None if the database doesn't have the function yet.
+    """
+    try:
+        res = run_with_retry(
+            lambda: db_client().rpc(CATCH_REPORTS_BATCH_RPC, {"p_reports": reports, "p_radius_m": DUPLICATE_RADIUS_M}),
+            "บันทึกรายงานการตกปลาหลายรายการ"
+        )
+    except Exception as e:
+        if is_missing_object(e):
+            return None
+        raise
+    return res.data or []
+
+@namespaced_cache("spots", ttl=600)
+def recent_catch_reports(spot_id, limit=CATCH_REPORTS_RECENT):
+    """
+    Latest catch reports of one spot, newest first (empty before the migration).
+    """
+    try:
+        res = run_with_retry(
+            lambda: db_client().table("catch_reports").select("fish_type,description,reported_at")\
+                .eq("spot_id", spot_id).order("reported_at", desc=True).limit(limit),
+            "ดึงรายงานการตกปลา"
+        )
+    except Exception as e:
+        if is_missing_object(e):
+            return []
+        raise
+    return res.data or []
+
+def save_fishing_spot(name, fish_type, description, images_urls, lat, lon):
+    if db_client() is None:
+        st.error("ไม่สามารถเชื่อมต่อฐานข้อมูลได้")
+        return False
+
+    try:
+        # บันทึกผ่านฟังก์ชันฝั่งเซิร์ฟเวอร์: รวมข้อมูลแบบ atomic ไม่มีการเขียนทับกันเมื่อส่งพร้อมกัน
+        result = submit_catch_report(name, fish_type, description, images_urls, lat, lon)
+        if result is not None:
+            spot = result["spot"]
+            if result["merged"]:
+                dist_info = f" (ห่าง {result['distance_m']:.1f} ม.)" if result.get("distance_m") is not None else ""
+                st.success(f"อัปเดตข้อมูลในจุดเดิม: {spot['name']}{dist_info} เรียบร้อย! (มีข้อมูลในระบบแล้ว)")
+            else:
+                st.success("บันทึกจุดตกปลาใหม่เรียบร้อย!")
+            with st.expander("ดูข้อมูลที่บันทึกสำเร็จ"):
+                st.write(spot)
+            note_spot_written(spot)
+            recent_catch_reports.clear(spot["id"])
+            return True
+
+        # ฐานข้อมูลยังไม่มี submit_catch_report: ใช้วิธีเดิม (อ่านจุดเดิม รวมใน Python แล้ว update)
+        # 1. ค้นหาจุดเดิม: ชื่อตรงกัน หรือ พิกัดใกล้เคียงกัน (ระยะทางน้อยกว่า 100 เมตร)
+        # ดึงเฉพาะแถวที่เป็นไปได้จากเซิร์ฟเวอร์ ไม่ต้องโหลดทั้งตาราง
+        target_row = find_existing_spot(name, lat, lon)
+
+        if target_row is not None:
+            # --- กรณีมีจุดเดิมหรือจุดใกล้เคียงอยู่แล้ว: ให้ "รวม" ข้อมูล ---
+            update_data = merge_spot_fields(target_row, fish_type, description, images_urls)
+            
+            # ใช้ช่วงพิกัด (Epsilon) แทนการใช้ค่าเท่ากันเป๊ะๆ เพื่อเลี่ยงปัญหาทศนิยมคลาดเคลื่อน
+            epsilon = 0.00001
+            res_update = run_with_retry(
+                lambda: db_client().table("spots").update(update_data)\
+                    .eq("name", target_row['name'])\
+                    .gte("lat", target_row['lat'] - epsilon)\
+                    .lte("lat", target_row['lat'] + epsilon)\
+                    .gte("lon", target_row['lon'] - epsilon)\
+                    .lte("lon", target_row['lon'] + epsilon),
+                "อัปเดตข้อมูลจุดเดิม"
+            )
+                
+            if res_update.data:
+                dist_info = f" (ห่าง {target_row['distance']:.1f} ม.)" if 'distance' in target_row else ""
+                st.success(f"อัปเดตข้อมูลในจุดเดิม: {target_row['name']}{dist_info} เรียบร้อย! (มีข้อมูลในระบบแล้ว)")
+                # แสดงผลข้อมูลที่อัปเดตเพื่อตรวจสอบ
+                with st.expander("ดูข้อมูลที่บันทึกสำเร็จ"):
+                    st.write(res_update.data[0])
+                note_spot_written(res_update.data[0])
+                return True
+            else:
+                st.warning("⚠️ พบจุดเดิมในแอปแต่ไม่สามารถระบุแถวในฐานข้อมูลเพื่ออัปเดตได้ (พิกัดในเครื่องกับใน DB อาจไม่ตรงกันในระดับทศนิยม)")
+                return False
+
+        else:
+            # --- กรณีเป็นจุดใหม่: ให้ "เพิ่ม" แถวใหม่ ---
+            res_insert = run_with_retry(
+                lambda: db_client().table("spots").insert(new_spot_row(name, lat, lon, fish_type, description, images_urls)),
+                "บันทึกจุดใหม่"
+            )
+            
+            if res_insert.data:
+                st.success("บันทึกจุดตกปลาใหม่เรียบร้อย!")
+                with st.expander("ดูข้อมูลที่บันทึกใหม่"):
+                    st.write(res_insert.data[0])
+                note_spot_written(res_insert.data[0])
+                return True
+            else:
+                # ในบางกรณี insert อาจสำเร็จแต่ไม่คืนค่าข้อมูล (เช่น RLS หรือ configuration)
+                # เราจะให้ True ไว้ก่อนถ้าไม่มี Exception
+                st.info("ส่งข้อมูลไปที่เซิร์ฟเวอร์แล้ว (รอการตรวจสอบข้อมูลในอาทิตย์ถัดไปหากยังไม่ปรากฏ)")
+                note_spot_written()
+                return True
+    except Exception as e:
+        st.error(f"Database Error: {str(e)}")
+        st.code(traceback.format_exc())
+        return False
+
+# --- อัปโหลดรูปภาพ (ย่อ + อัปโหลดหลายไฟล์พร้อมกัน) ---
+IMAGE_RENDITIONS = (800, 400, 120)  # px: ตัวเต็ม / รายการจุด / thumbnail ใน popup
+IMAGE_FORMAT = str(st.secrets.get("IMAGE_FORMAT", "JPEG")).upper()  # ตั้งเป็น WEBP เพื่อไฟล์เล็กลง
+IMAGE_EXT = {"JPEG": "jpg", "WEBP": "webp"}
+IMAGE_HASH = str(st.secrets.get("IMAGE_HASH", "sha256")).lower()  # ตั้งเป็น phash เพื่อรวมรูปเดียวกันที่ถูกบีบอัดต่างกัน
+UPLOAD_WORKERS = 4  # จำนวนไฟล์ที่ประมวลผล/อัปโหลดพร้อมกันสูงสุด (คุมหน่วยความจำ)
+RENDITION_PREFIX = "r/"  # รูปที่มีหลายขนาดเก็บใต้โฟลเดอร์นี้ ชื่อไฟล์เป็น <hash>_<ขนาด>.<นามสกุล>
+
+@timed_function("image", "prepare_image")
+def prepare_image(f):
+    """
+    Decode an uploaded image once and encode every size in IMAGE_RENDITIONS.
+    JPEG draft mode decodes at a reduced DCT scale, so a 12 MP photo is
+    never materialized at full resolution. Returns {size: bytes}.
+    """
+    from PIL import Image  # โหลดเฉพาะตอนมีรูปให้ประมวลผล (ไม่ถ่วงการเปิดหน้าเว็บ)
+    largest = max(IMAGE_RENDITIONS)
+    img = Image.open(f)
+    img.draft("RGB", (largest, largest))
+    img = img.convert("RGB")
+
+    renditions = {}
+    # ย่อจากใหญ่ไปเล็ก แต่ละขนาดใช้ภาพขนาดก่อนหน้าเป็นต้นฉบับ
+    for size in sorted(IMAGE_RENDITIONS, reverse=True):
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format=IMAGE_FORMAT, quality=85)
+        renditions[size] = buf.getvalue()
+    return renditions
+
+def image_key(renditions):
+    """
+    Content address for an image: sha256 of the encoded largest rendition, or
+    with IMAGE_HASH=phash a 64-bit difference hash, so re-compressed copies of
+    the same photo also collapse to one object.
+    """
+    if IMAGE_HASH == "phash":
+        from PIL import Image
+        img = Image.open(io.BytesIO(renditions[min(renditions)])).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+        px = list(img.getdata())
+        bits = 0
+        for y in range(8):
+            for x in range(8):
+                bits = (bits << 1) | (px[y * 9 + x] > px[y * 9 + x + 1])
+        return f"p{bits:016x}"
+    return hashlib.sha256(renditions[max(renditions)]).hexdigest()
+
+@timed_function("upstream", "storage_upload")
+def upload_image(renditions):
+    """
+    Store every rendition under its content hash in the fishing_images bucket
+    and return the https public URL of the largest one (smaller sizes are
+    found via rendition_url). Images already in the bucket are not re-uploaded.
+    """
+    ext = IMAGE_EXT.get(IMAGE_FORMAT, "jpg")
+    stem = f"{RENDITION_PREFIX}{image_key(renditions)}"
+    main_path = f"{stem}_{max(renditions)}.{ext}"
+    bucket = storage_client().storage.from_("fishing_images")
+    file_options = {"content-type": f"image/{IMAGE_FORMAT.lower()}", "upsert": "true"}
+
+    # อัปโหลดไปยัง Supabase Storage (ใช้ client ของ service key ที่มีสิทธิ์ bypass RLS)
+    # ทุกการเรียกผ่าน upstream "storage" (retry + circuit breaker) เหมือนการเรียก API อื่น
+    # รูปเดียวกันเคยอัปโหลดแล้ว (ไฟล์ตัวใหญ่มีอยู่) ใช้ URL เดิมได้เลย
+    if not call_upstream("storage", lambda: bucket.exists(main_path)):
+        # อัปโหลดตัวใหญ่สุดท้าย: ถ้ามีตัวใหญ่แปลว่าทุกขนาดอัปโหลดครบแล้ว (upsert จึง retry ซ้ำได้)
+        for size, data in sorted(renditions.items()):
+            call_upstream("storage", lambda path=f"{stem}_{size}.{ext}", data=data: bucket.upload(path, data, file_options=file_options))
+
+    # ดึง public URL และแปลง http เป็น https
+    public_url = bucket.get_public_url(main_path)
+    if public_url.startswith("http://"):
+        public_url = public_url.replace("http://", "https://")
+    return public_url
+
+_RENDITION_RE = re.compile(r'(/fishing_images/' + re.escape(RENDITION_PREFIX) + r'.+_)(\d+)(\.(?:jpg|webp))$')
+
+def rendition_url(url, size):
+    """
+    URL of a smaller stored rendition; images uploaded before renditions existed are returned unchanged.
+    """
+    return _RENDITION_RE.sub(lambda m: f"{m.group(1)}{size}{m.group(3)}", url) if size in IMAGE_RENDITIONS else url
+
+def _process_and_upload(f):
+    try:
+        return upload_image(prepare_image(f)), None
+    except Exception as e:
+        return None, (str(e), traceback.format_exc())
+
+def upload_images(files, on_progress=None):
+    """
+    Process and upload files in a bounded worker pool.
+    Returns one (public_url, error) pair per file, in input order; error is
+    (message, traceback) for files that failed. on_progress(done, total, name)
+    is called from the calling thread as each file finishes.
+    """
+    results = [None] * len(files)
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {executor.submit(bind_perf_run(_process_and_upload), f): i for i, f in enumerate(files)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i] = future.result()
+            if on_progress:
+                on_progress(done, len(files), files[i].name)
+    return results
+
+# --- ชื่อปลามาตรฐาน + ดัชนีชนิดปลา ---
+# ชื่อเรียกอื่น/สะกดต่าง -> ชื่อมาตรฐาน (เทียบหลังตัดช่องว่างและเติม "ปลา" แล้ว)
+FISH_ALIASES = {
+    "ปลากะพง": "ปลากะพงขาว",
+    "ปลาตะเพียน": "ปลาตะเพียนขาว",
+    "ปลาช่อนงูเห่า": "ปลาชะโด",
+    "ปลาบู่ทราย": "ปลาบู่",
+    "ปลานิลแดง": "ปลาทับทิม",
+    "tilapia": "ปลานิล",
+    "snakehead": "ปลาช่อน",
+    "giantsnakehead": "ปลาชะโด",
+    "barramundi": "ปลากะพงขาว",
+    "catfish": "ปลาดุก",
+}
+THAI_CHAR_RE = re.compile(r'[\u0E00-\u0E7F]')
+# ของที่ตกได้แต่ไม่ใช่ปลา: ไม่เติม "ปลา" ข้างหน้า (กุ้ง ไม่ใช่ ปลากุ้ง)
+NON_FISH_PREFIXES = ("กุ้ง", "กั้ง", "หอย", "ปู", "กบ", "เขียด", "เต่า", "ตะพาบ", "แมงดา")
+
+def canonical_fish(name):
+    """
+    Canonical Thai species name: no whitespace, "ปลา" prefix (not for the
+    non-fish catches in NON_FISH_PREFIXES), aliases resolved.
+    """
+    key = re.sub(r'\s+', '', str(name or ''))
+    if not key:
+        return None
+    if key.startswith("ปลา") and key[len("ปลา"):].startswith(NON_FISH_PREFIXES):
+        # ชื่อที่เคยถูกเติม "ปลา" ผิดและบันทึกไว้แล้ว (เช่น ปลากุ้ง)
+        key = key[len("ปลา"):]
+    elif THAI_CHAR_RE.match(key) and not key.startswith(("ปลา",) + NON_FISH_PREFIXES):
+        key = "ปลา" + key
+    return FISH_ALIASES.get(key.lower(), key)
+
+def fish_entries(fish_string):
+    """
+    Comma-joined fish_type -> names as entered (trimmed, blanks dropped); this is what gets stored.
+    """
+    if fish_string is None or (isinstance(fish_string, float) and math.isnan(fish_string)):
+        return []
+    return [fish.strip() for fish in str(fish_string).split(",") if fish.strip()]
+
+def split_fish(fish_string):
+    """
+    Comma-joined fish_type -> list of canonical species names (order kept,
+    duplicates kept), for the species index and stats.
+    """
+    return [fish for fish in map(canonical_fish, fish_entries(fish_string)) if fish]
+
+# --- ฟังก์ชันนับสถิติปลา ---
+def get_spot_fish_stats(fish_string):
+    # แยกรายชื่อปลาและนับจำนวน
+    fish_list = split_fish(fish_string)
+    if not fish_list:
+        return "ยังไม่มีข้อมูลปลา"
+    
+    # นับความถี่
+    counts = Counter(fish_list)
+    
+    # สร้างข้อความแสดงสถิติแบบบรรทัด
+    stat_text = "<br>".join([f"• {fish}: {count} ครั้ง" for fish, count in counts.items()])
+    return stat_text
+
+@namespaced_cache("spots", cache=st.cache_resource, max_entries=2)
+def build_species_index(version, _df):
+    """
+    Inverted index built once per data version:
+    by_species (species -> set of df index labels), counts (spots per species,
+    descending) and fish_stats (fish_type string -> popup stats HTML).
+    """
+    by_species = defaultdict(set)
+    fish_stats = {}
+    if 'fish_type' in _df.columns:
+        for label, fish_string in _df['fish_type'].items():
+            species = split_fish(fish_string)
+            for fish in species:
+                by_species[fish].add(label)
+            if species and fish_string not in fish_stats:
+                fish_stats[fish_string] = get_spot_fish_stats(fish_string)
+    counts = pd.Series({fish: len(labels) for fish, labels in by_species.items()}, dtype=int).sort_values(ascending=False)
+    return {"by_species": dict(by_species), "counts": counts, "fish_stats": fish_stats}
+
+def spot_fish_stats(fish_string, species_index=None):
+    """
+    Popup stats for a spot, from species_index when given and the string is already indexed.
+    """
+    cached = species_index["fish_stats"].get(fish_string) if species_index is not None else None
+    return cached if cached is not None else get_spot_fish_stats(fish_string)
+
+# --- สถิติของข้อมูลทั้งชุด (คำนวณครั้งเดียวต่อเวอร์ชันข้อมูล) ---
+# แบ่งภาคโดยประมาณจากพิกัด (ตามลำดับ: เงื่อนไขแรกที่ตรงใช้ก่อน)
+REGION_RULES = [
+    ("ภาคใต้", lambda lat, lon: lat < 11.0),
+    ("ภาคตะวันออกเฉียงเหนือ", lambda lat, lon: (lat >= 14.2) & (lon >= 101.3)),
+    ("ภาคเหนือ", lambda lat, lon: lat >= 16.0),
+    ("ภาคตะวันออก", lambda lat, lon: lon >= 100.9),
+    ("ภาคตะวันตก", lambda lat, lon: lon < 99.7),
+]
+REGION_DEFAULT = "ภาคกลาง"
+
+def spot_regions(df):
+    """
+    Approximate Thai region for every row, computed with vectorized comparisons.
+    """
+    lat = pd.to_numeric(df['lat'], errors='coerce').to_numpy()
+    lon = pd.to_numeric(df['lon'], errors='coerce').to_numpy()
+    conditions = [rule(lat, lon) for _, rule in REGION_RULES]
+    return pd.Series(np.select(conditions, [name for name, _ in REGION_RULES], default=REGION_DEFAULT), index=df.index)
+
+@namespaced_cache("spots", cache=st.cache_resource, max_entries=2)
+def compute_spot_stats(version, _df, _species_index):
+    """
+    Dataset aggregates for the statistics section, built once per data version:
+    totals, image counts, bounding box, spots per region and the top species
+    broken down by region.
+    """
+    df = _df
+    stats = {"total_spots": len(df), "species": len(_species_index["counts"])}
+
+    images = df['image_url'].fillna('').astype(str).str.strip() if 'image_url' in df.columns else pd.Series('', index=df.index)
+    has_images = images != ''
+    stats["total_images"] = int((images[has_images].str.count(',') + 1).sum())
+    stats["spots_with_images"] = int(has_images.sum())
+
+    stats["bbox"] = None
+    stats["regions"] = pd.Series(dtype=int)
+    stats["species_by_region"] = pd.DataFrame()
+    if {'lat', 'lon'} <= set(df.columns) and not df.empty:
+        lat, lon = pd.to_numeric(df['lat'], errors='coerce'), pd.to_numeric(df['lon'], errors='coerce')
+        if lat.notna().any() and lon.notna().any():
+            stats["bbox"] = (lat.min(), lat.max(), lon.min(), lon.max())
+        regions = spot_regions(df)
+        stats["regions"] = regions.value_counts()
+        top_species = _species_index["counts"].head(10).index
+        stats["species_by_region"] = pd.DataFrame({
+            fish: regions.loc[list(_species_index["by_species"][fish])].value_counts()
+            for fish in top_species
+        }).fillna(0).astype(int).T
+    return stats
+
+# --- ดัชนีค้นหา (character n-gram ใช้กับภาษาไทยที่ไม่มีการเว้นวรรคได้) ---
+SEARCH_NGRAM = 3
+SEARCH_FIELDS = {"name": 3.0, "fish_type": 2.0, "description": 1.0}  # น้ำหนักคะแนนของแต่ละช่อง
+SEARCH_TOKEN_RE = re.compile(r'[^\s,;:()\[\]/|"\'.!?\-]+')
+
+def search_tokens(text):
+    return SEARCH_TOKEN_RE.findall(str(text).lower())
+
+def search_grams(token, n=SEARCH_NGRAM):
+    """
+    Character n-grams of one token; tokens shorter than n are kept whole.
+    """
+    if len(token) <= n:
+        return {token}
+    return {token[i:i + n] for i in range(len(token) - n + 1)}
+
+def spot_doc_keys(df):
+    """
+    Stable document keys for the search index: the id column, or the index labels.
+    """
+    return df['id'] if 'id' in df.columns else pd.Series(df.index, index=df.index)
+
+@st.cache_resource
+def get_search_index():
+    return {"version": None, "sigs": {}, "docs": {}, "postings": defaultdict(dict), "lock": threading.Lock()}
+
+def _index_spot(index, key, row):
+    grams = {}
+    for field, weight in SEARCH_FIELDS.items():
+        value = row.get(field)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        for token in search_tokens(value):
+            for gram in search_grams(token):
+                grams[gram] = max(grams.get(gram, 0.0), weight)
+    for gram, weight in grams.items():
+        index["postings"][gram][key] = weight
+    index["docs"][key] = grams
+
+def _unindex_spot(index, key):
+    for gram in index["docs"].pop(key, {}):
+        postings = index["postings"].get(gram)
+        if postings is not None:
+            postings.pop(key, None)
+            if not postings:
+                del index["postings"][gram]
+
+def _search_sig(row, fields):
+    return hash(tuple(str(row[f]) for f in fields))
+
+def refresh_search_index(df, version):
+    """
+    Bring the shared search index up to date with one data version.
+    When the spot store knows which ids changed since the indexed version
+    (delta syncs and local saves), only those rows are looked up and
+    re-tokenized, so a save re-indexes one spot, not the table. After a full
+    reload every row's text signature is compared instead. version must be
+    the one sync_spots returned together with df.
+    """
+    index = get_search_index()
+    with index["lock"]:
+        if index["version"] == version:
+            return index
+        fields = [f for f in SEARCH_FIELDS if f in df.columns]
+        changed = spots_changed_since(index["version"], version) if 'id' in df.columns else None
+        if changed is not None:
+            for key in changed:
+                _unindex_spot(index, key)
+                index["sigs"].pop(key, None)
+            rows = df[df['id'].isin(changed)]
+            for key, (_, row) in zip(rows['id'], rows[fields].iterrows()):
+                index["sigs"][key] = _search_sig(row, fields)
+                _index_spot(index, key, row)
+        else:
+            keys = spot_doc_keys(df)
+            sigs = {}
+            for key, (_, row) in zip(keys, df[fields].iterrows()):
+                sig = _search_sig(row, fields)
+                sigs[key] = sig
+                if index["sigs"].get(key) != sig:
+                    _unindex_spot(index, key)
+                    _index_spot(index, key, row)
+            for key in set(index["sigs"]) - set(sigs):
+                _unindex_spot(index, key)
+            index["sigs"] = sigs
+        index["version"] = version
+        return index
+
+def search_spots(index, query):
+    """
+    Ranked search: every query word must match (n-gram AND, so substrings and
+    prefixes both work). Words shorter than the n-gram size match any indexed
+    gram that starts with them. Returns {doc_key: score}.
+    """
+    scores = None
+    postings = index["postings"]
+    for word in search_tokens(query):
+        if len(word) < SEARCH_NGRAM:
+            word_scores = {}
+            for gram in [g for g in postings if g.startswith(word)]:
+                for key, weight in postings[gram].items():
+                    word_scores[key] = max(word_scores.get(key, 0.0), weight)
+        else:
+            word_scores = None
+            for gram in search_grams(word):
+                matches = postings.get(gram, {})
+                if word_scores is None:
+                    word_scores = dict(matches)
+                else:
+                    word_scores = {key: score + matches[key] for key, score in word_scores.items() if key in matches}
+                if not word_scores:
+                    break
+        if scores is None:
+            scores = word_scores or {}
+        else:
+            scores = {key: score + word_scores[key] for key, score in scores.items() if key in word_scores}
+        if not scores:
+            return {}
+    return scores or {}
+
+def filter_spots(df, species_index, version, search_term="", fish_filter="ทั้งหมด", sort_option=None):
+    """
+    The management list's search, species filter and sort applied to df.
+    """
+    filtered_data = df.copy()
+    if df.empty:
+        return filtered_data
+    if search_term:
+        # ค้นจากดัชนี (สร้างครั้งเดียวต่อเวอร์ชันข้อมูล) แทนการสแกนข้อความทุกแถว
+        search_scores = search_spots(refresh_search_index(df, version), search_term)
+        relevance = spot_doc_keys(filtered_data).map(search_scores)
+        filtered_data = filtered_data[relevance.notna()]
+        if sort_option == "ความเกี่ยวข้อง":
+            filtered_data = filtered_data.loc[relevance.dropna().sort_values(ascending=False, kind='stable').index]
+
+    if fish_filter != "ทั้งหมด":
+        filtered_data = filtered_data[filtered_data.index.isin(species_index["by_species"].get(fish_filter, ()))]
+
+    # Sort data
+    if sort_option == "ชื่อ (A-Z)":
+        filtered_data = filtered_data.sort_values('name')
+    elif sort_option == "ชื่อ (Z-A)":
+        filtered_data = filtered_data.sort_values('name', ascending=False)
+    return filtered_data
+
+# --- ส่งออกข้อมูล: ดึงทีละหน้าจากฐานข้อมูล แล้วเขียนลงไฟล์ชั่วคราวทีละส่วน ---
+EXPORT_CHUNK = 1000
+EXPORT_ID_BATCH = 200  # จำนวน id ต่อคำขอ ตอนส่งออกเฉพาะจุดที่กรองไว้ (id อยู่ใน URL ของ PostgREST)
+# ปุ่มดาวน์โหลดของ Streamlit เก็บทั้งไฟล์ไว้ในหน่วยความจำก่อนส่ง จึงจำกัดขนาดไฟล์ส่งออกผ่านหน้าเว็บ
+EXPORT_MAX_MB = int(st.secrets.get("EXPORT_MAX_MB", 100))
+EXPORT_COLUMNS = ['id', *SPOT_COLUMNS, 'created_at']  # หัวตารางเมื่อไม่มีแถวให้ส่งออก
+# ชนิดคอลัมน์ของไฟล์ Parquet กำหนดไว้ล่วงหน้า (คอลัมน์อื่นเป็น string) ไม่เดาจากชุดแรกที่อาจว่างทั้งคอลัมน์
+EXPORT_PARQUET_TYPES = {"id": "int64", "lat": "float64", "lon": "float64", "report_count": "int64"}
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "JSON Lines": ("jsonl", "application/x-ndjson"),
+    "GeoJSON": ("geojson", "application/geo+json"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+class ExportTooLarge(Exception):
+    pass
+
+def iter_spot_chunks(ids=None, chunk_size=EXPORT_CHUNK, columns="*", bounds=None):
+    """
+    Yield the spots table in lists of rows, using keyset pagination on id
+    (only rows inside bounds=(south, west, north, east) when given). With
+    ids, yields just those rows in id order, EXPORT_ID_BATCH per request.
+    """
+    if ids is not None:
+        ids = sorted(set(ids))
+        for start in range(0, len(ids), EXPORT_ID_BATCH):
+            batch = ids[start:start + EXPORT_ID_BATCH]
+            rows = run_with_retry(
+                lambda: db_client().table("spots").select(columns).in_("id", batch).order("id"),
+                "ส่งออกข้อมูลจุดตกปลา"
+            ).data or []
+            if rows:
+                yield rows
+        return
+
+    last_id = None
+    while True:
+        def page():
+            query = db_client().table("spots").select(columns)
+            if bounds is not None:
+                south, west, north, east = bounds
+                query = query.gte("lat", south).lte("lat", north).gte("lon", west).lte("lon", east)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            return query.order("id").limit(chunk_size)
+        rows = run_with_retry(page, "ส่งออกข้อมูลจุดตกปลา").data or []
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]["id"]
+
+def _write_csv(out, chunks):
+    text = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+    writer = None
+    for rows in chunks:
+        if writer is None:
+            writer = csv.DictWriter(text, fieldnames=list(rows[0]), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerows(rows)
+    if writer is None:
+        csv.writer(text).writerow(EXPORT_COLUMNS)
+    text.flush()
+    text.detach()
+
+def _write_jsonl(out, chunks):
+    for rows in chunks:
+        out.write("".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows).encode('utf-8'))
+
+def _write_geojson(out, chunks):
+    out.write(b'{"type": "FeatureCollection", "features": [\n')
+    first = True
+    for rows in chunks:
+        for row in rows:
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [row.get('lon'), row.get('lat')]},
+                "properties": {k: v for k, v in row.items() if k not in ('lat', 'lon')},
+            }
+            out.write((b"" if first else b",\n") + json.dumps(feature, ensure_ascii=False, default=str).encode('utf-8'))
+            first = False
+    out.write(b'\n]}\n')
+
+def _parquet_schema(columns):
+    import pyarrow as pa
+    return pa.schema([(column, getattr(pa, EXPORT_PARQUET_TYPES.get(column, "string"))()) for column in columns])
+
+def _parquet_table(rows, schema):
+    import pyarrow as pa
+    columns = {}
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        if pa.types.is_string(field.type):
+            values = [v if v is None or isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str) for v in values]
+        columns[field.name] = pa.array(values, type=field.type)
+    return pa.table(columns, schema=schema)
+
+def _write_parquet(out, chunks):
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for rows in chunks:
+            if writer is None:
+                writer = pq.ParquetWriter(out, _parquet_schema(list(rows[0])))
+            writer.write_table(_parquet_table(rows, writer.schema))
+        if writer is None:
+            # ไม่มีแถว: ยังต้องเป็นไฟล์ Parquet ที่อ่านได้ (ตารางว่างพร้อม schema)
+            schema = _parquet_schema(EXPORT_COLUMNS)
+            writer = pq.ParquetWriter(out, schema)
+            writer.write_table(schema.empty_table())
+    finally:
+        if writer is not None:
+            writer.close()
+
+EXPORT_WRITERS = {"CSV": _write_csv, "JSON Lines": _write_jsonl, "GeoJSON": _write_geojson, "Parquet": _write_parquet}
+
+def write_spot_export(fmt, out, ids=None):
+    """
+    Stream the spots table (or only the rows with the given ids) into the
+    binary file out in the given format. Only one chunk of rows is held in
+    memory while encoding.
+    """
+    EXPORT_WRITERS[fmt](out, iter_spot_chunks(ids))
+
+def export_spots(fmt, ids=None, max_mb=EXPORT_MAX_MB):
+    """
+    Bytes for st.download_button. The file is encoded through a temp file, but
+    Streamlit serves downloads from memory, so the result is capped at max_mb
+    and ExportTooLarge is raised above it (filter the list, or call
+    write_spot_export with a file on disk for larger exports).
+    """
+    with tempfile.TemporaryFile() as out:
+        write_spot_export(fmt, out, ids)
+        if out.tell() > max_mb * 1024 * 1024:
+            raise ExportTooLarge(f"ไฟล์ส่งออกใหญ่เกิน {max_mb} MB กรองรายการให้น้อยลงแล้วส่งออกเฉพาะจุดที่กรองไว้")
+        out.seek(0)
+        return out.read()
+
+# --- ชั้นหมุดบนแผนที่ (popup / cluster / จุดรวม) ---
+def spot_images(row):
+    """
+    Split a row's comma-joined image_url into a list of URLs.
+    """
+    if "image_url" in row and row["image_url"]:
+        try:
+            return [u.strip() for u in str(row["image_url"]).split(",") if u.strip()]
+        except:
+            return []
+    return []
+
+POPUP_MAX_IMAGES = 5
+
+def build_popup_html(row, weather_now, weather_fore, water_lv, species_index=None):
+    spot_stats = spot_fish_stats(row['fish_type'], species_index)
+
+    # จัดการรูปภาพ (เลื่อนนิ้ว)
+    # ใช้ thumbnail 120px, โหลดเมื่อเลื่อนถึง และแสดงไม่เกิน POPUP_MAX_IMAGES รูป
+    images = spot_images(row)
+    img_html = ""
+    if images:
+        img_html = '<div style="display: flex; overflow-x: auto; gap: 5px; width: 220px; background:#f0f0f0; border-radius:8px; padding:5px;">'
+        for u in images[:POPUP_MAX_IMAGES]:
+            img_html += f'<img src="{rendition_url(u, 120)}" loading="lazy" style="height: 120px; border-radius: 5px; flex-shrink: 0;">'
+        if len(images) > POPUP_MAX_IMAGES:
+            img_html += f'<div style="align-self: center; flex-shrink: 0; padding: 0 8px; color: #555;">+{len(images) - POPUP_MAX_IMAGES} รูป</div>'
+        img_html += '</div>'
+
+    name = row.get('name', 'ไม่มีชื่อ')
+    fish_type = row.get('fish_type', 'ไม่ระบุ')
+    description = row.get('description', 'ไม่มีรายละเอียด')
+
+    return f"""
+    <div style='width: 220px; font-family: sans-serif;'>
+        {img_html}
+        <h4 style='margin: 8px 0 2px 0; color: #1a73e8;'>{name}</h4>
+        <b>🐟 ปลา:</b> {fish_type}<br>
+        <div style='background: #e8f0fe; padding: 8px; border-radius: 5px; margin-top: 5px;'>
+            <b>📊 สถิติการเจอปลาที่นี่:</b><br>
+            <small>{spot_stats}</small>
+        </div>
+        <b>รายละเอียด:</b> {description}<br>
+        <b>🌡️ ตอนนี้:</b> {weather_now}<br>
+        <b>💧 น้ำ:</b> {water_lv}
+        <hr style='margin: 5px 0;'>
+        <small><b>📅 พยากรณ์ 3 วัน:</b><br>{weather_fore}</small>
+        <a href="https://www.google.com/maps/dir/?api=1&destination={row['lat']},{row['lon']}" target="_blank">
+            <button style='width:100%; background:#4285F4; color:white; border:none; padding:10px; border-radius:5px; margin-top:10px; cursor:pointer; font-weight:bold;'>🚀 นำทาง</button>
+        </a>
+    </div>
+    """
+
+def find_clicked_spot(df, clicked, tolerance=1e-5):
+    """
+    Map st_folium's last_object_clicked ({lat, lng}) back to a spot row, or None.
+    """
+    if df.empty or not clicked or clicked.get('lat') is None:
+        return None
+    diff = (df['lat'] - clicked['lat']).abs() + (df['lon'] - clicked['lng']).abs()
+    pos = diff.values.argmin()
+    return df.iloc[pos] if diff.iloc[pos] <= tolerance else None
+
+def build_spot_layer(df, lazy, species_index=None):
+    """
+    Clustered marker layer for the given spots; eager mode attaches full popups
+    (fish stats from species_index when given).
+    """
+    layer = folium.FeatureGroup(name="spots")
+    cluster = MarkerCluster().add_to(layer)
+    if lazy:
+        for _, row in df.iterrows():
+            folium.Marker(
+                [row['lat'], row['lon']],
+                tooltip=row.get('name', 'ไม่มีชื่อ'),
+                icon=folium.Icon(color='green', icon='fish', prefix='fa')
+            ).add_to(cluster)
+        return layer
+
+    # ดึงข้อมูลอากาศ/น้ำของทุกจุดพร้อมกันก่อน (เร็วและไม่ทำให้แผนที่กระพริบ)
+    weather_by_coord, water_by_name = prefetch_conditions(df)
+    for _, row in df.iterrows():
+        weather_now, weather_fore = weather_by_coord.get((row['lat'], row['lon']), WEATHER_PENDING)
+        water_lv = water_by_name.get(row['name'], "ไม่มีข้อมูลอ่างเก็บน้ำ")
+        popup_html = build_popup_html(row, weather_now, weather_fore, water_lv, species_index)
+        folium.Marker(
+            [row['lat'], row['lon']],
+            popup=folium.Popup(popup_html, max_width=250),
+            icon=folium.Icon(color='green', icon='fish', prefix='fa')
+        ).add_to(cluster)
+    return layer
+
+def build_aggregate_layer(agg):
+    """
+    One labelled circle per grid cell, used when zoomed out in viewport mode.
+    """
+    layer = folium.FeatureGroup(name="spot_counts")
+    for _, cell in agg.iterrows():
+        folium.CircleMarker(
+            [cell['lat'], cell['lon']],
+            radius=min(8 + math.log2(cell['count']) * 3, 30),
+            color='#1a73e8', fill=True, fill_opacity=0.6,
+            tooltip=f"{int(cell['count'])} จุดตกปลา (ซูมเข้าเพื่อดูหมุด)"
+        ).add_to(layer)
+    return layer
@@ -0,0 +1,36 @@
+"""
+Import fishing_core outside `streamlit run` (import_spots.py, tests, benchmarks).
+"""
+import json
+import os
+import sys
+import tempfile
+
+from streamlit.logger import set_log_level
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_fishing_core(secrets=None):
+    """
+    Import fishing_core with Streamlit's runtime warnings silenced. With a
+    secrets dict, st.secrets is read from a throwaway secrets.toml holding
+    just those values instead of the one in the working directory.
+    """
+    # ตั้งซ้ำหลัง import เพราะการโหลด config ของ streamlit ตั้งระดับ log ใหม่
+    set_log_level("error")
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    cwd = os.getcwd()
+    if secrets is not None:
+        secrets_dir = tempfile.mkdtemp(prefix="fishing_secrets_")
+        os.makedirs(os.path.join(secrets_dir, ".streamlit"))
+        with open(os.path.join(secrets_dir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+            f.writelines(f"{key} = {json.dumps(value)}\n" for key, value in secrets.items())
+        os.chdir(secrets_dir)
+    try:
+        import fishing_core
+    finally:
+        os.chdir(cwd)
+    set_log_level("error")
+    return fishing_core
@@ -0,0 +1,302 @@
+"""
+Bulk-import fishing spots from CSV or GeoJSON without going through the web form.
+
+    python import_spots.py "Fish Data/Book1.csv"
+    python import_spots.py reservoirs.geojson --chunk-size 1000 --dry-run
+
+Columns/properties: name, lat, lon, fish_type, description, image_url
+(GeoJSON takes lat/lon from Point geometry). Each chunk of rows goes to the
+database in one submit_catch_reports call, which saves every row like the
+sidebar form does: matched to the spot with the same name, otherwise the
+nearest within DUPLICATE_RADIUS_M (or a new spot), fish and images merged
+into it, report_count/last_report_at bumped and the row kept in
+catch_reports. Re-running a file merges its rows into the spots they created
+(and records them as reports again).
+
+Before that migration is applied, and with --dry-run, rows are matched in
+memory against the existing table and earlier rows of the file, merged with
+merge_spot_fields (descriptions appended) and written once per chunk: one
+insert for new spots and one upsert for merged ones.
+
+Run from the app folder so .streamlit/secrets.toml is found.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+
+from headless import import_fishing_core
+
+core = import_fishing_core()
+
+LINE_DELIMITED_EXTS = (".geojsonl", ".geojsons", ".ndjson", ".jsonl")
+
+
+def read_rows(path):
+    """
+    Yield (line_no, raw_dict) from a CSV, GeoJSON FeatureCollection or
+    newline-delimited GeoJSON file. CSV and line-delimited files are streamed;
+    a FeatureCollection is one JSON document and is parsed whole.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield line_no, row
+    elif ext in LINE_DELIMITED_EXTS:
+        with open(path, encoding="utf-8-sig") as f:
+            for line_no, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_no, feature_to_row(json.loads(line))
+    elif ext in (".geojson", ".json"):
+        with open(path, encoding="utf-8-sig") as f:
+            collection = json.load(f)
+        for i, feature in enumerate(collection.get("features", []), start=1):
+            yield i, feature_to_row(feature)
+    else:
+        raise ValueError(f"ไม่รองรับไฟล์ {ext} (ใช้ .csv, .geojson หรือ GeoJSON แบบบรรทัดละ feature)")
+
+
+def feature_to_row(feature):
+    row = dict(feature.get("properties") or {})
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") == "Point" and len(geometry.get("coordinates") or []) >= 2:
+        row["lon"], row["lat"] = geometry["coordinates"][:2]
+    return row
+
+
+def parse_row(raw):
+    """
+    Validate one input row; returns (spot, None) or (None, reason).
+    """
+    name = str(raw.get("name") or "").strip()
+    if not name:
+        return None, "ไม่มีชื่อจุด"
+    try:
+        lat, lon = float(raw.get("lat")), float(raw.get("lon"))
+    except (TypeError, ValueError):
+        return None, "พิกัดไม่ถูกต้อง"
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, "พิกัดไม่ถูกต้อง"
+    images = [u.strip() for u in str(raw.get("image_url") or "").split(",") if u.strip()]
+    return {
+        "name": name, "lat": lat, "lon": lon,
+        "fish_type": str(raw.get("fish_type") or ""),
+        "description": str(raw.get("description") or "").strip(),
+        "images": images,
+    }, None
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+class SpotMatcher:
+    """
+    In-memory lookup of known spots (existing + imported so far) by exact name
+    and by a grid of cells about DUPLICATE_RADIUS_M wide.
+    """
+    def __init__(self, radius_m=core.DUPLICATE_RADIUS_M):
+        self.radius_m = radius_m
+        self.cell_deg = radius_m / 111320.0
+        self.spots = {}
+        self.by_name = {}
+        self.grid = defaultdict(list)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def add(self, key, row):
+        self.spots[key] = row
+        self.by_name.setdefault(row["name"], key)
+        self.grid[self._cell(row["lat"], row["lon"])].append(key)
+
+    def find(self, name, lat, lon):
+        """
+        Key of the spot this report belongs to (same rule as find_existing_spot), or None.
+        """
+        if name in self.by_name:
+            return self.by_name[name]
+        south, west, north, east = core.radius_bounds(lat, lon, self.radius_m)
+        (row_lo, col_lo), (row_hi, col_hi) = self._cell(south, west), self._cell(north, east)
+        best, best_distance = None, None
+        for cell_row in range(row_lo, row_hi + 1):
+            for cell_col in range(col_lo, col_hi + 1):
+                for key in self.grid.get((cell_row, cell_col), ()):
+                    spot = self.spots[key]
+                    distance = core.haversine_distance(lat, lon, spot["lat"], spot["lon"])
+                    if distance <= self.radius_m and (best_distance is None or distance < best_distance):
+                        best, best_distance = key, distance
+        return best
+
+
+def load_existing(matcher, chunk_size):
+    count = 0
+    for rows in core.iter_spot_chunks(chunk_size=chunk_size):
+        for row in rows:
+            if row.get("name") and row.get("lat") is not None and row.get("lon") is not None:
+                matcher.add(("id", row["id"]), row)
+                count += 1
+    return count
+
+
+def spot_payload(row):
+    return {column: row.get(column) for column in core.SPOT_COLUMNS}
+
+
+def flush(inserts, updates):
+    """
+    Write one chunk: a single insert for new spots, a single upsert (on id) for merged ones.
+    """
+    if inserts:
+        rows = list(inserts.values())
+        payload = [spot_payload(row) for row in rows]
+        res = core.run_with_retry(lambda: core.db_client().table("spots").insert(payload), "นำเข้าจุดใหม่")
+        # จำ id ไว้ให้แถวถัดๆ ไปในไฟล์ที่รวมเข้าจุดนี้ อัปเดตด้วย upsert ได้
+        for row, saved in zip(rows, res.data or []):
+            row["id"] = saved.get("id")
+    if updates:
+        payload = [{"id": row["id"], **spot_payload(row)} for row in updates.values()]
+        core.run_with_retry(lambda: core.db_client().table("spots").upsert(payload, on_conflict="id"), "รวมข้อมูลจุดเดิม")
+
+
+def count_submitted(counts, results, created_ids):
+    """
+    Tally submit_catch_reports results; created_ids collects the spots this import created.
+    """
+    for result in results:
+        spot_id = result["spot"]["id"]
+        if result["merged"]:
+            counts["merged"] += 1
+            counts["merged_into_existing"] += spot_id not in created_ids
+        else:
+            counts["inserted"] += 1
+            created_ids.add(spot_id)
+
+
+def merge_locally(matcher, spots, counts, dry_run):
+    """
+    Match and merge one chunk in memory, then write it with flush() (legacy path and dry runs).
+    """
+    inserts, updates = {}, {}
+    for spot in spots:
+        key = matcher.find(spot["name"], spot["lat"], spot["lon"])
+        if key is None:
+            key = ("new", len(matcher.spots))
+            row = core.new_spot_row(spot["name"], spot["lat"], spot["lon"], spot["fish_type"],
+                                    spot["description"], spot["images"])
+            matcher.add(key, row)
+            inserts[key] = row
+            counts["inserted"] += 1
+            continue
+
+        row = matcher.spots[key]
+        merged = core.merge_spot_fields(row, spot["fish_type"], spot["description"], spot["images"])
+        changed = any(row.get(column) != value for column, value in merged.items())
+        row.update(merged)
+        counts["merged"] += 1
+        counts["merged_into_existing"] += key[0] == "id"
+        # จุดที่เพิ่งสร้างใน chunk นี้ยังรอ insert อยู่ (ค่าที่รวมแล้วจะถูกส่งไปพร้อมกัน)
+        if not changed or key in inserts:
+            continue
+        if row.get("id") is not None:
+            updates[key] = row
+        elif not dry_run:
+            # insert ก่อนหน้าไม่คืน id (เช่นติด RLS) จึงอัปเดตแถวนั้นต่อไม่ได้
+            counts["unsaved_merges"] += 1
+
+    if not dry_run:
+        flush(inserts, updates)
+
+
+def import_spots(path, chunk_size=500, dry_run=False, rejects=None):
+    """
+    Import one file; returns the counts (rows, inserted, merged, merged_into_existing, rejected).
+    """
+    if core.db_client() is None:
+        raise RuntimeError(f"เชื่อมต่อ Supabase ไม่สำเร็จ: {core.get_supabase_clients()['error']}")
+
+    started = time.perf_counter()
+    counts = Counter()
+    created_ids = set()
+    # ใช้ตอน dry-run หรือฐานข้อมูลยังไม่มี submit_catch_reports เท่านั้น (โหลดจุดที่มีอยู่ตอนต้องใช้ครั้งแรก)
+    matcher = None
+    submit = not dry_run
+    for chunk in chunked(read_rows(path), chunk_size):
+        spots = []
+        for line_no, raw in chunk:
+            counts["rows"] += 1
+            spot, reason = parse_row(raw)
+            if reason:
+                counts["rejected"] += 1
+                if rejects is not None:
+                    rejects.writerow([line_no, reason, json.dumps(raw, ensure_ascii=False, default=str)])
+                continue
+            spots.append(spot)
+
+        if submit and spots:
+            results = core.submit_catch_reports([
+                core.catch_report_params(spot["name"], spot["fish_type"], spot["description"], spot["images"],
+                                         spot["lat"], spot["lon"])
+                for spot in spots
+            ])
+            if results is None:
+                submit = False
+                print("ฐานข้อมูลยังไม่มี submit_catch_reports (ยังไม่ได้รัน migration) จะนำเข้าด้วยวิธีเดิม", file=sys.stderr)
+            else:
+                count_submitted(counts, results, created_ids)
+        if not submit and spots:
+            if matcher is None:
+                matcher = SpotMatcher()
+                existing = load_existing(matcher, core.EXPORT_CHUNK)
+                print(f"โหลดจุดที่มีอยู่แล้ว {existing} จุด", file=sys.stderr)
+            merge_locally(matcher, spots, counts, dry_run)
+        print(f"{counts['rows']} แถว: เพิ่ม {counts['inserted']} รวม {counts['merged']} ปฏิเสธ {counts['rejected']}",
+              file=sys.stderr)
+
+    if not dry_run and (counts["inserted"] or counts["merged"]):
+        # ล้าง snapshot ใน cache ถาวร ให้แอปที่เริ่มใหม่โหลดข้อมูลชุดใหม่
+        core.invalidate_cache("spots")
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-import fishing spots from CSV or GeoJSON.")
+    parser.add_argument("path", help=".csv, .geojson, or newline-delimited GeoJSON (.geojsonl/.ndjson)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per batched write")
+    parser.add_argument("--dry-run", action="store_true", help="match and count only, write nothing")
+    parser.add_argument("--rejects", help="write rejected rows (line, reason, data) to this CSV")
+    args = parser.parse_args(argv)
+
+    rejects_file = open(args.rejects, "w", encoding="utf-8", newline="") if args.rejects else None
+    try:
+        rejects = csv.writer(rejects_file) if rejects_file else None
+        if rejects:
+            rejects.writerow(["line", "reason", "data"])
+        counts = import_spots(args.path, args.chunk_size, args.dry_run, rejects)
+    except Exception as e:
+        print(f"❌ นำเข้าไม่สำเร็จ: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    print(json.dumps({
+        "inserted": counts["inserted"], "merged": counts["merged"],
+        "merged_into_existing": counts["merged_into_existing"], "rejected": counts["rejected"],
+        "unsaved_merges": counts["unsaved_merges"], "rows": counts["rows"],
+        "dry_run": args.dry_run, "seconds": counts["seconds"],
+    }, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+-- รายงานการตกปลาแบบ append-only + ฟังก์ชันรวมรายงานเข้าจุดตกปลาในคำขอเดียว (atomic)
+-- ใช้ผ่าน `supabase db push` หรือวางใน SQL Editor ของ Supabase
+-- ถ้าเปิด RLS ไว้: catch_reports ต้องมี policy insert/select แบบเดียวกับ spots
+-- (ฟังก์ชันทำงานด้วยสิทธิ์ของผู้เรียก เหมือนการ insert/update ตรงๆ แบบเดิม)
+
+create table if not exists public.catch_reports (
+    id bigint generated by default as identity primary key,
+    spot_id bigint not null references public.spots (id) on delete cascade,
+    fish_type text[] not null default '{}',
+    description text,
+    image_urls text[] not null default '{}',
+    lat double precision,
+    lon double precision,
+    reported_at timestamptz not null default now()
+);
+create index if not exists catch_reports_spot_reported on public.catch_reports (spot_id, reported_at desc);
+-- id ที่แอปสร้างให้แต่ละรายงาน: ส่งซ้ำ (retry หลัง timeout ทั้งที่ commit ไปแล้ว) ไม่ถูกนับซ้ำ
+alter table public.catch_reports add column if not exists report_id uuid;
+alter table public.catch_reports add column if not exists created_spot boolean not null default false;
+create unique index if not exists catch_reports_report_id on public.catch_reports (report_id);
+
+-- สรุปต่อจุด อัปเดตทีละรายงาน (ไม่ต้องนับใหม่ทั้งตาราง)
+alter table public.spots add column if not exists report_count integer not null default 0;
+alter table public.spots add column if not exists last_report_at timestamptz;
+-- แอปดึงเฉพาะแถวที่เปลี่ยนตามคอลัมน์นี้ (delta sync) จึงเห็นการรวมข้อมูลด้วย ไม่ใช่แค่แถวใหม่
+alter table public.spots add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.touch_updated_at() returns trigger
+language plpgsql as $$
+begin
+    new.updated_at := now();
+    return new;
+end $$;
+
+drop trigger if exists spots_touch_updated_at on public.spots;
+create trigger spots_touch_updated_at before update on public.spots
+    for each row execute function public.touch_updated_at();
+
+-- ค้นหาจุดเดิมตามชื่อ / ตามกรอบพิกัด
+create index if not exists spots_name on public.spots (name);
+create index if not exists spots_lat_lon on public.spots (lat, lon);
+
+-- ล็อกที่รายงานหนึ่งครั้งต้องถือ: ชื่อจุด และช่องตาราง (กว้างเท่ารัศมี) ทุกช่องที่ครอบวงรัศมีรอบพิกัด
+-- สองรายงานที่ห่างกันไม่เกินรัศมีจะมีช่องร่วมกันอย่างน้อยหนึ่งช่อง (ช่องของอีกฝั่ง) จึงไม่สร้างจุดซ้ำกันพร้อมกัน
+-- ส่วนรายงานที่อยู่ไกลกันและคนละชื่อไม่ต้องรอกัน
+create or replace function public.catch_report_locks(
+    p_name text,
+    p_lat double precision,
+    p_lon double precision,
+    p_radius_m double precision
+) returns table (lock_class integer, lock_key integer)
+language sql immutable as $$
+    select hashtext('submit_catch_report:name'), hashtext(p_name)
+    union
+    select hashtext('submit_catch_report:cell'), hashtext(i || ':' || j)
+    from (
+        select p_radius_m / 111320.0 as cell,
+               p_radius_m / 111320.0 as dlat,
+               p_radius_m / (111320.0 * greatest(cos(radians(p_lat)), 0.01)) as dlon
+    ) d,
+    generate_series(floor((p_lat - d.dlat) / d.cell)::bigint, floor((p_lat + d.dlat) / d.cell)::bigint) as i,
+    generate_series(floor((p_lon - d.dlon) / d.cell)::bigint, floor((p_lon + d.dlon) / d.cell)::bigint) as j
+$$;
+
+-- รับรายงานหนึ่งครั้ง: หาจุดเดิม (ชื่อตรงกัน ไม่งั้นจุดที่ใกล้ที่สุดในรัศมี) หรือสร้างจุดใหม่,
+-- รวมชื่อปลา/รูปเข้าจุดนั้น, เพิ่มตัวนับ แล้วเก็บรายงานลง catch_reports ทั้งหมดใน transaction เดียว
+-- คืนค่า {"spot": แถวของจุดหลังรวม, "merged": true ถ้าเป็นจุดเดิม, "distance_m": ระยะถ้าจับคู่ด้วยพิกัด}
+-- p_report_id ที่เคยบันทึกแล้ว: ไม่รวมซ้ำ คืนจุดของรายงานนั้นพร้อม "duplicate": true
+-- ชื่อปลา: เก็บตามที่ส่งมา (ตัดช่องว่างหัวท้าย ไม่ซ้ำ เรียงตาม code point) เหมือน merge_spot_fields ในแอป
+-- ไม่แปลงเป็นชื่อมาตรฐาน (ชื่อมาตรฐานใช้ตอนแอปสร้างดัชนี/สถิติ) สองทางจึงได้ค่าเดียวกัน
+drop function if exists public.submit_catch_report(text, double precision, double precision, text[], text, text[], double precision);
+create or replace function public.submit_catch_report(
+    p_name text,
+    p_lat double precision,
+    p_lon double precision,
+    p_fish text[] default '{}',
+    p_description text default null,
+    p_image_urls text[] default '{}',
+    p_radius_m double precision default 100,
+    p_report_id uuid default null
+) returns jsonb
+language plpgsql as $$
+declare
+    v_spot public.spots;
+    v_id bigint;
+    v_distance double precision;
+    v_merged boolean := true;
+    v_dlat double precision := p_radius_m / 111320.0;
+    v_dlon double precision := p_radius_m / (111320.0 * greatest(cos(radians(p_lat)), 0.01));
+    v_lock record;
+begin
+    -- กันสองคำขอสร้างจุดใหม่ซ้ำที่เดียวกันพร้อมกัน (ปลดล็อกเองเมื่อจบ transaction)
+    -- ล็อกตามลำดับ (lock_class, lock_key) เสมอ ทุกคำขอจึงไม่ deadlock กัน
+    for v_lock in select * from public.catch_report_locks(p_name, p_lat, p_lon, p_radius_m) order by 1, 2 loop
+        perform pg_advisory_xact_lock(v_lock.lock_class, v_lock.lock_key);
+    end loop;
+
+    -- ส่งซ้ำด้วย report_id เดิม (ถือล็อกเดียวกันอยู่ จึงไม่มีคำขอซ้ำที่ทำงานพร้อมกัน)
+    if p_report_id is not null then
+        select r.spot_id, not r.created_spot into v_id, v_merged
+        from public.catch_reports r where r.report_id = p_report_id;
+        if v_id is not null then
+            select * into v_spot from public.spots where id = v_id;
+            return jsonb_build_object('spot', to_jsonb(v_spot), 'merged', v_merged, 'distance_m', null, 'duplicate', true);
+        end if;
+        v_merged := true;
+    end if;
+
+    select id into v_id from public.spots where name = p_name order by id limit 1;
+    if v_id is null then
+        select c.id, c.distance into v_id, v_distance
+        from (
+            select s.id,
+                   2 * 6371000 * asin(sqrt(
+                       power(sin(radians(s.lat - p_lat) / 2), 2)
+                       + cos(radians(p_lat)) * cos(radians(s.lat)) * power(sin(radians(s.lon - p_lon) / 2), 2)
+                   )) as distance
+            from public.spots s
+            where s.lat between p_lat - v_dlat and p_lat + v_dlat
+              and s.lon between p_lon - v_dlon and p_lon + v_dlon
+        ) c
+        where c.distance <= p_radius_m
+        order by c.distance, c.id
+        limit 1;
+    end if;
+
+    if v_id is null then
+        insert into public.spots (name, lat, lon, fish_type, description, image_url)
+        values (p_name, p_lat, p_lon, '', coalesce(btrim(p_description), ''), '')
+        returning id into v_id;
+        v_merged := false;
+    end if;
+
+    -- รวมในคำสั่งเดียวจากค่าปัจจุบันของแถว (แถวถูกล็อกระหว่าง update จึงไม่มีการเขียนทับกัน)
+    -- รายละเอียดของรายงานเก็บใน catch_reports เท่านั้น แถวของจุดจึงไม่โตขึ้นเรื่อยๆ
+    update public.spots s set
+        fish_type = (
+            select coalesce(string_agg(f, ', ' order by f collate "C"), '')
+            from (
+                select distinct btrim(f) as f
+                from unnest(string_to_array(coalesce(s.fish_type, ''), ',') || p_fish) as t(f)
+                where btrim(f) <> ''
+            ) fish
+        ),
+        image_url = (
+            select coalesce(string_agg(u, ',' order by first_pos), '')
+            from (
+                select btrim(u) as u, min(pos) as first_pos
+                from unnest(string_to_array(coalesce(s.image_url, ''), ',') || p_image_urls) with ordinality as t(u, pos)
+                where btrim(u) <> ''
+                group by btrim(u)
+            ) images
+        ),
+        report_count = s.report_count + 1,
+        last_report_at = now()
+    where s.id = v_id
+    returning s.* into v_spot;
+
+    insert into public.catch_reports (spot_id, fish_type, description, image_urls, lat, lon, report_id, created_spot)
+    values (v_id, p_fish, nullif(btrim(coalesce(p_description, '')), ''), p_image_urls, p_lat, p_lon,
+            p_report_id, not v_merged);
+
+    return jsonb_build_object('spot', to_jsonb(v_spot), 'merged', v_merged, 'distance_m', v_distance);
+end $$;
+
+-- นำเข้าทีละหลายรายงาน (import_spots.py): รวมแบบเดียวกับ submit_catch_report ทีละรายงานตามลำดับ ในคำขอเดียว
+-- p_reports: [{"p_name", "p_lat", "p_lon", "p_fish": [...], "p_description", "p_image_urls": [...], "p_report_id"}, ...]
+-- คืน array ของผลลัพธ์ submit_catch_report ตามลำดับเดียวกัน
+create or replace function public.submit_catch_reports(
+    p_reports jsonb,
+    p_radius_m double precision default 100
+) returns jsonb
+language plpgsql as $$
+declare
+    v_lock record;
+    v_report jsonb;
+    v_results jsonb := '[]'::jsonb;
+begin
+    -- ล็อกถือไว้จนจบ transaction: ล็อกของทุกรายงานก่อนเริ่ม เรียงรวมทั้งชุดตามลำดับเดียวกับ submit_catch_report
+    for v_lock in
+        select distinct l.lock_class, l.lock_key
+        from jsonb_array_elements(p_reports) as r(value),
+             public.catch_report_locks(r.value->>'p_name', (r.value->>'p_lat')::double precision,
+                                       (r.value->>'p_lon')::double precision, p_radius_m) as l
+        order by 1, 2
+    loop
+        perform pg_advisory_xact_lock(v_lock.lock_class, v_lock.lock_key);
+    end loop;
+
+    for v_report in select t.value from jsonb_array_elements(p_reports) with ordinality as t(value, pos) order by t.pos loop
+        v_results := v_results || jsonb_build_array(public.submit_catch_report(
+            v_report->>'p_name',
+            (v_report->>'p_lat')::double precision,
+            (v_report->>'p_lon')::double precision,
+            array(select jsonb_array_elements_text(v_report->'p_fish')),
+            v_report->>'p_description',
+            array(select jsonb_array_elements_text(v_report->'p_image_urls')),
+            p_radius_m,
+            (v_report->>'p_report_id')::uuid
+        ));
+    end loop;
+    return v_results;
+end $$;
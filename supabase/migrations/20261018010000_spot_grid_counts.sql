@@ -0,0 +1,20 @@
+-- จำนวนจุดตกปลาต่อช่องตารางในกรอบแผนที่ (ใช้ตอนซูมออกไกลในโหมดกรอบแผนที่)
+-- นับทุกแถวในกรอบที่ฐานข้อมูล แอปจึงไม่ต้องดึงพิกัดทุกจุดมานับเอง และไม่ติดเพดานจำนวนแถวของ viewport
+-- ช่องตารางเหมือน aggregate_spots ใน fishing_core.py: round(lat / p_cell), round(lon / p_cell)
+
+create index if not exists spots_lat_lon on public.spots (lat, lon);
+
+create or replace function public.spot_grid_counts(
+    p_south double precision,
+    p_west double precision,
+    p_north double precision,
+    p_east double precision,
+    p_cell double precision
+) returns table (lat double precision, lon double precision, count bigint)
+language sql stable as $$
+    select avg(s.lat), avg(s.lon), count(*)
+    from public.spots s
+    where s.lat between p_south and p_north
+      and s.lon between p_west and p_east
+    group by round(s.lat / p_cell), round(s.lon / p_cell)
+$$;
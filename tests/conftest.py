@@ -0,0 +1,142 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from headless import import_fishing_core  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def core():
+    """
+    fishing_core imported with throwaway secrets (no persistent cache, no scheduler).
+    """
+    return import_fishing_core({
+        "SUPABASE_URL": "https://tests.supabase.co", "SUPABASE_KEY": "tests", "SUPABASE_SERVICE_KEY": "",
+        "WEATHER_API_KEY": "tests", "CACHE_BACKEND": "none", "PREFETCH_SCHEDULER": False,
+    })
+
+
+@pytest.fixture
+def shared_cache(core, tmp_path, monkeypatch):
+    """
+    A throwaway SQLite persistent cache in place of the configured backend.
+    """
+    cache = core.SQLiteCache(str(tmp_path / "shared.sqlite"), max_entries=100)
+    monkeypatch.setattr(core, "get_persistent_cache", lambda: cache)
+    return cache
+
+
+class MissingFunction(Exception):
+    code = "PGRST202"
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """
+    The part of the PostgREST query builder fishing_core uses, over a list of row dicts.
+    """
+    def __init__(self, db):
+        self.db, self.filters, self.order_col, self.n, self.write = db, [], None, None, None
+
+    def select(self, columns):
+        return self
+
+    def _filter(self, op, col, value, test):
+        self.filters.append((op, col, value, test))
+        return self
+
+    def eq(self, col, value):
+        return self._filter("eq", col, value, lambda r: r.get(col) == value)
+
+    def gt(self, col, value):
+        return self._filter("gt", col, value, lambda r: r[col] > value)
+
+    def gte(self, col, value):
+        return self._filter("gte", col, value, lambda r: r[col] >= value)
+
+    def lte(self, col, value):
+        return self._filter("lte", col, value, lambda r: r[col] <= value)
+
+    def in_(self, col, values):
+        values = list(values)
+        return self._filter("in", col, values, lambda r: r.get(col) in values)
+
+    def order(self, col, desc=False):
+        self.order_col = col
+        return self
+
+    def limit(self, n):
+        self.n = n
+        return self
+
+    def insert(self, payload):
+        self.write = ("insert", payload)
+        return self
+
+    def upsert(self, payload, on_conflict=None):
+        self.write = ("upsert", payload)
+        return self
+
+    def execute(self):
+        if self.write:
+            return FakeResponse(self.db.apply(*self.write))
+        self.db.selects.append([(op, col, value) for op, col, value, _ in self.filters])
+        rows = [dict(r) for r in self.db.rows if all(test(r) for *_, test in self.filters)]
+        if self.order_col:
+            rows.sort(key=lambda r: r[self.order_col])
+        return FakeResponse(rows[:self.n])
+
+
+class FakeDb:
+    """
+    In-memory stand-in for the Supabase client: one spots table, and RPCs
+    given as name=handler(params) (any other RPC is a missing function).
+    """
+    def __init__(self, rows=(), **rpcs):
+        self.rows, self.rpcs = [dict(r) for r in rows], rpcs
+        self.selects, self.writes = [], []
+
+    def table(self, name):
+        return FakeQuery(self)
+
+    def rpc(self, name, params):
+        if name not in self.rpcs:
+            raise MissingFunction(name)
+        return FakeRpc(self.rpcs[name], params)
+
+    def apply(self, kind, payload):
+        self.writes.append((kind, payload))
+        saved = []
+        for row in payload:
+            row = dict(row)
+            if kind == "insert" or row.get("id") is None:
+                row["id"] = max((r["id"] for r in self.rows), default=0) + 1
+            self.rows = [r for r in self.rows if r["id"] != row["id"]] + [row]
+            saved.append(row)
+        return saved
+
+
+class FakeRpc:
+    def __init__(self, handler, params):
+        self.handler, self.params = handler, params
+
+    def execute(self):
+        return FakeResponse(self.handler(self.params))
+
+
+@pytest.fixture
+def fake_db(core, monkeypatch):
+    """
+    fake_db(rows, **rpcs) installs a FakeDb as core.db_client() and returns it.
+    """
+    def install(rows=(), **rpcs):
+        db = FakeDb(rows, **rpcs)
+        monkeypatch.setattr(core, "db_client", lambda: db)
+        return db
+    return install
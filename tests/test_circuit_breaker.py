@@ -0,0 +1,65 @@
+import threading
+
+import httpx
+import pytest
+from storage3.exceptions import StorageApiError
+
+
+@pytest.fixture
+def breakers(core, monkeypatch):
+    breakers = {name: {"failures": 0, "opened_at": None, "lock": threading.Lock()} for name in core.UPSTREAMS}
+    monkeypatch.setattr(core, "get_breakers", lambda: breakers)
+    return breakers
+
+
+def flaky(failures, error=lambda: httpx.ConnectError("down")):
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error()
+        return "ok"
+    return operation, calls
+
+
+def test_retries_transient_errors(core, breakers):
+    operation, calls = flaky(2)
+    assert core.call_upstream("storage", operation, attempts=3, base_delay=0) == "ok"
+    assert len(calls) == 3
+    assert breakers["storage"]["failures"] == 0
+
+
+def test_does_not_retry_other_errors(core, breakers):
+    operation, calls = flaky(1, error=lambda: ValueError("bad input"))
+    with pytest.raises(ValueError):
+        core.call_upstream("storage", operation, attempts=3, base_delay=0)
+    assert len(calls) == 1
+    assert breakers["storage"]["failures"] == 0
+
+
+def test_opens_after_consecutive_failures(core, breakers, monkeypatch):
+    monkeypatch.setattr(core, "BREAKER_FAILURES", 2)
+    operation, calls = flaky(10)
+    with pytest.raises(httpx.ConnectError):
+        core.call_upstream("storage", operation, attempts=2, base_delay=0)
+    with pytest.raises(core.CircuitOpenError):
+        core.call_upstream("storage", operation, attempts=2, base_delay=0)
+    assert len(calls) == 2
+    # breaker ของแต่ละ upstream แยกกัน
+    assert core.call_upstream("supabase", lambda: "ok") == "ok"
+
+
+def test_half_open_after_cooldown(core, breakers, monkeypatch):
+    monkeypatch.setattr(core, "BREAKER_FAILURES", 1)
+    operation, calls = flaky(1)
+    with pytest.raises(httpx.ConnectError):
+        core.call_upstream("storage", operation, attempts=1, base_delay=0)
+    breakers["storage"]["opened_at"] -= core.BREAKER_COOLDOWN
+    assert core.call_upstream("storage", operation, attempts=1, base_delay=0) == "ok"
+    assert breakers["storage"]["opened_at"] is None
+
+
+@pytest.mark.parametrize("status, transient", [(503, True), ("429", True), (404, False), ("", False)])
+def test_storage_errors(core, status, transient):
+    assert core.is_transient_error(StorageApiError("x", "Error", status)) is transient
@@ -0,0 +1,32 @@
+import pytest
+
+
+def dam(name):
+    return {"name": name, "storage_percent": 50.0, "inflow": None, "outflow": None, "date": None}
+
+
+@pytest.fixture
+def snapshot(core):
+    names = ["เขื่อนภูมิพล", "เขื่อนลำปาว", "เขื่อนแม่งัดสมบูรณ์ชล", "อ่างเก็บน้ำลำ"]
+    return {"index": {core.normalize_dam_name(n): dam(n) for n in names}, "lookups": {}}
+
+
+def test_exact_name_after_prefix(core, snapshot):
+    assert core.find_dam("เขื่อน ภูมิพล", snapshot)["name"] == "เขื่อนภูมิพล"
+
+
+def test_dam_name_inside_spot_name(core, snapshot):
+    assert core.find_dam("ภูมิพล ท้ายเขื่อน", snapshot)["name"] == "เขื่อนภูมิพล"
+
+
+def test_spot_name_inside_dam_name(core, snapshot):
+    assert core.find_dam("แม่งัด", snapshot)["name"] == "เขื่อนแม่งัดสมบูรณ์ชล"
+
+
+def test_short_dam_key_does_not_match_longer_spot_names(core, snapshot):
+    # "ลำ" อยู่ในชื่อจุดนี้ แต่จุดนี้ไม่ใช่อ่างเก็บน้ำลำ
+    assert core.find_dam("บ่อตกปลาลำไย", snapshot) is None
+
+
+def test_short_spot_name_does_not_match_by_substring(core, snapshot):
+    assert core.find_dam("แม่", snapshot) is None
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+ROWS = [
+    {"id": 1, "name": "เขื่อนภูมิพล", "lat": 17.24, "lon": 98.97, "fish_type": "ปลาช่อน, ปลานิล",
+     "image_url": "", "description": None, "created_at": "2026-10-01T00:00:00"},
+    {"id": 2, "name": "บึงบอระเพ็ด", "lat": 15.70, "lon": 100.25, "fish_type": "ปลากด",
+     "image_url": "a.jpg", "description": "ตกช่วงเช้า", "created_at": "2026-10-02T00:00:00"},
+]
+
+
+def encode(core, fmt, chunks):
+    out = io.BytesIO()
+    core.EXPORT_WRITERS[fmt](out, iter(chunks))
+    return out.getvalue()
+
+
+def test_csv(core):
+    data = encode(core, "CSV", [ROWS[:1], ROWS[1:]])
+    assert data.startswith("﻿".encode())
+    rows = list(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+    assert [r["name"] for r in rows] == ["เขื่อนภูมิพล", "บึงบอระเพ็ด"]
+
+
+def test_csv_empty_has_header(core):
+    assert encode(core, "CSV", []).decode("utf-8-sig").strip() == ",".join(core.EXPORT_COLUMNS)
+
+
+def test_jsonl(core):
+    lines = encode(core, "JSON Lines", [ROWS]).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2]
+
+
+def test_geojson(core):
+    collection = json.loads(encode(core, "GeoJSON", [ROWS[:1], ROWS[1:]]))
+    assert [f["geometry"]["coordinates"] for f in collection["features"]] == [[98.97, 17.24], [100.25, 15.70]]
+    assert "lat" not in collection["features"][0]["properties"]
+    assert json.loads(encode(core, "GeoJSON", [])) == {"type": "FeatureCollection", "features": []}
+
+
+def test_parquet_column_null_in_first_chunk(core):
+    # description ว่างทั้งชุดแรก แต่มีค่าในชุดที่สอง
+    table = pq.read_table(io.BytesIO(encode(core, "Parquet", [ROWS[:1], ROWS[1:]])))
+    assert table.column("description").to_pylist() == [None, "ตกช่วงเช้า"]
+    assert str(table.schema.field("id").type) == "int64"
+    assert str(table.schema.field("lat").type) == "double"
+
+
+def test_parquet_empty_is_readable(core):
+    table = pq.read_table(io.BytesIO(encode(core, "Parquet", [])))
+    assert table.num_rows == 0
+    assert table.column_names == core.EXPORT_COLUMNS
+
+
+@pytest.fixture
+def db(fake_db):
+    return fake_db(ROWS)
+
+
+def test_export_only_given_ids(core, db, monkeypatch):
+    monkeypatch.setattr(core, "EXPORT_ID_BATCH", 1)
+    lines = core.export_spots("JSON Lines", ids=[2, 1, 2]).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2]
+    assert [value for filters in db.selects for op, _, value in filters if op == "in"] == [[1], [2]]
+
+
+def test_export_size_cap(core, db):
+    with pytest.raises(core.ExportTooLarge):
+        core.export_spots("JSON Lines", ids=[1, 2], max_mb=0)
@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("ช่อน", "ปลาช่อน"),
+    ("ปลา ช่อน", "ปลาช่อน"),
+    ("ปลานิลแดง", "ปลาทับทิม"),
+    ("กะพง", "ปลากะพงขาว"),
+    ("Tilapia", "ปลานิล"),
+    ("กุ้ง", "กุ้ง"),
+    ("กุ้งก้ามกราม", "กุ้งก้ามกราม"),
+    ("หอยขม", "หอยขม"),
+    ("ปูนา", "ปูนา"),
+    ("ปลากุ้ง", "กุ้ง"),
+    ("  ", None),
+    (None, None),
+])
+def test_canonical_fish(core, raw, expected):
+    assert core.canonical_fish(raw) == expected
+
+
+def test_split_fish_keeps_order_and_duplicates(core):
+    assert core.split_fish("ช่อน, กุ้ง,, ปลาช่อน") == ["ปลาช่อน", "กุ้ง", "ปลาช่อน"]
+
+
+def test_split_fish_missing_values(core):
+    assert core.split_fish(None) == []
+    assert core.split_fish(float("nan")) == []
+
+
+def test_fish_entries_keep_the_text_as_entered(core):
+    assert core.fish_entries(" ไม่ระบุ ,, ช่อน") == ["ไม่ระบุ", "ช่อน"]
+    assert core.new_spot_row("บึง", 15.0, 100.0, "นิล, ไม่รู้, นิล", "", [])["fish_type"] == "นิล, ไม่รู้"
@@ -0,0 +1,132 @@
+import re
+
+import httpx
+import pytest
+
+
+@pytest.fixture(scope="module")
+def importer(core):
+    import import_spots
+    return import_spots
+
+
+@pytest.fixture
+def matcher(importer):
+    matcher = importer.SpotMatcher(radius_m=100)
+    matcher.add(("id", 1), {"name": "เขื่อนภูมิพล", "lat": 17.2400, "lon": 98.9700})
+    matcher.add(("id", 2), {"name": "บึงบอระเพ็ด", "lat": 15.7000, "lon": 100.2500})
+    return matcher
+
+
+def test_find_by_name_wins_over_distance(matcher):
+    assert matcher.find("บึงบอระเพ็ด", 17.2400, 98.9700) == ("id", 2)
+
+
+def test_find_nearest_within_radius(matcher):
+    # ห่างราว 55 ม. และอยู่คนละช่องตารางกับจุดเดิม
+    assert matcher.find("ท่าน้ำ", 17.2405, 98.9700) == ("id", 1)
+    matcher.add(("new", 1), {"name": "ท่าน้ำ", "lat": 17.2408, "lon": 98.9700})
+    assert matcher.find("ท่าเรือ", 17.2409, 98.9700) == ("new", 1)
+
+
+def test_find_nothing_outside_radius(matcher):
+    assert matcher.find("ท่าน้ำ", 17.2410, 98.9700) is None
+
+
+def test_merge_unions_fish_and_images(core):
+    row = {"fish_type": "ปลาช่อน, ปลานิล", "image_url": "a.jpg,b.jpg", "description": ""}
+    merged = core.merge_spot_fields(row, " ปลานิล , ไม่ระบุ", "", ["b.jpg", "c.jpg"])
+    # เก็บชื่อตามที่พิมพ์ (ไม่เติม "ปลา") ชื่อมาตรฐานใช้เฉพาะดัชนี/สถิติ
+    assert merged["fish_type"] == "ปลาช่อน, ปลานิล, ไม่ระบุ"
+    assert merged["image_url"] == "a.jpg,b.jpg,c.jpg"
+    assert merged["description"] == ""
+
+
+def test_merge_appends_new_descriptions_once(core):
+    row = {"fish_type": None, "image_url": None, "description": "น้ำลึก"}
+    merged = core.merge_spot_fields(row, "", " ตกช่วงเช้า ", [])
+    assert re.fullmatch(r"น้ำลึก\n-{20}\n\[\d\d/\d\d/\d{4} \d\d:\d\d\] ตกช่วงเช้า", merged["description"])
+    assert core.merge_spot_fields({**row, "description": merged["description"]}, "", "ตกช่วงเช้า", [])["description"] \
+        == merged["description"]
+
+
+EXISTING = [{"id": 1, "name": "เขื่อนภูมิพล", "lat": 17.24, "lon": 98.97,
+             "fish_type": "ปลาช่อน", "image_url": "", "description": ""}]
+
+
+def batch_rpc(batches):
+    """
+    submit_catch_reports stand-in: matches by name only, records each call in batches.
+    """
+    spot_ids = {"เขื่อนภูมิพล": 1}
+
+    def submit(params):
+        batches.append(params)
+        results = []
+        for report in params["p_reports"]:
+            merged = report["p_name"] in spot_ids
+            spot_id = spot_ids.setdefault(report["p_name"], 100 + len(spot_ids))
+            results.append({"spot": {"id": spot_id}, "merged": merged, "distance_m": None})
+        return results
+    return submit
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "spots.csv"
+    path.write_text(
+        "name,lat,lon,fish_type,description,image_url\n"
+        "เขื่อนภูมิพล,17.24,98.97,นิล,,\n"
+        "บึงใหม่,15.0,100.0,กด,ตกช่วงเช้า,a.jpg\n"
+        "บึงใหม่,15.0,100.0,ช่อน,,\n"
+        ",15.0,100.0,,,\n",
+        encoding="utf-8",
+    )
+    return str(path)
+
+
+def test_import_goes_through_batch_report_rpc(importer, fake_db, csv_file):
+    batches = []
+    db = fake_db(EXISTING, submit_catch_reports=batch_rpc(batches))
+    counts = importer.import_spots(csv_file, chunk_size=2)
+    assert [len(batch["p_reports"]) for batch in batches] == [2, 1]
+    report_ids = {report.pop("p_report_id") for batch in batches for report in batch["p_reports"]}
+    assert len(report_ids) == 3
+    assert batches[0]["p_reports"][1] == {
+        "p_name": "บึงใหม่", "p_lat": 15.0, "p_lon": 100.0, "p_fish": ["กด"],
+        "p_description": "ตกช่วงเช้า", "p_image_urls": ["a.jpg"],
+    }
+    assert db.writes == []
+    assert (counts["inserted"], counts["merged"], counts["merged_into_existing"], counts["rejected"]) == (1, 2, 1, 1)
+
+
+def test_import_falls_back_without_batch_rpc(importer, fake_db, csv_file):
+    db = fake_db(EXISTING)
+    counts = importer.import_spots(csv_file, chunk_size=2)
+    assert [kind for kind, _ in db.writes] == ["insert", "upsert", "upsert"]
+    assert (counts["inserted"], counts["merged"], counts["merged_into_existing"], counts["rejected"]) == (1, 2, 1, 1)
+
+
+def test_dry_run_writes_nothing(importer, fake_db, csv_file):
+    batches = []
+    db = fake_db(EXISTING, submit_catch_reports=batch_rpc(batches))
+    counts = importer.import_spots(csv_file, chunk_size=2, dry_run=True)
+    assert batches == [] and db.writes == []
+    assert (counts["inserted"], counts["merged"]) == (1, 2)
+
+
+def test_retried_report_keeps_its_report_id(core, fake_db, monkeypatch):
+    sent = []
+
+    def times_out_once(params):
+        sent.append(params)
+        if len(sent) == 1:
+            # คำขอแรก commit แล้วแต่คำตอบหาย
+            raise httpx.ReadTimeout("timed out")
+        return {"spot": {"id": 1}, "merged": True, "distance_m": None, "duplicate": True}
+
+    fake_db(submit_catch_report=times_out_once)
+    monkeypatch.setattr(core, "RETRY_BASE_DELAY", 0)
+    result = core.submit_catch_report("เขื่อนภูมิพล", "ช่อน", "", [], 17.24, 98.97)
+    assert result["duplicate"]
+    assert len(sent) == 2 and sent[0]["p_report_id"] == sent[1]["p_report_id"]
@@ -0,0 +1,79 @@
+import threading
+
+
+def test_sqlite_peek_keeps_lru_order(core, tmp_path):
+    cache = core.SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("old", 1)
+    cache.set("new", 2)
+    assert cache.peek("old") is not None
+    assert cache.peek("missing") is None
+    # peek ไม่นับเป็นการใช้งาน "old" จึงยังเป็นตัวที่ถูกไล่ออกก่อน
+    cache.set("third", 3)
+    assert cache.get("old") == (None, None)
+    assert cache.get("new")[0] == 2
+
+
+def test_sqlite_get_refreshes_lru_order(core, tmp_path):
+    cache = core.SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("old", 1)
+    cache.set("new", 2)
+    cache.get("old")
+    cache.set("third", 3)
+    assert cache.get("old")[0] == 1
+    assert cache.get("new") == (None, None)
+
+
+def counting(value, name="func"):
+    calls = []
+
+    def func(*args):
+        calls.append(args)
+        return value
+    func.__qualname__ = f"counting.{name}"
+    return func, calls
+
+
+def test_fresh_entry_is_served_without_recomputing(core, shared_cache):
+    shared_cache.set("weather:k", "เก่า")
+    func, calls = counting("ใหม่")
+    assert core.persistent_call("weather:k", func, (), {}, ttl=60, stale_ttl=60, on_refreshed=lambda: None) == "เก่า"
+    assert calls == []
+
+
+def test_stale_entry_is_served_while_refreshing_in_background(core, shared_cache):
+    shared_cache.set("weather:k", "เก่า")
+    shared_cache.conn.execute("UPDATE entries SET stored_at = stored_at - 90")
+    refreshed = threading.Event()
+    func, calls = counting("ใหม่")
+    value = core.persistent_call("weather:k", func, (), {}, ttl=60, stale_ttl=60, on_refreshed=refreshed.set)
+    assert value == "เก่า"
+    assert refreshed.wait(5)
+    assert shared_cache.get("weather:k")[0] == "ใหม่"
+
+    # เก่ากว่า ttl + stale_ttl: คำนวณใหม่ทันที
+    shared_cache.conn.execute("UPDATE entries SET stored_at = stored_at - 500")
+    assert core.persistent_call("weather:k", lambda: "ล่าสุด", (), {}, 60, 60, lambda: None) == "ล่าสุด"
+
+
+def test_invalidate_clears_one_namespace(core, shared_cache):
+    weather_func, weather_calls = counting("แดดจัด", "weather")
+    water_func, water_calls = counting("น้ำ 50%", "water")
+    weather = core.namespaced_cache("weather", persist_ttl=60)(weather_func)
+    water = core.namespaced_cache("water", persist_ttl=60)(water_func)
+    for _ in range(2):
+        weather(1)
+        water(1)
+    assert (len(weather_calls), len(water_calls)) == (1, 1)
+
+    core.invalidate_cache("weather")
+    weather(1)
+    water(1)
+    assert (len(weather_calls), len(water_calls)) == (2, 1)
+    water.clear()
+
+
+def test_sqlite_evicts_least_recently_used_at_capacity(core, tmp_path):
+    cache = core.SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    for i in range(5):
+        cache.set(f"k{i}", i)
+    assert [cache.get(f"k{i}")[0] for i in range(5)] == [None, None, 2, 3, 4]
@@ -0,0 +1,36 @@
+import threading
+
+import pandas as pd
+
+
+def test_slow_lookups_are_shared_across_reruns(core, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def slow_weather(lat, lon):
+        calls.append((lat, lon))
+        release.wait(5)
+        return "แดดจัด", "-"
+
+    monkeypatch.setattr(core, "get_cell_weather", slow_weather)
+    monkeypatch.setattr(core, "get_dam_snapshot", lambda: release.wait(5))
+    monkeypatch.setattr(core, "get_water_info", lambda name: "น้ำ 50%")
+    core.get_prefetch_pool.clear()
+    df = pd.DataFrame({"name": ["เขื่อนภูมิพล"], "lat": [17.24], "lon": [98.97]})
+    try:
+        # rerun ระหว่างที่ upstream ยังไม่ตอบ: ไม่ส่งงานซ้ำ
+        for _ in range(3):
+            weather, water = core.prefetch_conditions(df, deadline=0.05)
+            assert weather[(17.24, 98.97)] == core.WEATHER_PENDING
+            assert water["เขื่อนภูมิพล"] == core.WATER_PENDING
+        assert len(calls) == 1
+
+        release.set()
+        core.get_prefetch_pool()["pending"][("weather", core.weather_cell(17.24, 98.97))].result(5)
+        core.get_prefetch_pool()["pending"][("water",)].result(5)
+        weather, water = core.prefetch_conditions(df, deadline=5)
+        assert weather[(17.24, 98.97)] == ("แดดจัด", "-")
+        assert water["เขื่อนภูมิพล"] == "น้ำ 50%"
+    finally:
+        release.set()
+        core.get_prefetch_pool.clear()
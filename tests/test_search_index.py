@@ -0,0 +1,90 @@
+import time
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def store(core):
+    core.get_search_index.clear()
+    core.reset_spot_store()
+    store = core.get_spot_store()
+    yield store
+    core.get_search_index.clear()
+    core.reset_spot_store()
+
+
+@pytest.fixture
+def indexed(core, monkeypatch):
+    calls = []
+    index_spot = core._index_spot
+    monkeypatch.setattr(core, "_index_spot", lambda index, key, row: (calls.append(key), index_spot(index, key, row)))
+    return calls
+
+
+def spots(**overrides):
+    df = pd.DataFrame({
+        "id": [1, 2, 3],
+        "name": ["เขื่อนภูมิพล", "บึงบอระเพ็ด", "แม่น้ำแม่กลอง"],
+        "fish_type": ["ปลาช่อน", "ปลานิล", "ปลากด"],
+        "description": ["", "", ""],
+    })
+    for key, (col, value) in overrides.items():
+        df.loc[df["id"] == int(key[1:]), col] = value
+    return df
+
+
+def test_delta_version_reindexes_only_changed_rows(core, store, indexed):
+    df = spots()
+    core._bump_version(store)
+    index = core.refresh_search_index(df, store["version"])
+    assert sorted(indexed) == [1, 2, 3]
+
+    indexed.clear()
+    df = spots(r2=("fish_type", "ปลานิล, ปลาชะโด"))
+    core._bump_version(store, [2])
+    index = core.refresh_search_index(df, store["version"])
+
+    assert indexed == [2]
+    assert set(core.search_spots(index, "ชะโด")) == {2}
+    assert set(core.search_spots(index, "ภูมิพล")) == {1}
+
+
+def test_full_reload_compares_signatures(core, store, indexed):
+    core._bump_version(store)
+    core.refresh_search_index(spots(), store["version"])
+
+    indexed.clear()
+    df = spots(r3=("name", "แม่น้ำท่าจีน")).iloc[1:]  # แถว 1 ถูกลบ แถว 3 เปลี่ยนชื่อ
+    core._bump_version(store)
+    index = core.refresh_search_index(df, store["version"])
+
+    assert indexed == [3]
+    assert core.search_spots(index, "ภูมิพล") == {}
+    assert set(core.search_spots(index, "ท่าจีน")) == {3}
+
+
+def test_changed_since_unknown_across_a_full_reload(core, store):
+    core._bump_version(store, [1])
+    start = store["version"]
+    core._bump_version(store, [2])
+    assert core.spots_changed_since(start - 1, store["version"]) == {1, 2}
+    core._bump_version(store)
+    assert core.spots_changed_since(start, store["version"]) is None
+    assert core.spots_changed_since(None, store["version"]) is None
+
+
+def test_index_uses_the_version_loaded_with_the_frame(core, store):
+    store.update(df=spots(), synced_at=time.time(), reconciled_at=time.time())
+    core._bump_version(store)
+    df, version = core.sync_spots()
+    # อีก session บันทึกจุดใหม่ระหว่างโหลดข้อมูลกับสร้างดัชนีของ session นี้
+    core.note_spot_written({"id": 4, "name": "อ่างเก็บน้ำแม่กวง", "fish_type": "ปลากด", "description": ""})
+    index = core.refresh_search_index(df, version)
+    assert index["version"] == version
+    assert core.search_spots(index, "แม่กวง") == {}
+
+    df, version = core.sync_spots()
+    index = core.refresh_search_index(df, version)
+    assert set(core.search_spots(index, "แม่กวง")) == {4}
+    assert set(core.search_spots(index, "ภูมิพล")) == {1}
@@ -0,0 +1,65 @@
+import itertools
+
+import pandas as pd
+import pytest
+
+# เวอร์ชันข้อมูลไม่ซ้ำกันในแต่ละเทสต์ (ดัชนี/สถิติ cache ตามเวอร์ชัน)
+_versions = itertools.count(10_000)
+
+
+@pytest.fixture
+def spots():
+    return pd.DataFrame({
+        "id": [1, 2, 3, 4],
+        "name": ["เขื่อนภูมิพล", "เขื่อนรัชชประภา", "เขื่อนอุบลรัตน์", "บึงบอระเพ็ด"],
+        "lat": [17.24, 8.97, 16.77, 15.70],
+        "lon": [98.97, 98.80, 102.62, 100.25],
+        "fish_type": ["ช่อน, นิล", "ปลาช่อน", "tilapia", None],
+        "image_url": ["a.jpg,b.jpg", "", " c.jpg ", None],
+    })
+
+
+def stats_for(core, df):
+    version = next(_versions)
+    species_index = core.build_species_index(version, df)
+    return species_index, core.compute_spot_stats(version, df, species_index)
+
+
+def test_species_index_counts_canonical_names(core, spots):
+    species_index, _ = stats_for(core, spots)
+    assert species_index["counts"].to_dict() == {"ปลาช่อน": 2, "ปลานิล": 2}
+    assert species_index["by_species"]["ปลานิล"] == {0, 2}
+
+
+def test_totals_and_images(core, spots):
+    _, stats = stats_for(core, spots)
+    assert stats["total_spots"] == 4
+    assert stats["species"] == 2
+    assert stats["total_images"] == 3
+    assert stats["spots_with_images"] == 2
+    assert stats["bbox"] == (8.97, 17.24, 98.8, 102.62)
+
+
+def test_regions_and_species_by_region(core, spots):
+    _, stats = stats_for(core, spots)
+    assert stats["regions"].to_dict() == {"ภาคเหนือ": 1, "ภาคใต้": 1, "ภาคตะวันออกเฉียงเหนือ": 1, "ภาคกลาง": 1}
+    by_region = stats["species_by_region"]
+    assert by_region.loc["ปลาช่อน"].to_dict() == {"ภาคเหนือ": 1, "ภาคใต้": 1, "ภาคตะวันออกเฉียงเหนือ": 0}
+    assert by_region.loc["ปลานิล"].to_dict() == {"ภาคเหนือ": 1, "ภาคใต้": 0, "ภาคตะวันออกเฉียงเหนือ": 1}
+
+
+def test_empty_table(core):
+    df = pd.DataFrame(columns=core.SPOT_COLUMNS)
+    species_index, stats = stats_for(core, df)
+    assert species_index["counts"].empty
+    assert (stats["total_spots"], stats["total_images"], stats["bbox"]) == (0, 0, None)
+
+
+def test_popup_stats_come_from_the_given_index(core, spots):
+    species_index, _ = stats_for(core, spots)
+    fish_string = spots["fish_type"].iloc[0]
+    species_index["fish_stats"][fish_string] = "จากดัชนี"
+    assert core.spot_fish_stats(fish_string, species_index) == "จากดัชนี"
+    # ไม่ส่งดัชนีหรือไม่อยู่ในดัชนี: นับจากข้อความเอง
+    assert core.spot_fish_stats(fish_string) == core.get_spot_fish_stats(fish_string)
+    assert core.spot_fish_stats("ปลากด", species_index) == core.get_spot_fish_stats("ปลากด")
@@ -0,0 +1,60 @@
+import json
+import time
+
+import pytest
+
+
+def loads(db):
+    """
+    (full loads, delta loads) the spot store made.
+    """
+    full = sum(1 for filters in db.selects if not any(op == "gt" for op, *_ in filters))
+    return full, len(db.selects) - full
+
+
+@pytest.fixture
+def sync(core, fake_db):
+    def start(watermark_col):
+        row = {"id": 1, "name": "เขื่อนภูมิพล", "lat": 17.24, "lon": 98.97, "fish_type": "ปลาช่อน",
+               "description": "", "image_url": "", watermark_col: "2026-10-01T00:00:00"}
+        db = fake_db([row])
+        core.reset_spot_store()
+        core.sync_spots()
+        return db, core.get_spot_store()
+    yield start
+    core.reset_spot_store()
+
+
+def test_created_at_watermark_reconciles_on_the_fallback_interval(core, sync):
+    db, store = sync("created_at")
+    store["reconciled_at"] = store["synced_at"] = time.time() - core.SPOTS_FALLBACK_TTL - 1
+    core.sync_spots()
+    assert loads(db) == (2, 0)
+
+
+def test_updated_at_watermark_syncs_deltas_until_reconcile(core, sync):
+    db, store = sync("updated_at")
+    db.rows[0].update(fish_type="ปลาช่อน, ปลานิล", updated_at="2026-10-02T00:00:00")
+    store["reconciled_at"] = store["synced_at"] = time.time() - core.SPOTS_FALLBACK_TTL - 1
+    df, _ = core.sync_spots()
+    assert loads(db) == (1, 1)
+    assert df.loc[df["id"] == 1, "fish_type"].item() == "ปลาช่อน, ปลานิล"
+
+
+def test_snapshot_and_delta_persist_as_json(core, sync, shared_cache):
+    db, store = sync("updated_at")
+    db.rows[0].update(fish_type="ปลาช่อน, ปลานิล", updated_at="2026-10-02T00:00:00")
+    store["synced_at"] = 0.0
+    core.sync_spots()
+
+    snapshot, _ = shared_cache.get_raw(core.SPOTS_SNAPSHOT_KEY)
+    delta, _ = shared_cache.get_raw(core.SPOTS_DELTA_KEY)
+    assert [row["fish_type"] for row in json.loads(snapshot)["rows"]] == ["ปลาช่อน"]
+    assert [row["fish_type"] for row in json.loads(delta)["rows"]] == ["ปลาช่อน, ปลานิล"]
+
+    # worker ใหม่: เริ่มจาก snapshot + delta แล้วถามเฉพาะแถวหลัง watermark ที่กู้มา
+    core.reset_spot_store()
+    df, _ = core.sync_spots()
+    assert loads(db) == (1, 2)
+    assert df.loc[df["id"] == 1, "fish_type"].item() == "ปลาช่อน, ปลานิล"
+    assert store["watermark"] == "2026-10-02T00:00:00"
@@ -0,0 +1,17 @@
+import time
+
+
+def test_failed_probe_retires_pools_without_closing_them_in_use(core, monkeypatch):
+    monkeypatch.setattr(core, "SUPABASE_URL", "http://127.0.0.1:9")  # ไม่มีอะไรฟังอยู่: ต่อไม่ได้ทันที
+    monkeypatch.setattr(core, "SUPABASE_RETIRED_POOL_GRACE", 0.2)
+    old = core.get_http_client("supabase", "anon")
+    clients = {"db": object(), "role": "anon", "healthy": False, "checked_at": 0.0}
+
+    assert core._supabase_clients_ok(clients) is False
+    # เธรดที่ยังถือ client เก่าใช้ต่อได้ client ใหม่มาจาก pool ใหม่
+    assert not old.is_closed
+    assert core.get_http_client("supabase", "anon") is not old
+    deadline = time.time() + 5
+    while not old.is_closed and time.time() < deadline:
+        time.sleep(0.05)
+    assert old.is_closed
@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+
+def test_aggregate_counts_every_spot(core):
+    df = pd.DataFrame({"lat": [13.70, 13.71, 13.72, 18.79], "lon": [100.50, 100.51, 100.52, 98.98]})
+    cells = core.aggregate_spots(df, zoom=6)
+    assert cells["count"].sum() == 4
+    assert sorted(cells["count"]) == [1, 3]
+
+
+def test_aggregate_empty(core):
+    assert core.aggregate_spots(pd.DataFrame(columns=["lat", "lon"]), zoom=6).empty
+
+
+def test_cells_shrink_with_zoom(core):
+    assert core.grid_cell_deg(8) == pytest.approx(core.grid_cell_deg(7) / 2)
+
+
+def test_counts_fall_back_to_paging_every_row(core, fake_db):
+    n = core.EXPORT_CHUNK * 2 + 7  # มากกว่าเพดานของโหมดกรอบแผนที่ และมากกว่าหนึ่งหน้า
+    rows = [{"id": i, "lat": 13.7 + (i % 10) * 1e-4, "lon": 100.5} for i in range(n)]
+    rows.append({"id": n, "lat": 30.0, "lon": 100.5})  # นอกกรอบ
+    db = fake_db(rows)  # ไม่มีฟังก์ชัน spot_grid_counts: นับจากทุกแถวแทน
+    core.load_spot_counts.clear()
+
+    cells = core.load_spot_counts(13.0, 100.0, 14.0, 101.0, 6)
+
+    assert n > core.VIEWPORT_MAX_SPOTS
+    assert cells["count"].sum() == n
+    assert len(db.selects) == 3